@@ -0,0 +1,93 @@
+"""Load test: handler latency under concurrent requests.
+
+Concurrent graders rewrite large rosters through PUT /api/course_members while other
+clients send cheap requests. With roster I/O on the event loop the cheap requests wait
+for every rewrite; with the thread pool they do not.
+
+Usage: python benchmarks/bench_concurrency.py [--workers 0 4] [--students 50000]
+"""
+
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+
+from harness import USER_HEADER, Timer, start_app, summarize
+from synthetic import make_course_tree, roster_keys
+from tornado.httpclient import AsyncHTTPClient, HTTPClientError
+
+
+async def put_members(client, url, course_id, semester, i):
+    body = json.dumps(
+        {
+            "course_id": course_id,
+            "semester": semester,
+            "members": {f"extra{i % 10}": ["student"] if i % 2 == 0 else []},
+        }
+    )
+    await client.fetch(
+        f"{url}/api/course_members", method="PUT", body=body, headers={USER_HEADER: "grader0"}
+    )
+
+
+async def cheap_request(client, url):
+    try:
+        await client.fetch(f"{url}/static/missing.js")
+    except HTTPClientError:
+        pass
+
+
+async def run(url, keys, concurrency, requests):
+    client = AsyncHTTPClient(max_clients=2 * concurrency + 2)
+    write_latencies, probe_latencies = [], []
+
+    async def timed(latencies, coro):
+        start = time.perf_counter()
+        await coro
+        latencies.append(time.perf_counter() - start)
+
+    async def writer(w):
+        for i in range(requests):
+            course_id, semester = keys[(w * requests + i) % len(keys)]
+            await timed(write_latencies, put_members(client, url, course_id, semester, i))
+
+    async def prober():
+        while not done.is_set():
+            await timed(probe_latencies, cheap_request(client, url))
+            await asyncio.sleep(0.001)
+
+    done = asyncio.Event()
+    probes = [asyncio.ensure_future(prober()) for _ in range(concurrency)]
+    with Timer() as t:
+        await asyncio.gather(*[writer(w) for w in range(concurrency)])
+    done.set()
+    await asyncio.gather(*probes)
+    summarize("PUT /api/course_members", write_latencies, t.elapsed)
+    summarize("cheap request", probe_latencies, t.elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 4])
+    parser.add_argument("--courses", type=int, default=4)
+    parser.add_argument("--students", type=int, default=50_000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        make_course_tree(tmp, courses=args.courses, semesters=1, students=args.students)
+        keys = roster_keys(args.courses, 1)
+        for workers in args.workers:
+            print(f"course_manager_workers={workers}")
+
+            async def bench():
+                url = start_app(tmp, course_manager_workers=workers)
+                await run(url, keys, args.concurrency, args.requests)
+
+            asyncio.run(bench())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Benchmark: CourseManager operations on a synthetic course tree.
+
+Builds a tree of courses x semesters rosters, mixing small rosters with large ones,
+and measures index build time and memory, then the latency and throughput of
+get_courses_for_user, list_grader_courses_for_user, is_grader_for_course and
+update_course_members.
+
+Usage: python benchmarks/bench_course_manager.py [--courses 50] [--sizes 200 2000 50000]
+       [--store csv sqlite] [--json results.json] [--baseline results.json]
+"""
+
+import argparse
+import logging
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from harness import Timer, add_result_arguments, finish_results, peak_rss_mb, summarize
+from synthetic import make_course_tree, roster_keys
+
+from e2x_course_service.course_manager import CourseManager
+from e2x_course_service.roster_store import CSVRosterStore, SQLiteRosterStore, sync_stores
+
+
+def measure(name, func, args_list, results):
+    latencies = []
+    with Timer() as t:
+        for args in args_list:
+            start = time.perf_counter()
+            func(*args)
+            latencies.append(time.perf_counter() - start)
+    results[name] = summarize(name, latencies, t.elapsed)
+
+
+def make_store(kind, root):
+    if kind == "csv":
+        return None
+    store = SQLiteRosterStore(os.path.join(root, "rosters.sqlite"))
+    sync_stores(CSVRosterStore(root), store)
+    return store
+
+
+def bench(root, store_kind, args, results):
+    rng = random.Random(0)
+    keys = roster_keys(args.courses, args.semesters)
+    users = [f"student{rng.randrange(args.users or max(args.sizes)):07d}" for _ in range(1000)]
+    logger = logging.getLogger("bench")
+    store = make_store(store_kind, root)
+
+    tracemalloc.start()
+    with Timer() as t:
+        manager = CourseManager(root, logger, cache_ttl=args.cache_ttl, store=store)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    prefix = f"{store_kind} "
+    results[prefix + "build index"] = {
+        "seconds": t.elapsed,
+        "memory_mb": current / 1024 / 1024,
+        "peak_memory_mb": peak / 1024 / 1024,
+    }
+    print(
+        f"{prefix + 'build index':<28} {t.elapsed:8.2f}s "
+        f"memory={current / 1024 / 1024:8.1f}MB peak={peak / 1024 / 1024:8.1f}MB"
+    )
+
+    n = args.operations
+    measure(
+        prefix + "get_courses_for_user",
+        manager.get_courses_for_user,
+        [(users[i % len(users)],) for i in range(n)],
+        results,
+    )
+    measure(
+        prefix + "list_grader_courses",
+        manager.list_grader_courses_for_user,
+        [("grader0",)] * n,
+        results,
+    )
+    measure(
+        prefix + "is_grader_for_course",
+        manager.is_grader_for_course,
+        [("grader0", *keys[i % len(keys)]) for i in range(n)],
+        results,
+    )
+    updates = []
+    for i in range(args.updates):
+        course_id, semester = keys[rng.randrange(len(keys))]
+        # Alternately enroll and drop a handful of users
+        members = {f"extra{j}": ["student"] if i % 2 == 0 else [] for j in range(5)}
+        updates.append((course_id, semester, members))
+    measure(prefix + "update_course_members", manager.update_course_members, updates, results)
+    manager.store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--courses", type=int, default=50)
+    parser.add_argument("--semesters", type=int, default=2)
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[200, 2000, 50_000],
+        help="Student roster sizes, used in turn",
+    )
+    parser.add_argument("--users", type=int, default=0, help="Size of the student pool")
+    parser.add_argument("--store", nargs="+", default=["csv"], choices=["csv", "sqlite"])
+    parser.add_argument("--cache-ttl", type=float, default=2.0)
+    parser.add_argument("--operations", type=int, default=2000)
+    parser.add_argument("--updates", type=int, default=100)
+    add_result_arguments(parser)
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        with Timer() as t:
+            make_course_tree(
+                tmp,
+                courses=args.courses,
+                semesters=args.semesters,
+                users=args.users,
+                sizes=args.sizes,
+            )
+        print(f"Generated {args.courses * args.semesters} courses in {t.elapsed:.1f}s")
+        for store_kind in args.store:
+            bench(tmp, store_kind, args, results)
+    results["peak rss"] = {"rss_mb": peak_rss_mb()}
+    print(f"Peak RSS {results['peak rss']['rss_mb']:.1f}MB")
+    finish_results(args, results)
+
+
+if __name__ == "__main__":
+    main()
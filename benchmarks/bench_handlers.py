@@ -0,0 +1,127 @@
+"""Benchmark: end-to-end handler latency on a synthetic course tree.
+
+Starts the service with HubOAuth stubbed out and sends concurrent requests to the
+course list, the member listing (one page and complete) and member updates.
+
+Usage: python benchmarks/bench_handlers.py [--courses 20] [--sizes 200 2000 50000]
+       [--concurrency 10] [--json results.json] [--baseline results.json]
+"""
+
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+
+from harness import (
+    USER_HEADER,
+    Timer,
+    add_result_arguments,
+    finish_results,
+    peak_rss_mb,
+    start_app,
+    summarize,
+)
+from synthetic import make_course_tree, roster_keys
+from tornado.simple_httpclient import SimpleAsyncHTTPClient
+
+
+async def load(client, name, make_request, requests, concurrency, results):
+    latencies = []
+    queue = iter(range(requests))
+
+    async def worker():
+        for i in queue:
+            url, kwargs = make_request(i)
+            start = time.perf_counter()
+            await client.fetch(url, headers={USER_HEADER: "grader0"}, **kwargs)
+            latencies.append(time.perf_counter() - start)
+
+    with Timer() as t:
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+    results[name] = summarize(name, latencies, t.elapsed)
+
+
+async def run(root, args, results):
+    url = start_app(root, course_manager_workers=args.workers)
+    client = SimpleAsyncHTTPClient(force_instance=True, max_clients=args.concurrency)
+    keys = roster_keys(args.courses, args.semesters)
+
+    def members_url(i, query=""):
+        course_id, semester = keys[i % len(keys)]
+        return f"{url}/api/course_members?course_id={course_id}&semester={semester}{query}"
+
+    def update(i):
+        course_id, semester = keys[i % len(keys)]
+        body = {
+            "course_id": course_id,
+            "semester": semester,
+            "members": {f"extra{i % 10}": ["student"] if i % 2 == 0 else []},
+        }
+        return f"{url}/api/course_members", {"method": "PUT", "body": json.dumps(body)}
+
+    requests, concurrency = args.requests, args.concurrency
+    await load(
+        client,
+        "GET /api/courses",
+        lambda i: (f"{url}/api/courses", {}),
+        requests,
+        concurrency,
+        results,
+    )
+    await load(
+        client,
+        "GET /api/course_members page",
+        lambda i: (members_url(i, "&offset=0&limit=50"), {}),
+        requests,
+        concurrency,
+        results,
+    )
+    await load(
+        client,
+        "GET /api/course_members all",
+        lambda i: (members_url(i), {}),
+        min(requests, 10 * len(keys)),
+        concurrency,
+        results,
+    )
+    await load(
+        client,
+        "PUT /api/course_members",
+        update,
+        min(requests, args.updates),
+        concurrency,
+        results,
+    )
+    client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--courses", type=int, default=20)
+    parser.add_argument("--semesters", type=int, default=2)
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[200, 2000, 50_000],
+        help="Student roster sizes, used in turn",
+    )
+    parser.add_argument("--workers", type=int, default=4, help="course_manager_workers")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--updates", type=int, default=200)
+    add_result_arguments(parser)
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        make_course_tree(tmp, courses=args.courses, semesters=args.semesters, sizes=args.sizes)
+        asyncio.run(run(tmp, args, results))
+    results["peak rss"] = {"rss_mb": peak_rss_mb()}
+    print(f"Peak RSS {results['peak rss']['rss_mb']:.1f}MB")
+    finish_results(args, results)
+
+
+if __name__ == "__main__":
+    main()
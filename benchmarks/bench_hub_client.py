@@ -0,0 +1,82 @@
+"""Micro-benchmark: Hub API request throughput for different HTTP client settings.
+
+Sends GET /users/{name} requests through HubAPI to a stub Hub running in another
+process, once per client implementation and max_clients setting.
+
+Usage: python benchmarks/bench_hub_client.py [--requests 2000] [--max-clients 10 50]
+"""
+
+import argparse
+import asyncio
+import time
+
+from harness import free_port, summarize
+from stub_hub import StubHubAuth, start_stub_hub
+from tornado.httpclient import AsyncHTTPClient, HTTPClientError
+
+from e2x_course_service.hub_api import HubAPI
+
+IMPLEMENTATIONS = {
+    "simple": None,
+    "curl": "tornado.curl_httpclient.CurlAsyncHTTPClient",
+}
+
+
+async def wait_for_hub(api):
+    for _ in range(100):
+        try:
+            await api.user_exists("user0")
+            return
+        except (HTTPClientError, OSError):
+            await asyncio.sleep(0.05)
+    raise RuntimeError("Stub hub did not start")
+
+
+async def bench(port, implementation, max_clients, requests):
+    AsyncHTTPClient.configure(implementation, max_clients=max_clients)
+    client = AsyncHTTPClient(force_instance=True)
+    api = HubAPI(StubHubAuth(port), client=client, max_retries=0)
+    await wait_for_hub(api)
+    latencies = []
+    semaphore = asyncio.Semaphore(max_clients)
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            await api.user_exists(f"user{i % 1000}")
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(requests)])
+    elapsed = time.perf_counter() - start
+    client.close()
+    return latencies, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--max-clients", type=int, nargs="+", default=[10, 50])
+    args = parser.parse_args()
+
+    port = free_port()
+    hub = start_stub_hub(port)
+    try:
+        for name, implementation in IMPLEMENTATIONS.items():
+            if name == "curl":
+                try:
+                    import pycurl  # noqa: F401
+                except ImportError:
+                    print("pycurl is not installed, skipping the curl client")
+                    continue
+            for max_clients in args.max_clients:
+                latencies, elapsed = asyncio.run(
+                    bench(port, implementation, max_clients, args.requests)
+                )
+                summarize(f"{name} max_clients={max_clients}", latencies, elapsed)
+    finally:
+        hub.terminate()
+
+
+if __name__ == "__main__":
+    main()
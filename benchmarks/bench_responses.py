@@ -0,0 +1,104 @@
+"""Benchmark: size and latency of the complete member listing per encoding.
+
+Fetches GET /api/course_members for courses of each roster size without compression,
+with gzip and with brotli (if installed), in the default and the compact format. Also
+measures encoding the listing with the json module and with orjson (if installed).
+
+Usage: python benchmarks/bench_responses.py [--sizes 200 2000 50000] [--requests 20]
+       [--json results.json] [--baseline results.json]
+"""
+
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+
+from harness import USER_HEADER, Timer, add_result_arguments, finish_results, percentile, start_app
+from synthetic import make_course_tree, roster_keys
+from tornado.simple_httpclient import SimpleAsyncHTTPClient
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ENCODINGS = {"identity": "identity", "gzip": "gzip"}
+if brotli is not None:
+    ENCODINGS["br"] = "br, gzip"
+FORMATS = ["default", "compact"]
+
+
+def encode_times(data, runs):
+    encoders = {"json": lambda d: json.dumps(d, separators=(",", ":"))}
+    if orjson is not None:
+        encoders["orjson"] = orjson.dumps
+    times = {}
+    for name, encode in encoders.items():
+        latencies = []
+        for _ in range(runs):
+            with Timer() as t:
+                encode(data)
+            latencies.append(t.elapsed * 1000)
+        times[name] = percentile(latencies, 50)
+    return times
+
+
+async def run(root, args, results):
+    url = start_app(root)
+    client = SimpleAsyncHTTPClient(force_instance=True)
+    keys = roster_keys(len(args.sizes), 1)
+    for size, (course_id, semester) in zip(args.sizes, keys):
+        members_url = f"{url}/api/course_members?course_id={course_id}&semester={semester}"
+        for members_format in FORMATS:
+            for encoding, accept in ENCODINGS.items():
+                latencies = []
+                for _ in range(args.requests):
+                    start = time.perf_counter()
+                    response = await client.fetch(
+                        f"{members_url}&format={members_format}",
+                        headers={USER_HEADER: "grader0", "Accept-Encoding": accept},
+                        decompress_response=False,
+                    )
+                    latencies.append((time.perf_counter() - start) * 1000)
+                name = f"{size} members {members_format} {encoding}"
+                results[name] = {"p50_ms": percentile(latencies, 50), "bytes": len(response.body)}
+                print(
+                    f"{name:<36} p50={results[name]['p50_ms']:8.2f}ms "
+                    f"bytes={results[name]['bytes']:>10}"
+                )
+        response = await client.fetch(members_url, headers={USER_HEADER: "grader0"})
+        for encoder, p50 in encode_times(json.loads(response.body), args.requests).items():
+            name = f"{size} members encode {encoder}"
+            results[name] = {"p50_ms": p50}
+            print(f"{name:<36} p50={p50:8.2f}ms")
+    client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[200, 2000, 50_000],
+        help="Student roster sizes, one course each",
+    )
+    parser.add_argument("--requests", type=int, default=20)
+    add_result_arguments(parser)
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        make_course_tree(tmp, courses=len(args.sizes), semesters=1, sizes=args.sizes)
+        asyncio.run(run(tmp, args, results))
+    finish_results(args, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Compare the csv based roster I/O with the previous pandas implementation.
+
+Usage: python benchmarks/bench_roster_io.py [--sizes 10000 100000] [--repeat 5]
+
+pandas is only needed for the comparison and is skipped if it is not installed.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from e2x_course_service import roster_io
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+
+def write_roster(path, size):
+    with open(path, "w") as f:
+        f.write("Username\n")
+        for i in range(size):
+            f.write(f"user{i:07d}\n")
+
+
+def csv_read(path):
+    return roster_io.read_usernames(path)
+
+
+def csv_contains(path, user):
+    return any(u == user for u in roster_io.iter_usernames(path))
+
+
+def csv_add(path, users):
+    existing = set(roster_io.iter_usernames(path))
+    roster_io.append_usernames(path, [u for u in users if u not in existing])
+
+
+def csv_remove(path, users):
+    roster_io.remove_usernames(path, set(users))
+
+
+def pandas_read(path):
+    return pd.read_csv(path)["Username"].tolist()
+
+
+def pandas_contains(path, user):
+    return user in pd.read_csv(path)["Username"].values
+
+
+def pandas_add(path, users):
+    df = pd.read_csv(path)
+    existing = set(df["Username"].values)
+    new_df = pd.DataFrame([u for u in users if u not in existing], columns=["Username"])
+    pd.concat([df, new_df], ignore_index=True).to_csv(path, index=False)
+
+
+def pandas_remove(path, users):
+    df = pd.read_csv(path)
+    df[~df["Username"].isin(users)].to_csv(path, index=False)
+
+
+def import_time(module):
+    """Wall time of importing a module in a fresh interpreter, minus the interpreter start."""
+    baseline = _run_python("pass")
+    return _run_python(f"import {module}") - baseline
+
+
+def _run_python(code):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], check=True)
+    return time.perf_counter() - start
+
+
+def timeit(func, path, size, arg, repeat):
+    timings = []
+    for _ in range(repeat):
+        write_roster(path, size)
+        start = time.perf_counter()
+        if arg is None:
+            func(path)
+        else:
+            func(path, arg)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if pd is None:
+        print("pandas is not installed, only the csv implementation is measured")
+    else:
+        print(f"import pandas: {import_time('pandas') * 1000:.1f}ms")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "course-semester.csv")
+        print(f"{'operation':<10} {'rows':>8} {'csv [ms]':>10} {'pandas [ms]':>12}")
+        for size in args.sizes:
+            new_users = [f"new{i}" for i in range(100)]
+            old_users = [f"user{i:07d}" for i in range(0, size, max(size // 100, 1))]
+            cases = [
+                ("read", csv_read, pandas_read, None),
+                ("contains", csv_contains, pandas_contains, f"user{size - 1:07d}"),
+                ("add", csv_add, pandas_add, new_users),
+                ("remove", csv_remove, pandas_remove, old_users),
+            ]
+            for name, csv_func, pandas_func, arg in cases:
+                csv_time = timeit(csv_func, path, size, arg, args.repeat) * 1000
+                if pd is None:
+                    pandas_col = "-"
+                else:
+                    pandas_col = f"{timeit(pandas_func, path, size, arg, args.repeat) * 1000:.2f}"
+                print(f"{name:<10} {size:>8} {csv_time:>10.2f} {pandas_col:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Benchmark: service startup time on a synthetic course tree.
+
+Starts the service in a fresh process and measures the time until it accepts
+connections, answers GET /api/courses and renders the first page, with the roster
+index built before listening and in the background. Also measures the import time of
+e2x_course_service.app. The first run of each mode starts without roster summaries and
+compiles the templates into an empty bytecode cache, later runs reuse both.
+
+Usage: python benchmarks/bench_startup.py [--courses 50] [--sizes 200 2000 50000]
+       [--runs 5] [--json results.json] [--baseline results.json]
+"""
+
+import argparse
+import contextlib
+import logging
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+from harness import USER_HEADER, Timer, add_result_arguments, finish_results, free_port, percentile
+from synthetic import make_course_tree
+
+MODES = {"index before listen": False, "index in background": True}
+
+
+def serve(args):
+    """Run the service, used in the child process."""
+    from harness import stub_hub_auth
+
+    from e2x_course_service.app import CourseServiceApp
+
+    stub_hub_auth()
+    logging.getLogger("tornado.access").setLevel(logging.ERROR)
+    app = CourseServiceApp(
+        course_base_path=args.root,
+        port=args.serve,
+        build_index_in_background=args.background,
+        template_cache_path=args.template_cache,
+        log_level=logging.ERROR,
+    )
+    app.initialize([])
+    app.start()
+
+
+def wait_until(check, timeout=120):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            return check()
+        except (OSError, urllib.error.URLError):
+            time.sleep(0.002)
+    raise RuntimeError("Service did not start")
+
+
+def fetch(url):
+    request = urllib.request.Request(url, headers={USER_HEADER: "grader0"})
+    with urllib.request.urlopen(request) as response:
+        return response.read()
+
+
+def start_once(root, background, template_cache):
+    """Seconds from starting the process until it listens, serves the API and a page."""
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/services/course-service"
+    command = [sys.executable, __file__, "--serve", str(port), "--root", root]
+    command += ["--template-cache", template_cache] + (["--background"] if background else [])
+    start = time.perf_counter()
+    process = subprocess.Popen(command)
+    try:
+        wait_until(lambda: socket.create_connection(("127.0.0.1", port)).close())
+        listening = time.perf_counter() - start
+        fetch(f"{url}/api/courses")
+        courses = time.perf_counter() - start
+        fetch(f"{url}/")
+        page = time.perf_counter() - start
+    finally:
+        process.terminate()
+        process.wait()
+    return listening, courses, page
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--courses", type=int, default=50)
+    parser.add_argument("--semesters", type=int, default=2)
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[200, 2000, 50_000],
+        help="Student roster sizes, used in turn",
+    )
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--root", help=argparse.SUPPRESS)
+    parser.add_argument("--template-cache", default="", help=argparse.SUPPRESS)
+    parser.add_argument("--background", action="store_true", help=argparse.SUPPRESS)
+    add_result_arguments(parser)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args)
+        return
+
+    results = {}
+    imports = []
+    for _ in range(args.runs):
+        with Timer() as t:
+            subprocess.run([sys.executable, "-c", "import e2x_course_service.app"], check=True)
+        imports.append(t.elapsed * 1000)
+    results["import app"] = {"p50_ms": percentile(imports, 50)}
+    print(f"{'import app':<28} p50={results['import app']['p50_ms']:8.1f}ms")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = os.path.join(tmp, "courses")
+        make_course_tree(root, courses=args.courses, semesters=args.semesters, sizes=args.sizes)
+        for name, background in MODES.items():
+            template_cache = os.path.join(tmp, f"templates-{background}")
+            os.makedirs(template_cache)
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(root, ".roster_summaries.json"))
+            runs = [start_once(root, background, template_cache) for _ in range(args.runs)]
+            result = {}
+            for i, metric in enumerate(["listening", "courses", "page"]):
+                result[f"{metric}_p50_ms"] = percentile([r[i] * 1000 for r in runs], 50)
+            result["first_page_ms"] = runs[0][2] * 1000
+            results[name] = result
+            print(
+                f"{name:<28} listening={result['listening_p50_ms']:8.1f}ms "
+                f"courses={result['courses_p50_ms']:8.1f}ms page={result['page_p50_ms']:8.1f}ms "
+                f"(first run page={result['first_page_ms']:.1f}ms)"
+            )
+    finish_results(args, results)
+
+
+if __name__ == "__main__":
+    main()
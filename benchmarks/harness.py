@@ -0,0 +1,136 @@
+"""Run the course service in-process with HubOAuth stubbed out."""
+
+import json
+import logging
+import os
+import resource
+import socket
+import sys
+import time
+
+os.environ.setdefault("JUPYTERHUB_SERVICE_PREFIX", "/services/course-service/")
+os.environ.setdefault("JUPYTERHUB_API_TOKEN", "benchmark")
+
+from e2x_course_service.app import CourseServiceApp  # noqa: E402
+from e2x_course_service.handlers.base import BaseHandler  # noqa: E402
+
+USER_HEADER = "X-Benchmark-User"
+
+
+def _stub_current_user(self):
+    name = self.request.headers.get(USER_HEADER)
+    return {"name": name, "kind": "user"} if name else None
+
+
+def stub_hub_auth():
+    """Authenticate requests by the X-Benchmark-User header instead of the Hub."""
+    BaseHandler.get_current_user = _stub_current_user
+    BaseHandler.check_xsrf_cookie = lambda self: None
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_app(base_path: str, **config) -> str:
+    """Start the service on a free port of the current IOLoop and return its base URL."""
+    stub_hub_auth()
+    logging.getLogger("tornado.access").setLevel(logging.ERROR)
+    config.setdefault("log_level", logging.ERROR)
+    app = CourseServiceApp(course_base_path=base_path, **config)
+    app.initialize([])
+    port = free_port()
+    app.tornado_application.listen(port, address="127.0.0.1")
+    return f"http://127.0.0.1:{port}{app.service_prefix.rstrip('/')}"
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return float("nan")
+    return values[min(int(len(values) * p / 100), len(values) - 1)]
+
+
+def summarize(name, latencies, elapsed) -> dict:
+    ms = [v * 1000 for v in latencies]
+    result = {
+        "n": len(ms),
+        "p50_ms": percentile(ms, 50),
+        "p99_ms": percentile(ms, 99),
+        "max_ms": max(ms, default=float("nan")),
+        "per_s": len(ms) / elapsed if elapsed else float("nan"),
+    }
+    print(
+        f"{name:<28} n={result['n']:<6} "
+        f"p50={result['p50_ms']:8.2f}ms p99={result['p99_ms']:8.2f}ms "
+        f"max={result['max_ms']:8.2f}ms {result['per_s']:8.1f} req/s"
+    )
+    return result
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and in kilobytes on Linux
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def add_result_arguments(parser):
+    parser.add_argument("--json", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare with the results in this JSON file")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Relative slowdown or memory growth over the baseline that counts as a regression",
+    )
+
+
+def compare_results(results: dict, baseline: dict, tolerance: float) -> list:
+    """Return the regressions of ``results`` over ``baseline`` as readable strings.
+
+    Latencies and memory must not grow and throughput must not drop by more than
+    ``tolerance``. Results that are missing in either are ignored.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for metric, value in result.items():
+            old = base.get(metric)
+            if not isinstance(value, (int, float)) or not old or metric == "n":
+                continue
+            if metric == "per_s":
+                regressed = value < old * (1 - tolerance)
+            else:
+                regressed = value > old * (1 + tolerance)
+            if regressed:
+                regressions.append(f"{name} {metric}: {old:.2f} -> {value:.2f}")
+    return regressions
+
+
+def finish_results(args, results: dict):
+    """Write the results and exit with status 1 if they regressed over the baseline."""
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_results(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions")
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
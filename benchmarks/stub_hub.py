@@ -0,0 +1,140 @@
+"""A minimal stand-in for the JupyterHub REST API used by the benchmarks.
+
+Run it in a separate process with ``start_stub_hub()``; it knows the users
+``user0`` to ``user<n-1>`` and accepts user creation and group membership changes.
+"""
+
+import asyncio
+import json
+import multiprocessing
+
+from tornado import web
+from tornado.httputil import url_concat
+
+
+class HubState:
+    def __init__(self, users: int):
+        self.users = {f"user{i}" for i in range(users)}
+        self.groups = {}
+
+
+class StubHandler(web.RequestHandler):
+    def initialize(self, state: HubState):
+        self.state = state
+
+    def check_xsrf_cookie(self):
+        pass
+
+
+class UsersHandler(StubHandler):
+    def get(self):
+        names = sorted(self.state.users)
+        offset = int(self.get_argument("offset", "0"))
+        limit = int(self.get_argument("limit", "200"))
+        page = [{"name": name, "kind": "user"} for name in names[offset : offset + limit]]
+        if "pagination" not in self.request.headers.get("Accept", ""):
+            self.write(json.dumps(page))
+            return
+        next_page = None
+        if offset + limit < len(names):
+            next_page = {
+                "offset": offset + limit,
+                "limit": limit,
+                "url": url_concat(self.request.path, {"offset": offset + limit}),
+            }
+        self.write(
+            json.dumps(
+                {
+                    "items": page,
+                    "_pagination": {
+                        "offset": offset,
+                        "limit": limit,
+                        "total": len(names),
+                        "next": next_page,
+                    },
+                }
+            )
+        )
+
+    def post(self):
+        usernames = json.loads(self.request.body)["usernames"]
+        if any(name in self.state.users for name in usernames):
+            raise web.HTTPError(409)
+        self.state.users.update(usernames)
+        self.set_status(201)
+        self.write(json.dumps([{"name": name} for name in usernames]))
+
+
+class UserHandler(StubHandler):
+    def get(self, name):
+        if name not in self.state.users:
+            raise web.HTTPError(404)
+        self.write(json.dumps({"name": name, "kind": "user"}))
+
+    def post(self, name):
+        if name in self.state.users:
+            raise web.HTTPError(409)
+        self.state.users.add(name)
+        self.set_status(201)
+        self.write(json.dumps({"name": name}))
+
+
+class GroupHandler(StubHandler):
+    def get(self, name):
+        if name not in self.state.groups:
+            raise web.HTTPError(404)
+        self.write(json.dumps({"name": name, "users": sorted(self.state.groups[name])}))
+
+    def post(self, name):
+        self.state.groups.setdefault(name, set())
+        self.set_status(201)
+        self.write(json.dumps({"name": name, "users": []}))
+
+
+class GroupUsersHandler(StubHandler):
+    def post(self, name):
+        users = json.loads(self.request.body)["users"]
+        self.state.groups.setdefault(name, set()).update(users)
+        self.write(json.dumps({"name": name, "users": sorted(self.state.groups[name])}))
+
+    def delete(self, name):
+        users = json.loads(self.request.body)["users"]
+        self.state.groups.setdefault(name, set()).difference_update(users)
+        self.write(json.dumps({"name": name, "users": sorted(self.state.groups[name])}))
+
+
+def make_app(users: int = 1000) -> web.Application:
+    state = HubState(users)
+    kwargs = {"state": state}
+    return web.Application(
+        [
+            (r"/hub/api/users", UsersHandler, kwargs),
+            (r"/hub/api/users/([^/]+)", UserHandler, kwargs),
+            (r"/hub/api/groups/([^/]+)/users", GroupUsersHandler, kwargs),
+            (r"/hub/api/groups/([^/]+)", GroupHandler, kwargs),
+        ],
+        allow_nonstandard_methods=True,
+    )
+
+
+def _serve(port: int, users: int):
+    async def main():
+        make_app(users).listen(port, address="127.0.0.1")
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+def start_stub_hub(port: int, users: int = 1000) -> multiprocessing.Process:
+    process = multiprocessing.Process(target=_serve, args=(port, users), daemon=True)
+    process.start()
+    return process
+
+
+class StubHubAuth:
+    """Provides the attributes of HubOAuth that HubAPI uses."""
+
+    api_token = "benchmark"
+
+    def __init__(self, port: int):
+        self.api_url = f"http://127.0.0.1:{port}/hub/api"
@@ -0,0 +1,51 @@
+"""Generate synthetic course_base_path trees for the benchmarks."""
+
+import os
+from typing import List, Optional, Sequence
+
+
+def write_roster(path: str, usernames: List[str]):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write("Username\n")
+        for username in usernames:
+            f.write(f"{username}\n")
+
+
+def make_course_tree(
+    root: str,
+    courses: int = 10,
+    semesters: int = 2,
+    students: int = 1000,
+    graders: int = 5,
+    users: int = 0,
+    sizes: Optional[Sequence[int]] = None,
+):
+    """Create ``courses`` x ``semesters`` rosters below ``root``.
+
+    Every student roster has ``students`` members, or the sizes in ``sizes`` in turn to
+    mix small and large courses. Students are drawn from a pool of ``users`` usernames
+    (the largest roster size if 0), so the same user is enrolled in several courses.
+    Grader ``grader0`` is a grader in every course, the other graders in one course each.
+    """
+    sizes = list(sizes or [students])
+    users = users or max(sizes)
+    offset = 0
+    for c in range(courses):
+        course_id = f"course{c:04d}"
+        for s in range(semesters):
+            semester = f"sem{s:02d}"
+            size = sizes[(c * semesters + s) % len(sizes)]
+            write_roster(
+                os.path.join(root, course_id, "student", f"{course_id}-{semester}.csv"),
+                [f"student{(offset + i) % users:07d}" for i in range(size)],
+            )
+            offset += size
+            write_roster(
+                os.path.join(root, course_id, "grader", f"{course_id}-{semester}.csv"),
+                ["grader0"] + [f"grader{c * semesters + s}_{i}" for i in range(1, graders)],
+            )
+
+
+def roster_keys(courses: int = 10, semesters: int = 2):
+    return [(f"course{c:04d}", f"sem{s:02d}") for c in range(courses) for s in range(semesters)]
@@ -1,6 +1,7 @@
+import asyncio
 import os
+import signal
 
-from jinja2 import Environment, FileSystemLoader
 from jupyterhub.services.auth import (
     HubOAuth,
     HubOAuthCallbackHandler,
@@ -8,13 +9,25 @@ from jupyterhub.services.auth import (
 from jupyterhub.utils import url_path_join as ujoin
 from tornado import web
 from tornado.httpclient import AsyncHTTPClient
-from traitlets import Any, Dict, Integer, List, Unicode
+from tornado.httpserver import HTTPServer
+from tornado.ioloop import IOLoop
+from tornado.netutil import bind_sockets
+from tornado.process import fork_processes
+from traitlets import Any, Bool, CaselessStrEnum, Dict, Float, Integer, List, Unicode
 from traitlets.config import Application
 
+from . import metrics
 from ._data import DATA_FILES_PATH
-from .course_manager import CourseManager
-from .handlers import apihandlers, handlers
+from .change_log import ChangeLog
+from .course_manager import AsyncCourseManager, CourseManager
+from .handlers import apihandlers, compression, handlers
+from .handlers.metrics import MetricsHandler
+from .handlers.static import StaticHandler
 from .hub_api import HubAPI
+from .hub_group_sync import HubGroupSync
+from .roster_store import CSVRosterStore, SQLiteRosterStore
+from .templates import Templates
+from .ttl_cache import TTLCache
 
 
 class CourseServiceApp(Application):
@@ -22,13 +35,35 @@ class CourseServiceApp(Application):
         DATA_FILES_PATH, help="Path to the data files for the application"
     ).tag(config=True)
 
-    tornado_settings = Dict(help="Tornado settings for the application").tag(config=True)
+    tornado_settings = Dict(
+        help=(
+            "Tornado settings for the application, override the service's own settings. "
+            "Responses are compressed unless compress_response is set to False, with brotli "
+            "if the brotli package is installed and the client accepts it, else with gzip"
+        )
+    ).tag(config=True)
 
     template_path = Unicode(
         os.path.join(DATA_FILES_PATH, "templates"),
         help="Path to the Jinja2 templates for the application",
     )
 
+    template_cache_path = Unicode(
+        "",
+        help=(
+            "Directory for the compiled Jinja2 templates, kept across restarts. Defaults to "
+            "a private directory in the system temp directory"
+        ),
+    ).tag(config=True)
+
+    build_index_in_background = Bool(
+        False,
+        help=(
+            "Start listening before the roster index is built and build it in the background. "
+            "Requests that need the index wait until it is ready."
+        ),
+    ).tag(config=True)
+
     static_path = Unicode(
         os.path.join(DATA_FILES_PATH, "static"),
         help="Path to the static files for the application",
@@ -51,42 +86,345 @@ class CourseServiceApp(Application):
         help="The base path where course data is stored",
     ).tag(config=True)
 
-    http_client = Any(AsyncHTTPClient(), help="The HTTP client for making requests to JupyterHub")
+    roster_store = CaselessStrEnum(
+        ["csv", "sqlite"],
+        default_value="csv",
+        help=(
+            "Where rosters are stored. 'csv' uses the CSV files in course_base_path, "
+            "'sqlite' a SQLite database (see roster_db_path). Use "
+            "python -m e2x_course_service.roster_sync to copy rosters between both."
+        ),
+    ).tag(config=True)
+
+    roster_db_path = Unicode(
+        "",
+        help="Path of the SQLite roster database. Defaults to course_base_path/rosters.sqlite",
+    ).tag(config=True)
+
+    roster_summary_path = Unicode(
+        "",
+        help=(
+            "Path of the file the member counts of all rosters are kept in, so the course "
+            "overview is served without reading student rosters. Defaults to "
+            "course_base_path/.roster_summaries.json"
+        ),
+    ).tag(config=True)
+
+    roster_cache_ttl = Float(
+        2.0,
+        allow_none=True,
+        help=(
+            "Seconds a cached roster is trusted before it is revalidated with os.stat. "
+            "None trusts cached rosters until they change on disk (requires the inotify watcher)."
+        ),
+    ).tag(config=True)
+
+    roster_cache_max_entries = Integer(
+        512, help="Maximum number of parsed roster files kept in memory"
+    ).tag(config=True)
+
+    roster_cache_use_inotify = Bool(
+        False,
+        help=(
+            "Watch course_base_path with inotify (Linux, requires inotify_simple) "
+            "instead of polling roster files for changes"
+        ),
+    ).tag(config=True)
+
+    grader_cache_ttl = Float(
+        30,
+        help=(
+            "Seconds a grader authorization check is remembered. Changes to the grader "
+            "roster invalidate it as soon as the roster cache sees them, see roster_cache_ttl."
+        ),
+    ).tag(config=True)
+
+    course_manager_workers = Integer(
+        4,
+        help=(
+            "Number of threads that run blocking roster I/O off the event loop. "
+            "0 runs it on the event loop."
+        ),
+    ).tag(config=True)
+
+    hub_user_cache_ttl = Float(
+        300,
+        help="Seconds a user that was found on the Hub is assumed to still exist",
+    ).tag(config=True)
+
+    hub_api_concurrency = Integer(
+        10, help="Maximum number of concurrent requests to the Hub API for one operation"
+    ).tag(config=True)
+
+    hub_user_page_size = Integer(
+        200, help="Number of users requested per page when walking the Hub user list"
+    ).tag(config=True)
+
+    hub_create_chunk_size = Integer(
+        100, help="Maximum number of users created on the Hub with one request"
+    ).tag(config=True)
+
+    hub_api_max_retries = Integer(
+        3, help="How often a Hub API request is retried on 429 or 5xx responses"
+    ).tag(config=True)
+
+    hub_api_retry_delay = Float(
+        0.5, help="Initial delay in seconds before retrying a Hub API request, doubled per retry"
+    ).tag(config=True)
+
+    auth_cache_ttl = Float(
+        60,
+        help=(
+            "Seconds an API token (header or URL) is mapped to its user without asking the Hub "
+            "again. Login cookies are cached by HubOAuth.cache_max_age"
+        ),
+    ).tag(config=True)
+
+    auth_cache_max_entries = Integer(
+        1024, help="Maximum number of tokens in the authentication cache. 0 disables it."
+    ).tag(config=True)
+
+    http_client_implementation = CaselessStrEnum(
+        ["auto", "curl", "simple"],
+        default_value="auto",
+        help=(
+            "HTTP client used for requests to JupyterHub. 'curl' (requires pycurl) keeps "
+            "connections alive and reuses them, 'auto' uses it if pycurl is installed."
+        ),
+    ).tag(config=True)
+
+    http_max_clients = Integer(
+        50, help="Maximum number of concurrent requests of the shared HTTP client"
+    ).tag(config=True)
+
+    http_connect_timeout = Float(10, help="Timeout in seconds for connecting to JupyterHub").tag(
+        config=True
+    )
+
+    http_request_timeout = Float(
+        30, help="Timeout in seconds for a complete request to JupyterHub"
+    ).tag(config=True)
+
+    roster_upload_max_size = Integer(
+        64 * 1024 * 1024, help="Maximum size in bytes of an uploaded roster CSV file"
+    ).tag(config=True)
+
+    authenticate_prometheus = Bool(
+        True, help="Require a Hub user or token for reading the /metrics endpoint"
+    ).tag(config=True)
+
+    server_timing = Bool(
+        False,
+        help=(
+            "Add a Server-Timing header with the time spent in the course manager and in "
+            "Hub API calls to every response"
+        ),
+    ).tag(config=True)
+
+    roster_change_log_path = Unicode(
+        "",
+        help=(
+            "File every roster change made through the service is appended to as a JSON line. "
+            "Defaults to course_base_path/.roster_changes.jsonl if hub_group_sync is enabled, "
+            "otherwise no log is written."
+        ),
+    ).tag(config=True)
+
+    hub_group_sync = Bool(
+        False,
+        help=(
+            "Replay new entries of the roster change log to JupyterHub group memberships "
+            "in the background, see hub_group_names"
+        ),
+    ).tag(config=True)
+
+    hub_group_names = Dict(
+        {
+            "student": "nbgrader-{course_id}-{semester}",
+            "grader": "formgrade-{course_id}-{semester}",
+        },
+        help=(
+            "Hub group of the members of a roster per role, formatted with course_id, "
+            "semester and role. Roles without a group are not synced."
+        ),
+    ).tag(config=True)
+
+    hub_group_sync_create_users = Bool(
+        False,
+        help=(
+            "Create the Hub accounts of users added to a roster that do not exist on the Hub "
+            "yet, so they can be added to its group. Otherwise they are left out of the group."
+        ),
+    ).tag(config=True)
+
+    hub_group_sync_interval = Float(
+        10, help="Seconds between two replays of the change log to Hub groups"
+    ).tag(config=True)
+
+    hub_group_sync_batch_size = Integer(
+        1000, help="Maximum number of change log entries sent to the Hub at once"
+    ).tag(config=True)
+
+    http_client = Any(help="The HTTP client for making requests to JupyterHub")
 
     tornado_application = Any(help="The Tornado application instance")
 
+    http_server = Any(help="The HTTP server of the Tornado application")
+
+    group_sync = Any(help="The HubGroupSync task, if hub_group_sync is enabled")
+
+    cookie_secret_bytes = Any(help="The cookie secret of all workers, see init_cookie_secret")
+
     port = Integer(10101, help="The port for the service to listen on").tag(config=True)
 
+    num_processes = Integer(
+        1,
+        help=(
+            "Number of worker processes to fork, 0 starts one per CPU core. The workers "
+            "share the port and see each other's roster writes (see shared_rosters)."
+        ),
+    ).tag(config=True)
+
+    reuse_port = Bool(
+        False,
+        help=(
+            "With several workers, let each bind its own socket with SO_REUSEPORT so the "
+            "kernel balances connections between them, instead of sharing one socket."
+        ),
+    ).tag(config=True)
+
+    shared_rosters = Bool(
+        False,
+        help=(
+            "Check the roster store's change counter on every roster access, so writes by "
+            "other service processes are seen right away, e.g. several instances behind a "
+            "load balancer. Always on with num_processes other than 1."
+        ),
+    ).tag(config=True)
+
+    cookie_secret = Unicode(
+        "",
+        help=(
+            "Hex encoded secret for signing cookies. Must be the same for all processes "
+            "serving the service. Defaults to the contents of cookie_secret_file or a random "
+            "secret shared by the workers of this process."
+        ),
+    ).tag(config=True)
+
+    cookie_secret_file = Unicode(
+        "", help="File with the hex encoded cookie secret, see cookie_secret"
+    ).tag(config=True)
+
+    def init_cookie_secret(self):
+        secret = self.cookie_secret
+        if not secret and self.cookie_secret_file:
+            with open(self.cookie_secret_file, encoding="utf-8") as f:
+                secret = f.read().strip()
+        # Generated before the workers are forked, so they all use the same one
+        self.cookie_secret_bytes = bytes.fromhex(secret) if secret else os.urandom(32)
+
+    def init_http_client(self):
+        implementation = None
+        if self.http_client_implementation in ("auto", "curl"):
+            try:
+                import pycurl  # noqa: F401
+
+                implementation = "tornado.curl_httpclient.CurlAsyncHTTPClient"
+            except ImportError:
+                if self.http_client_implementation == "curl":
+                    self.log.warning("pycurl is not installed, using the simple HTTP client")
+        AsyncHTTPClient.configure(
+            implementation,
+            max_clients=self.http_max_clients,
+            defaults={
+                "connect_timeout": self.http_connect_timeout,
+                "request_timeout": self.http_request_timeout,
+            },
+        )
+        self.http_client = AsyncHTTPClient()
+
+    def init_roster_store(self):
+        base_path = os.path.abspath(self.course_base_path)
+        if self.roster_store == "sqlite":
+            return SQLiteRosterStore(
+                self.roster_db_path or os.path.join(base_path, "rosters.sqlite")
+            )
+        return CSVRosterStore(base_path)
+
+    def init_change_log(self):
+        path = self.roster_change_log_path
+        if not path and self.hub_group_sync:
+            path = os.path.join(os.path.abspath(self.course_base_path), ".roster_changes.jsonl")
+        return ChangeLog(path) if path else None
+
     def init_tornado_settings(self):
-        jinja_env = Environment(loader=FileSystemLoader(self.template_path))
         hub = HubOAuth(api_token=self.api_token)
-        hub_api = HubAPI(hub)
+        auth_cache = TTLCache(ttl=self.auth_cache_ttl, max_entries=self.auth_cache_max_entries)
+        course_manager = CourseManager(
+            base_path=os.path.abspath(self.course_base_path),
+            logger=self.log,
+            cache_ttl=self.roster_cache_ttl,
+            cache_max_entries=self.roster_cache_max_entries,
+            use_inotify=self.roster_cache_use_inotify,
+            grader_cache_ttl=self.grader_cache_ttl,
+            store=self.init_roster_store(),
+            summary_path=self.roster_summary_path or None,
+            shared=self.shared_rosters or self.num_processes != 1,
+            change_log=self.init_change_log(),
+            defer_index=self.build_index_in_background,
+        )
+        metrics.register_caches(course_manager.caches() + [("auth", auth_cache)])
+        hub_api = HubAPI(
+            hub,
+            client=self.http_client,
+            user_cache_ttl=self.hub_user_cache_ttl,
+            max_concurrency=self.hub_api_concurrency,
+            page_size=self.hub_user_page_size,
+            create_chunk_size=self.hub_create_chunk_size,
+            max_retries=self.hub_api_max_retries,
+            retry_delay=self.hub_api_retry_delay,
+        )
+        if self.hub_group_sync:
+            self.group_sync = HubGroupSync(
+                course_manager.change_log,
+                hub_api,
+                self.hub_group_names,
+                self.log,
+                batch_size=self.hub_group_sync_batch_size,
+                interval=self.hub_group_sync_interval,
+                create_users=self.hub_group_sync_create_users,
+            )
         settings = {
-            "jinja2_env": jinja_env,
+            "templates": Templates(self.template_path, self.template_cache_path),
             "service_prefix": self.service_prefix,
             "http_client": self.http_client,
             "hub_auth": hub,
             "hub_api": hub_api,
-            "cookie_secret": os.urandom(32),
-            "course_manager": CourseManager(
-                base_path=os.path.abspath(self.course_base_path),
-                logger=self.log,
+            "auth_cache": auth_cache,
+            "cookie_secret": self.cookie_secret_bytes,
+            "static_path": self.static_path,
+            "static_url_prefix": ujoin(self.service_prefix, "static/"),
+            "static_handler_class": StaticHandler,
+            "roster_upload_max_size": self.roster_upload_max_size,
+            "authenticate_prometheus": self.authenticate_prometheus,
+            "server_timing": self.server_timing,
+            "compress_response": True,
+            "log_function": metrics.log_request,
+            "course_manager": AsyncCourseManager(
+                course_manager,
+                max_workers=self.course_manager_workers,
             ),
             "logger": self.log,
         }
-        self.tornado_settings = settings
+        self.tornado_settings = {**settings, **self.tornado_settings}
 
     def init_handlers(self):
         app_handlers = [
-            (
-                ujoin(self.service_prefix, "static", "(.*)"),
-                web.StaticFileHandler,
-                {"path": self.static_path},
-            ),
             (
                 ujoin(self.service_prefix, "oauth_callback"),
                 HubOAuthCallbackHandler,
             ),
+            (ujoin(self.service_prefix, "metrics"), MetricsHandler),
         ]
         for pattern, handler in apihandlers.default_handlers + handlers.default_handlers:
             full_pattern = ujoin(self.service_prefix, pattern.lstrip("/"))
@@ -95,19 +433,80 @@ class CourseServiceApp(Application):
 
     def initialize(self, *args, **kwargs):
         super().initialize(*args, **kwargs)
+        self.init_cookie_secret()
+        # Forked workers must not inherit threads, event loops or database connections,
+        # they set up the application after the fork, see start_workers
+        if self.num_processes == 1:
+            self.init_application()
+
+    def init_application(self):
+        self.init_http_client()
         self.init_tornado_settings()
         self.init_handlers()
         self.initialize_tornado_application()
 
     def initialize_tornado_application(self):
         self.tornado_application = web.Application(self.handlers, **self.tornado_settings)
+        if self.tornado_settings.get("compress_response") and compression.brotli is not None:
+            # Before tornado's gzip encoding, which skips responses that are already encoded
+            self.tornado_application.transforms.insert(0, compression.BrotliContentEncoding)
+
+    async def warm_up(self):
+        """Load the templates and build a deferred roster index once the service is listening."""
+        tasks = [IOLoop.current().run_in_executor(None, self.tornado_settings["templates"].warm_up)]
+        if self.build_index_in_background:
+            tasks.append(self.tornado_settings["course_manager"].build_index())
+        try:
+            await asyncio.gather(*tasks)
+        except Exception:
+            self.log.exception("Warming up the service failed")
+
+    def start_workers(self):
+        sockets = None if self.reuse_port else bind_sockets(self.port)
+        self.log.warning(
+            f"Starting Course Service with {self.num_processes or 'one per CPU'} "
+            f"worker processes on port {self.port}"
+        )
+        # Only returns in the workers
+        task_id = fork_processes(self.num_processes)
+        self.init_application()
+        if sockets is None:
+            self.http_server = self.tornado_application.listen(self.port, reuse_port=True)
+        else:
+            self.http_server = HTTPServer(self.tornado_application)
+            self.http_server.add_sockets(sockets)
+        self.log.info(f"Worker {task_id} started with pid {os.getpid()}")
+        return task_id
 
     def start(self):
-        self.log.warning(f"Starting Course Service on port {self.port}")
-        self.tornado_application.listen(self.port)
-        import asyncio
+        if self.num_processes != 1:
+            task_id = self.start_workers()
+        else:
+            task_id = 0
+            self.log.warning(f"Starting Course Service on port {self.port}")
+            self.http_server = self.tornado_application.listen(self.port)
+        # One worker is enough to replay the change log
+        if self.group_sync is not None and task_id == 0:
+            self.group_sync.start()
+        loop = asyncio.get_event_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *_: loop.call_soon_threadsafe(self.stop))
+        IOLoop.current().add_callback(self.warm_up)
+        loop.run_forever()
+
+    def stop(self):
+        """Stop serving, save the roster summaries and close the roster store.
 
-        asyncio.get_event_loop().run_forever()
+        Called on SIGTERM and SIGINT. Requests that are running when the service stops
+        are not answered.
+        """
+        self.log.warning("Stopping Course Service")
+        if self.http_server is not None:
+            self.http_server.stop()
+        if self.group_sync is not None:
+            self.group_sync.stop()
+        self.tornado_settings["course_manager"].shutdown()
+        asyncio.get_event_loop().stop()
 
 
 if __name__ == "__main__":
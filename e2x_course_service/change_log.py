@@ -0,0 +1,74 @@
+"""Append-only log of the roster changes made through the CourseManager.
+
+Every line is a JSON object
+``{"time": ..., "action": "add" | "remove", "user": ..., "course_id": ..., "semester": ...,
+"role": "student" | "grader"}``. Readers remember the byte offset up to which they
+processed the log, so they only ever read new entries.
+"""
+
+import json
+import os
+import time
+from typing import Dict, Iterable, List, Tuple
+
+from .roster_store import RosterKey
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+
+class ChangeLog:
+    def __init__(self, path: str):
+        self.path = path
+
+    def append(self, key: RosterKey, added: Iterable[str], removed: Iterable[str]):
+        """Append the changes of one roster write as one write to the file."""
+        course_id, semester, role = key
+        now = time.time()
+        lines = [
+            json.dumps(
+                {
+                    "time": now,
+                    "action": action,
+                    "user": username,
+                    "course_id": course_id,
+                    "semester": semester,
+                    "role": role,
+                }
+            )
+            + "\n"
+            for action, usernames in (("remove", removed), ("add", added))
+            for username in usernames
+        ]
+        if not lines:
+            return
+        with open(self.path, "a", encoding="utf-8") as f:
+            # Other processes append to the same log
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            f.write("".join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def read(self, offset: int, max_entries: int) -> Tuple[List[Dict], int]:
+        """Up to ``max_entries`` complete entries from ``offset`` on and the offset after them."""
+        entries = []
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return entries, offset
+        with f:
+            f.seek(offset)
+            while len(entries) < max_entries:
+                line = f.readline()
+                # Stop at a line that is still being written
+                if not line.endswith(b"\n"):
+                    break
+                offset += len(line)
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue
+        return entries, offset
@@ -1,95 +1,425 @@
-import glob
+import asyncio
+import bisect
+import csv
+import hashlib
 import os
+import threading
+import time
 from collections import defaultdict
-from typing import Dict, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, FrozenSet, Hashable, List, Optional, Set, Tuple
 
-import pandas as pd
+from tornado.ioloop import IOLoop
+
+from .change_log import ChangeLog
+from .metrics import COURSE_MANAGER_DURATION, record_timing
+from .roster_cache import RosterCache, RosterCacheEntry
+from .roster_store import KINDS, CSVRosterStore, RosterKey, RosterStore
+from .roster_summary import RosterSummary, SummaryFile, roster_checksum
+from .roster_writer import RosterWriter
+from .ttl_cache import TTLCache
 
 
 class CourseManager:
-    def __init__(self, base_path, logger):
+    def __init__(
+        self,
+        base_path,
+        logger,
+        cache_ttl: Optional[float] = 2.0,
+        cache_max_entries: int = 512,
+        use_inotify: bool = False,
+        grader_cache_ttl: float = 30,
+        store: Optional[RosterStore] = None,
+        summary_path: Optional[str] = None,
+        shared: bool = False,
+        change_log: Optional[ChangeLog] = None,
+        defer_index: bool = False,
+    ):
         self.base_path = base_path
         self.logger = logger
+        self.cache_ttl = cache_ttl
+        self.store = store if store is not None else CSVRosterStore(base_path)
+        self._cache = RosterCache(
+            self.store.read, self.store.revision, ttl=cache_ttl, max_entries=cache_max_entries
+        )
+        self._writer = RosterWriter(self.store, self._load_for_write, self._on_roster_written)
+        # Inverted index: username -> {(course_id, semester, kind)}
+        self._memberships: Dict[str, Set[RosterKey]] = defaultdict(set)
+        # Indexed members and their store revision per roster. Student rosters are
+        # indexed on demand, see _ensure_students_indexed
+        self._roster_members: Dict[RosterKey, FrozenSet[str]] = {}
+        self._roster_revisions: Dict[RosterKey, Hashable] = {}
+        # Revisions of rosters that could not be parsed, they are left out of the index
+        self._invalid_revisions: Dict[RosterKey, Hashable] = {}
+        self._students_indexed = False
+        # Member count and checksum of every roster, persisted in a sidecar file
+        self._summaries: Dict[RosterKey, RosterSummary] = {}
+        self._summaries_dirty = False
+        self._summary_file = None
+        if summary_path is None:
+            summary_path = os.path.join(base_path, ".roster_summaries.json")
+        if summary_path:
+            self._summary_file = SummaryFile(summary_path, logger)
+        # Incremented whenever a roster is seen to change, invalidates derived caches
+        self._roster_versions: Dict[RosterKey, int] = defaultdict(int)
+        # (user, course_id, semester, revision and version of the grader roster) -> is_grader
+        self._grader_checks = TTLCache(ttl=grader_cache_ttl, max_entries=cache_max_entries * 16)
+        # (course_id, semester) -> members of a course sorted for paging, see _member_listing
+        self._member_listings = TTLCache(ttl=grader_cache_ttl, max_entries=cache_max_entries)
+        # Guards the index, CourseManager is used from several worker threads
+        self._index_lock = threading.RLock()
+        self._index_checked_at = 0.0
+        self._index_dirty = False
+        self._watching = False
+        # Set once build_index finished, see defer_index
+        self._index_ready = threading.Event()
+        # With shared, the store's generation is checked on every roster access so
+        # writes by other processes are seen right away
+        self.shared = shared
+        self._generation = None
+        self.change_log = change_log
         self.logger.warning(f"CourseManager initialized with base_path: {self.base_path}")
+        if use_inotify:
+            self.start_watcher()
+        # With defer_index the owner calls build_index, e.g. after the service is listening.
+        # Calls that need the complete index wait for it
+        if not defer_index:
+            self.build_index()
+
+    def start_watcher(self):
+        if not self.store.watch(self._on_roster_changed, self.logger):
+            return
+        self._watching = True
+        # Changes are pushed by the watcher, cached rosters never expire on their own
+        self._cache.ttl = None
+
+    def _on_roster_changed(self, key: Optional[RosterKey]):
+        if key is not None:
+            self._cache.invalidate(key)
+            with self._index_lock:
+                self._roster_versions[key] += 1
+        self._index_dirty = True
+
+    def caches(self):
+        """(name, cache) pairs of the caches of this manager, for metrics."""
+        return [
+            ("roster", self._cache),
+            ("grader_checks", self._grader_checks),
+            ("member_listings", self._member_listings),
+        ]
+
+    def build_index(self):
+        """Build the username -> courses index and the roster summaries.
+
+        Grader rosters are read right away. Student rosters are only read if their summary
+        is missing or outdated, their members are indexed when they are first needed.
+        """
+        try:
+            with self._index_lock:
+                self._memberships.clear()
+                self._roster_members.clear()
+                self._roster_revisions.clear()
+                self._invalid_revisions.clear()
+                self._summaries = self._summary_file.load() if self._summary_file else {}
+                self._students_indexed = False
+                self._generation = self.store.generation() if self.shared else None
+                self.refresh_index()
+        finally:
+            # Do not keep requests waiting, the next refresh_index retries failed rosters
+            self._index_ready.set()
+        self.logger.info(
+            f"Indexed {len(self._summaries)} rosters with {len(self._memberships)} users"
+        )
+
+    def refresh_index(self):
+        """Pick up rosters that were added, changed or removed outside the service.
+
+        The revisions of all rosters are compared, only changed rosters are read again.
+        """
+        with self._index_lock:
+            self._index_dirty = False
+            self._index_checked_at = time.monotonic()
+            revisions = self.store.revisions()
+            for key, revision in revisions.items():
+                if key in self._roster_members:
+                    if revision == self._roster_revisions[key]:
+                        continue
+                elif self._invalid_revisions.get(key) == revision:
+                    continue
+                elif key[2] == "student" and not self._students_indexed:
+                    summary = self._summaries.get(key)
+                    if summary is not None and summary.revision == revision:
+                        continue
+                self._cache.invalidate(key)
+                self._index_roster(key, revision)
+            for key in set(self._summaries) - set(revisions):
+                self._drop_from_index(key)
+            for key in set(self._invalid_revisions) - set(revisions):
+                del self._invalid_revisions[key]
+            self.save_summaries()
+
+    def _index_roster(self, key: RosterKey, revision: Hashable = None):
+        """Read a roster into the index, leaving it out if it cannot be parsed.
+
+        A malformed roster only fails the requests for its course, not the whole index.
+        """
+        with self._index_lock:
+            try:
+                entry = self._cache.get(key)
+            except (ValueError, csv.Error) as e:
+                self.logger.error(f"Leaving {self.store.describe(key)} out of the index: {e}")
+                self._invalid_revisions[key] = revision
+                if key in self._summaries:
+                    self._drop_from_index(key)
+                return
+            self._invalid_revisions.pop(key, None)
+            self._sync_index(key, entry)
+
+    def _ensure_students_indexed(self):
+        """Read the student rosters that are only known from their summaries."""
+        if self._students_indexed:
+            return
+        with self._index_lock:
+            for key in list(self._summaries):
+                if key not in self._roster_members:
+                    self._index_roster(key)
+            self._students_indexed = True
+
+    def save_summaries(self):
+        with self._index_lock:
+            if self._summary_file is None or not self._summaries_dirty:
+                return
+            self._summaries_dirty = False
+            self._summary_file.save(self._summaries)
+
+    def roster_summary(self, course_id: str, semester: str, kind: str) -> Optional[RosterSummary]:
+        """Member count, checksum and modification time of a roster as last indexed."""
+        self._maybe_refresh_index()
+        with self._index_lock:
+            return self._summaries.get((course_id, semester, kind))
+
+    def _etag(self, *parts) -> str:
+        # Called with self._index_lock held
+        digest = hashlib.sha1()
+        for part in parts:
+            if isinstance(part, tuple):
+                summary = self._summaries.get(part)
+                part = "/".join(part) + ":" + (summary.checksum if summary else "-")
+            digest.update(part.encode("utf-8") + b"\n")
+        return f'"{digest.hexdigest()}"'
+
+    def courses_etag(self, user: str) -> str:
+        """ETag of list_grader_courses_for_user, computed without reading any roster."""
+        self._maybe_refresh_index()
+        with self._index_lock:
+            keys = []
+            for course_id, semester, kind in sorted(self._memberships.get(user, ())):
+                if kind == "grader":
+                    keys.append((course_id, semester, "grader"))
+                    keys.append((course_id, semester, "student"))
+            return self._etag(user, *keys)
+
+    def course_members_etag(self, course_id: str, semester: str) -> str:
+        """ETag of the members of a course, computed without reading its rosters."""
+        self._maybe_refresh_index()
+        with self._index_lock:
+            return self._etag(*[(course_id, semester, kind) for kind in KINDS])
+
+    def _check_generation(self):
+        """Refresh the index if another process wrote a roster, only with shared."""
+        if not self.shared or not self._index_ready.is_set():
+            return
+        generation = self.store.generation()
+        if generation != self._generation:
+            with self._index_lock:
+                self._generation = generation
+                self.refresh_index()
+
+    def _maybe_refresh_index(self):
+        self._index_ready.wait()
+        self._check_generation()
+        with self._index_lock:
+            if self._watching:
+                if self._index_dirty:
+                    self.refresh_index()
+            elif self.cache_ttl is not None:
+                if time.monotonic() - self._index_checked_at >= self.cache_ttl:
+                    self.refresh_index()
+
+    def _sync_index(self, key: RosterKey, entry: Optional[RosterCacheEntry], force=False):
+        """Update the index for one roster if its cache entry is newer than the index."""
+        with self._index_lock:
+            if entry is None:
+                if key in self._summaries:
+                    self._drop_from_index(key)
+            elif force or entry.revision != self._roster_revisions.get(key):
+                self._update_index(key, entry.revision, entry.usernames)
+
+    def _update_index(self, key: RosterKey, revision: Hashable, usernames: Tuple[str, ...]):
+        # Called with self._index_lock held
+        self._roster_versions[key] += 1
+        old_members = self._roster_members.get(key, frozenset())
+        new_members = frozenset(usernames)
+        for username in old_members - new_members:
+            roster_keys = self._memberships.get(username)
+            if roster_keys is None:
+                continue
+            roster_keys.discard(key)
+            if not roster_keys:
+                del self._memberships[username]
+        for username in new_members - old_members:
+            self._memberships[username].add(key)
+        self._roster_members[key] = new_members
+        self._roster_revisions[key] = revision
+        self._summaries[key] = RosterSummary(
+            revision,
+            len(usernames),
+            roster_checksum(usernames),
+            self.store.modified(revision) or time.time(),
+        )
+        self._summaries_dirty = True
+
+    def _drop_from_index(self, key: RosterKey):
+        if key in self._roster_members:
+            self._update_index(key, None, ())
+            del self._roster_members[key]
+            del self._roster_revisions[key]
+        else:
+            self._roster_versions[key] += 1
+        del self._summaries[key]
+        self._summaries_dirty = True
+
+    def _load_roster(
+        self, course_id: str, semester: str, kind: str, revalidate: bool = False
+    ) -> Optional[Tuple[str, ...]]:
+        """Get the usernames of a roster through the cache, keeping the index in sync."""
+        self._check_generation()
+        key = (course_id, semester, kind)
+        entry = self._cache.get(key, revalidate)
+        self._sync_index(key, entry)
+        return None if entry is None else entry.usernames
+
+    def _load_for_write(self, key: RosterKey) -> Tuple[str, ...]:
+        # Revalidate so we never diff against a roster that was edited outside the service
+        usernames = self._load_roster(*key, revalidate=True)
+        if usernames is None:
+            raise FileNotFoundError(self.store.describe(key))
+        return usernames
+
+    def _on_roster_written(
+        self, key: RosterKey, usernames: List[str], added: List[str], removed: List[str]
+    ):
+        """Record the contents of a roster after we wrote it."""
+        # Always update, a rewrite within the mtime resolution may keep the revision
+        self._sync_index(key, self._cache.put(key, usernames), force=True)
+        if self.change_log is not None:
+            try:
+                self.change_log.append(key, added, removed)
+            except OSError as e:
+                # The roster is already written, do not fail the request
+                self.logger.error(f"Could not log changes to {self.store.describe(key)}: {e}")
+
+    def _change_members(
+        self, course_id: str, semester: str, kind: str, add=(), remove=()
+    ) -> Optional[Tuple[List[str], List[str]]]:
+        """Queue a change to a roster and wait until it is written.
+
+        Returns the usernames that were added and removed, or None if the roster does not exist.
+        """
+        key = (course_id, semester, kind)
+        try:
+            return self._writer.submit(key, add=add, remove=remove)
+        except FileNotFoundError:
+            self.logger.error(f"Members file {self.store.describe(key)} does not exist.")
+            return None
 
     def get_courses_for_user(self, user: str):
+        self._maybe_refresh_index()
+        self._ensure_students_indexed()
         courses = dict(grader=defaultdict(list), student=defaultdict(list))
-        search_path = os.path.join(self.base_path, "*/*/*.csv")
-        for p in glob.glob(search_path):
-            kind = os.path.basename(os.path.dirname(p))
-            if kind not in courses:
-                continue
-            df = pd.read_csv(p)
-            if user in df["Username"].values:
-                course_name = os.path.basename(p).replace(".csv", "")
-                course_id, semester = course_name.split("-", 1)
-                courses[kind][course_id].append(semester)
+        with self._index_lock:
+            roster_keys = list(self._memberships.get(user, ()))
+        for course_id, semester, kind in roster_keys:
+            courses[kind][course_id].append(semester)
         # Sort semesters for each course
         for kind in courses:
             for course_id in courses[kind]:
                 courses[kind][course_id] = sorted(courses[kind][course_id])
         return courses
 
+    def _member_count(self, key: RosterKey) -> int:
+        summary = self._summaries.get(key)
+        return 0 if summary is None else summary.count
+
     def list_grader_courses_for_user(self, user: str):
+        self._maybe_refresh_index()
         courses = []
         # For each course put the course_id, semester, number of graders, number of students
-        search_path = os.path.join(self.base_path, "*/grader/*.csv")
-        for p in glob.glob(search_path):
-            df = pd.read_csv(p)
-            if user in df["Username"].values:
-                course_name = os.path.basename(p).replace(".csv", "")
-                course_id, semester = course_name.split("-", 1)
-                num_graders = len(df)
-                # Get number of students
-                students_file = os.path.join(
-                    self.base_path, course_id, "student", f"{course_id}-{semester}.csv"
-                )
-                if os.path.exists(students_file):
-                    df_students = pd.read_csv(students_file)
-                    num_students = len(df_students)
-                else:
-                    num_students = 0
+        with self._index_lock:
+            for course_id, semester, kind in sorted(self._memberships.get(user, ())):
+                if kind != "grader":
+                    continue
                 courses.append(
                     {
                         "course_id": course_id,
                         "semester": semester,
-                        "num_graders": num_graders,
-                        "num_students": num_students,
+                        "num_graders": self._member_count((course_id, semester, "grader")),
+                        "num_students": self._member_count((course_id, semester, "student")),
                     }
                 )
         return courses
 
     def is_grader_for_course(self, user: str, course_id: str, semester: str):
-        graders_file = os.path.join(
-            self.base_path, course_id, "grader", f"{course_id}-{semester}.csv"
-        )
-        if not os.path.exists(graders_file):
+        # Answered from memory per revision of the grader roster, which the roster cache
+        # revalidates, so a grader removed outside the service loses access right away
+        self._check_generation()
+        key = (course_id, semester, "grader")
+        entry = self._cache.get(key)
+        with self._index_lock:
+            # Our own writes bump the version even if they keep the file's revision
+            version = self._roster_versions.get(key, 0)
+        revision = None if entry is None else entry.revision
+        memo_key = (user, course_id, semester, revision, version)
+        cached = self._grader_checks.get(memo_key)
+        if cached is not None:
+            return cached
+        self._sync_index(key, entry)
+        if entry is None:
+            graders_file = self.store.describe(key)
             self.logger.error(f"Graders file {graders_file} does not exist.")
-            return False
-        df = pd.read_csv(graders_file)
-        return user in df["Username"].values
+            is_grader = False
+        else:
+            with self._index_lock:
+                is_grader = key in self._memberships.get(user, ())
+        self._grader_checks.set(memo_key, is_grader)
+        return is_grader
 
     def get_members_file(self, course_id: str, semester: str, kind: str):
         if kind not in ["student", "grader"]:
             self.logger.error(f"Invalid kind {kind} for getting members file.")
             return None
-        members_file = os.path.join(self.base_path, course_id, kind, f"{course_id}-{semester}.csv")
-        if not os.path.exists(members_file):
+        key = (course_id, semester, kind)
+        members_file = self.store.describe(key)
+        if self.store.revision(key) is None:
             self.logger.error(f"Members file {members_file} does not exist.")
             return None
         return members_file
 
+    def get_roster(self, course_id: str, semester: str, kind: str) -> Optional[Tuple[str, ...]]:
+        """Usernames of one roster in stored order, or None if it does not exist."""
+        if self.get_members_file(course_id, semester, kind) is None:
+            return None
+        return self._load_roster(course_id, semester, kind)
+
     def get_course_members(self, course_id: str, semester: str) -> Dict[str, List[str]]:
-        graders = []
-        students = []
-        graders_file = self.get_members_file(course_id, semester, kind="grader")
-        if graders_file:
-            df_graders = pd.read_csv(graders_file)
-            graders = df_graders["Username"].tolist()
-        students_file = self.get_members_file(course_id, semester, kind="student")
-        if students_file:
-            df_students = pd.read_csv(students_file)
-            students = df_students["Username"].tolist()
+        graders = self._load_roster(course_id, semester, "grader")
+        if graders is None:
+            self.get_members_file(course_id, semester, kind="grader")
+            graders = ()
+        students = self._load_roster(course_id, semester, "student")
+        if students is None:
+            self.get_members_file(course_id, semester, kind="student")
+            students = ()
         # Return a dict with username as key and roles as values
         members = defaultdict(list)
         for g in graders:
@@ -98,35 +428,94 @@ class CourseManager:
             members[s].append("student")
         return members
 
+    def _member_listing(self, course_id: str, semester: str):
+        """Members of a course sorted case-insensitively by username, per role.
+
+        Returns ``(members, listing)`` where ``members`` maps usernames to roles and
+        ``listing`` maps ``None`` (all members) and each role to a pair of lowercased
+        usernames and usernames in the same order. Rebuilt when a roster changes.
+        """
+        # Picks up changed rosters through the cache, which bumps their versions
+        for kind in KINDS:
+            self._load_roster(course_id, semester, kind)
+        with self._index_lock:
+            versions = tuple(self._roster_versions.get((course_id, semester, k), 0) for k in KINDS)
+        cached = self._member_listings.get((course_id, semester))
+        if cached is not None and cached[0] == versions:
+            return cached[1], cached[2]
+        members = self.get_course_members(course_id, semester)
+        usernames = sorted(members, key=lambda u: (u.lower(), u))
+        listing = {}
+        for role in (None,) + KINDS:
+            selected = [u for u in usernames if role is None or role in members[u]]
+            listing[role] = ([u.lower() for u in selected], selected)
+        self._member_listings.set((course_id, semester), (versions, members, listing))
+        return members, listing
+
+    def query_course_members(
+        self,
+        course_id: str,
+        semester: str,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        search: str = "",
+        role: Optional[str] = None,
+        compact: bool = False,
+    ) -> Dict:
+        """One page of the members of a course, sorted by username.
+
+        ``search`` matches username prefixes case-insensitively and ``role`` only
+        returns students or graders. ``total`` counts all members of the course,
+        ``filtered`` those that match the search and role. ``members`` maps the
+        usernames to their roles, or with ``compact`` each role to its usernames.
+        """
+        members, listing = self._member_listing(course_id, semester)
+        keys, usernames = listing[role]
+        search = search.strip().lower()
+        start, end = 0, len(keys)
+        if search:
+            start = bisect.bisect_left(keys, search)
+            end = bisect.bisect_left(keys, search + "\U0010ffff", start)
+        page_start = min(start + offset, end)
+        page_end = end if limit is None else min(page_start + limit, end)
+        page = usernames[page_start:page_end]
+        if compact:
+            page_members = {kind: [u for u in page if kind in members[u]] for kind in KINDS}
+        else:
+            page_members = {u: members[u] for u in page}
+        return {
+            "total": len(members),
+            "filtered": end - start,
+            "members": page_members,
+        }
+
     def update_course_members(self, course_id: str, semester: str, members: Dict[str, List[str]]):
-        current_members = self.get_course_members(course_id, semester)
+        """Bring the roles of the given members in line with ``members``.
+
+        Each roster is loaded once, diffed against the requested roles and written at most once.
+        """
         student_changes = {"add": [], "remove": []}
         grader_changes = {"add": [], "remove": []}
-        # Determine changes
-        for username, roles in members.items():
-            current_roles = set(current_members.get(username, []))
-            new_roles = set(roles)
-            if "student" in new_roles and "student" not in current_roles:
-                student_changes["add"].append(username)
-            if "student" not in new_roles and "student" in current_roles:
-                student_changes["remove"].append(username)
-            if "grader" in new_roles and "grader" not in current_roles:
-                grader_changes["add"].append(username)
-            if "grader" not in new_roles and "grader" in current_roles:
-                grader_changes["remove"].append(username)
-        # Apply changes
-        if student_changes["add"]:
-            self.add_members_to_course(student_changes["add"], course_id, semester, kind="student")
-        if student_changes["remove"]:
-            self.remove_members_from_course(
-                student_changes["remove"], course_id, semester, kind="student"
-            )
-        if grader_changes["add"]:
-            self.add_members_to_course(grader_changes["add"], course_id, semester, kind="grader")
-        if grader_changes["remove"]:
-            self.remove_members_from_course(
-                grader_changes["remove"], course_id, semester, kind="grader"
-            )
+        for kind, changes in (("student", student_changes), ("grader", grader_changes)):
+            current = self._load_roster(course_id, semester, kind, revalidate=True)
+            if current is None:
+                self.get_members_file(course_id, semester, kind)
+                continue
+            existing_members = self._roster_members[(course_id, semester, kind)]
+            add, remove = [], []
+            for username, roles in members.items():
+                username = username.strip()
+                if not username:
+                    continue
+                if kind in roles and username not in existing_members:
+                    add.append(username)
+                elif kind not in roles and username in existing_members:
+                    remove.append(username)
+            if not add and not remove:
+                continue
+            result = self._change_members(course_id, semester, kind, add=add, remove=remove)
+            if result:
+                changes["add"], changes["remove"] = result
         return {
             "student_changes": student_changes,
             "grader_changes": grader_changes,
@@ -141,19 +530,9 @@ class CourseManager:
         if kind not in ["student", "grader"]:
             self.logger.error(f"Invalid kind {kind} for adding members.")
             return []
-        members_files = os.path.join(self.base_path, course_id, kind, f"{course_id}-{semester}.csv")
-        if not os.path.exists(members_files):
-            self.logger.error(f"Members file {members_files} does not exist.")
-            return []
-        df = pd.read_csv(members_files)
-        existing_members = set(df["Username"].values)
-        new_members = [m.strip() for m in members if m not in existing_members]
-        if not new_members:
-            return []
-        new_df = pd.DataFrame(new_members, columns=["Username"])
-        updated_df = pd.concat([df, new_df], ignore_index=True)
-        updated_df.to_csv(members_files, index=False)
-        return new_members
+        new_members = [m.strip() for m in members if m.strip()]
+        changes = self._change_members(course_id, semester, kind, add=new_members)
+        return changes[0] if changes else []
 
     def remove_members_from_course(
         self, members: List[str], course_id: str, semester: str, kind: str
@@ -161,15 +540,123 @@ class CourseManager:
         if kind not in ["student", "grader"]:
             self.logger.error(f"Invalid kind {kind} for removing members.")
             return []
-        members_file = os.path.join(self.base_path, course_id, kind, f"{course_id}-{semester}.csv")
-        if not os.path.exists(members_file):
-            self.logger.error(f"Members file {members_file} does not exist.")
-            return []
-        df = pd.read_csv(members_file)
-        existing_members = set(df["Username"].values)
-        members_to_remove = [m.strip() for m in members if m in existing_members]
-        if not members_to_remove:
-            return []
-        updated_df = df[~df["Username"].isin(members_to_remove)]
-        updated_df.to_csv(members_file, index=False)
-        return members_to_remove
+        members_to_remove = [m.strip() for m in members if m.strip()]
+        changes = self._change_members(course_id, semester, kind, remove=members_to_remove)
+        return changes[1] if changes else []
+
+
+class AsyncCourseManager:
+    """Run the blocking CourseManager methods in a bounded thread pool.
+
+    With ``max_workers=0`` the methods run directly on the event loop.
+    """
+
+    def __init__(self, manager: CourseManager, max_workers: int = 4):
+        self.manager = manager
+        self.executor = None
+        if max_workers > 0:
+            self.executor = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix="course-manager"
+            )
+
+    async def _run(self, func, *args):
+        start = time.perf_counter()
+        try:
+            if self.executor is None:
+                return func(*args)
+            return await IOLoop.current().run_in_executor(self.executor, func, *args)
+        finally:
+            elapsed = time.perf_counter() - start
+            COURSE_MANAGER_DURATION.labels(func.__name__).observe(elapsed)
+            record_timing("course_manager", elapsed)
+
+    async def get_courses_for_user(self, user: str):
+        return await self._run(self.manager.get_courses_for_user, user)
+
+    async def list_grader_courses_for_user(self, user: str):
+        return await self._run(self.manager.list_grader_courses_for_user, user)
+
+    async def is_grader_for_course(self, user: str, course_id: str, semester: str):
+        return await self._run(self.manager.is_grader_for_course, user, course_id, semester)
+
+    async def courses_etag(self, user: str):
+        return await self._run(self.manager.courses_etag, user)
+
+    async def course_members_etag(self, course_id: str, semester: str):
+        return await self._run(self.manager.course_members_etag, course_id, semester)
+
+    async def build_index(self):
+        return await self._run(self.manager.build_index)
+
+    async def get_roster(self, course_id: str, semester: str, kind: str):
+        return await self._run(self.manager.get_roster, course_id, semester, kind)
+
+    async def get_course_members(self, course_id: str, semester: str):
+        return await self._run(self.manager.get_course_members, course_id, semester)
+
+    async def query_course_members(
+        self,
+        course_id: str,
+        semester: str,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        search: str = "",
+        role: Optional[str] = None,
+        compact: bool = False,
+    ):
+        return await self._run(
+            self.manager.query_course_members,
+            course_id,
+            semester,
+            offset,
+            limit,
+            search,
+            role,
+            compact,
+        )
+
+    async def update_course_members(
+        self, course_id: str, semester: str, members: Dict[str, List[str]]
+    ):
+        return await self._run(self.manager.update_course_members, course_id, semester, members)
+
+    async def update_many_course_members(
+        self, updates: Dict[Tuple[str, str], Dict[str, List[str]]]
+    ) -> Dict[Tuple[str, str], Dict]:
+        """Update the members of several courses, keyed by (course_id, semester).
+
+        Every course writes different rosters, so the courses are updated in parallel.
+        A course whose update failed maps to the exception, the others are still updated.
+        """
+        results = await asyncio.gather(
+            *(
+                self._run(self.manager.update_course_members, course_id, semester, members)
+                for (course_id, semester), members in updates.items()
+            ),
+            return_exceptions=True,
+        )
+        return dict(zip(updates, results))
+
+    async def remove_course_members(self, course_id: str, semester: str, members: List[str]):
+        return await self._run(self.manager.remove_course_members, course_id, semester, members)
+
+    async def add_members_to_course(
+        self, members: List[str], course_id: str, semester: str, kind: str
+    ):
+        return await self._run(
+            self.manager.add_members_to_course, members, course_id, semester, kind
+        )
+
+    async def remove_members_from_course(
+        self, members: List[str], course_id: str, semester: str, kind: str
+    ):
+        return await self._run(
+            self.manager.remove_members_from_course, members, course_id, semester, kind
+        )
+
+    def shutdown(self):
+        """Wait for running calls, then save the roster summaries and close the store."""
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+        self.manager.save_summaries()
+        self.manager.store.close()
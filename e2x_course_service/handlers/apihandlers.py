@@ -1,7 +1,12 @@
+import asyncio
+import csv
+import io
 import json
 
-from tornado.web import authenticated
+from tornado.web import authenticated, stream_request_body
 
+from .. import roster_io
+from ..roster_store import KINDS
 from .base import BaseAPIHandler
 
 
@@ -10,75 +15,66 @@ class ListGraderCoursesHandler(BaseAPIHandler):
     async def get(self):
         user_model = self.get_current_user()
         username = user_model["name"]
-        self.set_header("content-type", "application/json")
-        courses = self.course_manager.list_grader_courses_for_user(username)
-        self.finish(
-            json.dumps(
-                {
-                    "user": username,
-                    "courses": courses,
-                }
-            )
+        if self._check_etag(await self.course_manager.courses_etag(username)):
+            return
+        courses = await self.course_manager.list_grader_courses_for_user(username)
+        self.finish_json(
+            {
+                "user": username,
+                "courses": courses,
+            }
         )
 
 
 class CourseMembersHandler(BaseAPIHandler):
-    def _validate_grader_access(self, course_id, semester):
-        """Validate that current user is a grader for the specified course.
-
-        Returns:
-            tuple: (is_valid, username) where is_valid is bool and username is str or None
-        """
-        user_model = self.get_current_user()
-        if not user_model:
-            self.set_status(401)
-            self.write(
-                json.dumps(
-                    {
-                        "status": "error",
-                        "message": "Not authenticated",
-                    }
-                )
-            )
-            self.finish()
-            return False, None
-
-        username = user_model["name"]
-        self.logger.warning(
-            f"Validating grader access for user {username} to {course_id}-{semester}"
-        )
-        if not self.course_manager.is_grader_for_course(username, course_id, semester):
-            self.set_status(403)
-            self.write(
-                json.dumps(
-                    {
-                        "status": "error",
-                        "message": f"You are not a grader for course {course_id}-{semester}",
-                    }
-                )
-            )
-            self.finish()
-            return False, None
-
-        return True, username
-
     @authenticated
     async def get(self):
         course_id = self.get_argument("course_id")
         semester = self.get_argument("semester")
-        is_valid, _ = self._validate_grader_access(course_id, semester)
+        is_valid, _ = await self._validate_grader_access(course_id, semester)
         if not is_valid:
             return
-        members = self.course_manager.get_course_members(course_id, semester)
-        self.set_header("content-type", "application/json")
-        self.finish(
-            json.dumps(
+        try:
+            offset = int(self.get_argument("offset", "0"))
+            limit = self.get_argument("limit", None)
+            limit = None if limit is None else int(limit)
+        except ValueError:
+            offset = limit = -1
+        role = self.get_argument("role", None)
+        members_format = self.get_argument("format", "default")
+        if (
+            offset < 0
+            or (limit is not None and limit < 0)
+            or role not in (None, *KINDS)
+            or members_format not in ("default", "compact")
+        ):
+            self.finish_json(
                 {
-                    "course_id": course_id,
-                    "semester": semester,
-                    "members": members,
-                }
+                    "status": "error",
+                    "message": "Invalid offset, limit, role or format",
+                },
+                status=400,
             )
+            return
+        if self._check_etag(await self.course_manager.course_members_etag(course_id, semester)):
+            return
+        page = await self.course_manager.query_course_members(
+            course_id,
+            semester,
+            offset=offset,
+            limit=limit,
+            search=self.get_argument("search", ""),
+            role=role,
+            compact=members_format == "compact",
+        )
+        self.finish_json(
+            {
+                "course_id": course_id,
+                "semester": semester,
+                "offset": offset,
+                "limit": limit,
+                **page,
+            }
         )
 
     @authenticated
@@ -88,72 +84,42 @@ class CourseMembersHandler(BaseAPIHandler):
         semester = data.get("semester")
         members = data.get("members")
         add_to_hub = data.get("add_to_hub", False)
-        self.logger.warning(f"PUT data: {data}")
+        self.logger.warning(f"PUT {course_id}-{semester}: {len(members) if members else 0} members")
         if not course_id or not semester or not members:
-            self.set_status(400)
-            self.write(
-                json.dumps(
-                    {
-                        "status": "error",
-                        "message": "Missing course_id, semester, or members in request body",
-                    }
-                )
+            self.finish_json(
+                {
+                    "status": "error",
+                    "message": "Missing course_id, semester, or members in request body",
+                },
+                status=400,
             )
-            self.finish()
             return
-        is_valid, _ = self._validate_grader_access(course_id, semester)
+        is_valid, _ = await self._validate_grader_access(course_id, semester)
         if not is_valid:
             return
-        updated = self.course_manager.update_course_members(course_id, semester, members)
-        self.set_header("content-type", "application/json")
+        updated = await self.course_manager.update_course_members(course_id, semester, members)
         if not updated:
-            self.set_status(404)
-            self.write(
-                json.dumps(
-                    {
-                        "status": "error",
-                        "message": f"Course {course_id}-{semester} not found or no changes made",
-                    }
-                )
+            self.finish_json(
+                {
+                    "status": "error",
+                    "message": f"Course {course_id}-{semester} not found or no changes made",
+                },
+                status=404,
             )
-            self.finish()
             return
         added = updated.get("student_changes", {}).get("add", []) + updated.get(
             "grader_changes", {}
         ).get("add", [])
+        response = {
+            "status": "success",
+            "updated": updated,
+        }
         if add_to_hub and added:
-            # Check if users exist in JupyterHub, create them if not
-            existing_users_resp = await self.api.list_users()
-            existing_usernames = set(
-                [u["name"] for u in json.loads(existing_users_resp.decode("utf-8"))]
-            )
-
-            missing_users = set(added) - existing_usernames
-            response = await self.api.create_users(list(missing_users))
-            # Check if it was a success (201), otherwise return an error
-            if response:
-                self.logger.warning(f"Created users in Hub: {response}")
-            else:
-                self.set_status(500)
-                self.write(
-                    json.dumps(
-                        {
-                            "status": "error",
-                            "message": "Failed to create users in JupyterHub",
-                        }
-                    )
-                )
-                self.finish()
-                return
-        self.set_header("content-type", "application/json")
-        self.finish(
-            json.dumps(
-                {
-                    "status": "success",
-                    "updated": updated,
-                }
-            )
-        )
+            # The rosters are already updated, so Hub failures are reported per user
+            response["hub_users"] = await self._create_hub_users(added)
+            if response["hub_users"]["failed"]:
+                response["status"] = "partial"
+        self.finish_json(response)
 
     @authenticated
     async def delete(self):
@@ -162,32 +128,225 @@ class CourseMembersHandler(BaseAPIHandler):
         semester = data.get("semester")
         members = data.get("members")
         if not course_id or not semester or not members:
-            self.set_status(400)
-            self.write(
-                json.dumps(
+            self.finish_json(
+                {
+                    "status": "error",
+                    "message": "Missing course_id, semester, or members in request body",
+                },
+                status=400,
+            )
+            return
+        is_valid, _ = await self._validate_grader_access(course_id, semester)
+        if not is_valid:
+            return
+        removed = await self.course_manager.remove_course_members(course_id, semester, members)
+        self.finish_json(
+            {
+                "removed_members": removed,
+            }
+        )
+
+
+class BatchCourseMembersHandler(BaseAPIHandler):
+    @authenticated
+    async def put(self):
+        """Update the members of several courses at once.
+
+        The body has the form ``{"courses": [{"course_id", "semester", "members"}, ...],
+        "add_to_hub": bool}`` where ``members`` is the same as for a single course. Entries
+        for the same course are merged. All added users are created in the Hub together.
+        """
+        data = json.loads(self.request.body)
+        courses = data.get("courses")
+        add_to_hub = data.get("add_to_hub", False)
+        if not courses or not isinstance(courses, list):
+            self.finish_json(
+                {
+                    "status": "error",
+                    "message": "Missing courses in request body",
+                },
+                status=400,
+            )
+            return
+        updates = {}
+        for entry in courses:
+            if not isinstance(entry, dict):
+                entry = {}
+            course_id = entry.get("course_id")
+            semester = entry.get("semester")
+            members = entry.get("members")
+            if not course_id or not semester or not isinstance(members, dict) or not members:
+                self.finish_json(
                     {
                         "status": "error",
-                        "message": "Missing course_id, semester, or members in request body",
-                    }
+                        "message": "Every course needs a course_id, semester and members",
+                    },
+                    status=400,
                 )
+                return
+            updates.setdefault((course_id, semester), {}).update(members)
+
+        username = self.get_current_user()["name"]
+        allowed = await asyncio.gather(
+            *(
+                self.course_manager.is_grader_for_course(username, course_id, semester)
+                for course_id, semester in updates
             )
-            self.finish()
+        )
+        course_keys = list(updates)
+        results = {}
+        for (course_id, semester), is_grader in zip(course_keys, allowed):
+            if not is_grader:
+                del updates[(course_id, semester)]
+                results[(course_id, semester)] = {
+                    "status": "error",
+                    "message": f"You are not a grader for course {course_id}-{semester}",
+                }
+        for (course_id, semester), updated in (
+            await self.course_manager.update_many_course_members(updates)
+        ).items():
+            if isinstance(updated, Exception):
+                self.logger.error(f"Updating {course_id}-{semester} failed", exc_info=updated)
+                results[(course_id, semester)] = {
+                    "status": "error",
+                    "message": f"Updating course {course_id}-{semester} failed",
+                }
+            else:
+                results[(course_id, semester)] = {"status": "success", "updated": updated}
+
+        response = {
+            "status": "success",
+            "courses": [
+                {"course_id": course_id, "semester": semester, **results[(course_id, semester)]}
+                for course_id, semester in course_keys
+            ],
+        }
+        if any(result["status"] != "success" for result in results.values()):
+            response["status"] = "partial"
+        added = {
+            member
+            for result in results.values()
+            if result["status"] == "success"
+            for changes in result["updated"].values()
+            for member in changes["add"]
+        }
+        if add_to_hub and added:
+            # One Hub lookup for the new members of all courses
+            response["hub_users"] = await self._create_hub_users(sorted(added))
+            if response["hub_users"]["failed"]:
+                response["status"] = "partial"
+        self.finish_json(response)
+
+
+@stream_request_body
+class RosterCSVHandler(BaseAPIHandler):
+    """Upload and download one roster as CSV without holding the request in memory.
+
+    ``PUT`` adds the usernames of an uploaded CSV file (a ``Username`` column or one
+    username per line) to a roster, ``GET`` serves a roster as CSV. Both take
+    ``course_id``, ``semester`` and ``kind`` as query arguments.
+    """
+
+    # Usernames that are written per flush when serving a roster
+    chunk_rows = 1000
+    # Invalid rows that are reported back in the response
+    max_reported_invalid = 100
+
+    async def prepare(self):
+        super().prepare()
+        self.course_id = self.get_argument("course_id")
+        self.semester = self.get_argument("semester")
+        self.kind = self.get_argument("kind")
+        if self.kind not in ("student", "grader"):
+            self._error(400, f"Invalid kind {self.kind}")
             return
-        is_valid, _ = self._validate_grader_access(course_id, semester)
+        is_valid, _ = await self._validate_grader_access(self.course_id, self.semester)
         if not is_valid:
             return
-        removed = self.course_manager.remove_course_members(course_id, semester, members)
-        self.set_header("content-type", "application/json")
-        self.finish(
-            json.dumps(
-                {
-                    "removed_members": removed,
-                }
+        if self.request.method == "PUT":
+            self.request.connection.set_max_body_size(self.settings["roster_upload_max_size"])
+            self.parser = roster_io.UsernameStreamParser(
+                f"upload for {self.course_id}-{self.semester}"
             )
+            self.parse_error = None
+            self.rows = 0
+            self.usernames = {}
+            self.invalid = []
+
+    def _error(self, status, message):
+        self.finish_json({"status": "error", "message": message}, status=status)
+
+    def _collect(self, rows):
+        # Validate and dedupe while the upload arrives, keeping the first occurrence
+        for line, username in rows:
+            self.rows += 1
+            if not roster_io.is_valid_username(username):
+                self.invalid.append({"line": line, "username": username[:100]})
+            else:
+                self.usernames.setdefault(username, None)
+
+    def data_received(self, chunk):
+        if self.parse_error is not None:
+            return
+        try:
+            self._collect(self.parser.feed(chunk))
+        except (ValueError, csv.Error) as e:
+            self.parse_error = str(e)
+
+    @authenticated
+    async def put(self):
+        if self.parse_error is None:
+            try:
+                self._collect(self.parser.close())
+            except (ValueError, csv.Error) as e:
+                self.parse_error = str(e)
+        if self.parse_error is not None:
+            self._error(400, self.parse_error)
+            return
+        added = await self.course_manager.add_members_to_course(
+            list(self.usernames), self.course_id, self.semester, self.kind
+        )
+        response = {
+            "status": "partial" if self.invalid else "success",
+            "rows": self.rows,
+            "unique": len(self.usernames),
+            "added": added,
+            "invalid": self.invalid[: self.max_reported_invalid],
+            "num_invalid": len(self.invalid),
+        }
+        if self.get_argument("add_to_hub", "false").lower() in ("1", "true") and added:
+            response["hub_users"] = await self._create_hub_users(added)
+            if response["hub_users"]["failed"]:
+                response["status"] = "partial"
+        self.finish_json(response)
+
+    @authenticated
+    async def get(self):
+        usernames = await self.course_manager.get_roster(self.course_id, self.semester, self.kind)
+        if usernames is None:
+            self._error(404, f"Course {self.course_id}-{self.semester} not found")
+            return
+        self.set_header("content-type", "text/csv; charset=utf-8")
+        self.set_header(
+            "content-disposition",
+            f'attachment; filename="{self.course_id}-{self.semester}-{self.kind}.csv"',
         )
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerow([roster_io.USERNAME_COLUMN])
+        for start in range(0, len(usernames), self.chunk_rows):
+            writer.writerows([u] for u in usernames[start : start + self.chunk_rows])
+            self.write(buffer.getvalue())
+            buffer.seek(0)
+            buffer.truncate()
+            await self.flush()
+        self.write(buffer.getvalue())
+        self.finish()
 
 
 default_handlers = [
     (r"/api/courses/?", ListGraderCoursesHandler),
     (r"/api/course_members/?", CourseMembersHandler),
+    (r"/api/course_members/batch/?", BatchCourseMembersHandler),
+    (r"/api/course_members/csv/?", RosterCSVHandler),
 ]
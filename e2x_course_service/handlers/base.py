@@ -1,14 +1,67 @@
+import hashlib
+import json
+
 from jupyterhub.services.auth import HubOAuthenticated
 from jupyterhub.utils import url_path_join as ujoin
+from tornado.httpclient import HTTPClientError
 from tornado.web import RequestHandler
 
-from ..course_manager import CourseManager
+from .. import metrics
+from ..course_manager import AsyncCourseManager
 from ..hub_api import HubAPI
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 class BaseHandler(HubOAuthenticated, RequestHandler):
+    def prepare(self):
+        self._timings = metrics.start_request_timings()
+
+    def finish(self, chunk=None):
+        # Headers of streamed responses are already sent
+        if self.settings.get("server_timing") and not self._headers_written:
+            self.set_header(
+                "Server-Timing",
+                metrics.server_timing_header(
+                    self.request.request_time(), getattr(self, "_timings", {})
+                ),
+            )
+        return super().finish(chunk)
+
+    def get_current_user(self):
+        """Resolve the user of an API token through a cache shared by all handlers.
+
+        Only a cache miss asks the Hub to identify the token. Requests authenticated by
+        the login cookie always go through HubOAuth, which checks their XSRF token and
+        keeps its own cache of the Hub's answers (HubOAuth.cache_max_age).
+        """
+        if hasattr(self, "_hub_auth_user_cache"):
+            return self._hub_auth_user_cache
+        cache = self.settings.get("auth_cache")
+        token = self.hub_auth.get_token(self, in_cookie=False)
+        if cache is None or not token:
+            return super().get_current_user()
+        key = (
+            self.hub_auth.get_session_id(self),
+            hashlib.sha256(token.encode("utf8", "replace")).hexdigest(),
+        )
+        user_model = cache.get(key)
+        if user_model is not None:
+            # Like HubOAuth does for token authenticated requests, which skip XSRF checks
+            self._token_authenticated = True
+            self._hub_auth_user_cache = user_model
+            return user_model
+        user_model = super().get_current_user()
+        # Only cache the user if the token identified it, not a login cookie
+        if user_model and getattr(self, "_token_authenticated", False):
+            cache.set(key, user_model)
+        return user_model
+
     @property
-    def course_manager(self) -> CourseManager:
+    def course_manager(self) -> AsyncCourseManager:
         return self.settings["course_manager"]
 
     @property
@@ -18,8 +71,7 @@ class BaseHandler(HubOAuthenticated, RequestHandler):
 
 class BaseTemplateHandler(BaseHandler):
     def render_template(self, template_name, **kwargs):
-        jinja_env = self.settings["jinja2_env"]
-        template = jinja_env.get_template(template_name)
+        template = self.settings["templates"].get_template(template_name)
         user_model = self.get_current_user()
         if user_model:
             kwargs["user"] = user_model.get("name")
@@ -31,7 +83,7 @@ class BaseTemplateHandler(BaseHandler):
                 "base_url": self.settings.get("base_url", "/"),
                 "service_prefix": self.settings.get("service_prefix", "/"),
                 "api_url": ujoin(self.settings.get("service_prefix", "/"), "api"),
-                "static_url": self.settings.get("static_url"),
+                "static_url": self.static_url,
                 "hub_url": self.settings.get("hub_url", "/hub/"),
             }
         )
@@ -42,3 +94,79 @@ class BaseAPIHandler(BaseHandler):
     @property
     def api(self) -> HubAPI:
         return self.settings["hub_api"]
+
+    async def _validate_grader_access(self, course_id, semester):
+        """Validate that current user is a grader for the specified course.
+
+        Returns:
+            tuple: (is_valid, username) where is_valid is bool and username is str or None
+        """
+        user_model = self.get_current_user()
+        if not user_model:
+            self.finish_json({"status": "error", "message": "Not authenticated"}, status=401)
+            return False, None
+
+        username = user_model["name"]
+        self.logger.warning(
+            f"Validating grader access for user {username} to {course_id}-{semester}"
+        )
+        if not await self.course_manager.is_grader_for_course(username, course_id, semester):
+            self.finish_json(
+                {
+                    "status": "error",
+                    "message": f"You are not a grader for course {course_id}-{semester}",
+                },
+                status=403,
+            )
+            return False, None
+
+        return True, username
+
+    def finish_json(self, data, status: int = 200):
+        """Finish the response with ``data`` as compact JSON.
+
+        Encoded with orjson if it is installed, which is several times faster than the
+        json module for the member lists of big courses.
+        """
+        self.set_status(status)
+        self.set_header("content-type", "application/json")
+        if orjson is not None:
+            return self.finish(orjson.dumps(data))
+        return self.finish(json.dumps(data, separators=(",", ":"), ensure_ascii=False))
+
+    def _check_etag(self, etag: str) -> bool:
+        """Set the ETag of the response and answer 304 if the client already has it.
+
+        Returns True if the response is finished.
+        """
+        self.set_header("Etag", etag)
+        self.set_header("Cache-Control", "private, no-cache")
+        if self.check_etag_header():
+            self.set_status(304)
+            self.finish()
+            return True
+        return False
+
+    async def _create_hub_users(self, usernames):
+        """Create the users that do not exist in JupyterHub yet.
+
+        Returns:
+            dict: usernames that were created or already existed, and failed usernames
+            mapped to the reason
+        """
+        try:
+            existing_usernames = await self.api.find_existing_users(usernames)
+        except (HTTPClientError, OSError) as e:
+            self.logger.error(f"Failed to look up users in Hub: {e}")
+            return {"created": [], "existing": [], "failed": {u: str(e) for u in usernames}}
+        missing_users = sorted(set(usernames) - existing_usernames)
+        report = {"created": [], "existing": sorted(existing_usernames), "failed": {}}
+        if missing_users:
+            created = await self.api.create_missing_users(missing_users)
+            report["created"] = sorted(created["created"])
+            report["existing"] = sorted(report["existing"] + created["existing"])
+            report["failed"] = created["failed"]
+            self.logger.warning(f"Created users in Hub: {report['created']}")
+        if report["failed"]:
+            self.logger.error(f"Failed to create users in Hub: {report['failed']}")
+        return report
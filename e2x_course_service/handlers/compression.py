@@ -0,0 +1,73 @@
+"""Brotli content encoding, used next to tornado's gzip encoding if brotli is installed."""
+
+from typing import Tuple
+
+from tornado import httputil
+from tornado.web import GZipContentEncoding
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def accepts_encoding(accept_encoding: str, encoding: str) -> bool:
+    """Whether an Accept-Encoding header lists ``encoding`` with a q-value above 0."""
+    for item in accept_encoding.split(","):
+        name, *params = [part.strip() for part in item.split(";")]
+        if name.lower() != encoding:
+            continue
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    return float(value) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+class BrotliContentEncoding(GZipContentEncoding):
+    """Applies the brotli content encoding to responses of clients that accept it.
+
+    Runs before tornado's GZipContentEncoding, which adds the ``Vary`` header and leaves
+    responses that are already encoded alone.
+    """
+
+    # The default quality of 11 is meant for static assets, not for every response
+    QUALITY = 5
+
+    def __init__(self, request: httputil.HTTPServerRequest) -> None:
+        self._compressing = accepts_encoding(request.headers.get("Accept-Encoding", ""), "br")
+
+    def transform_first_chunk(
+        self,
+        status_code: int,
+        headers: httputil.HTTPHeaders,
+        chunk: bytes,
+        finishing: bool,
+    ) -> Tuple[int, httputil.HTTPHeaders, bytes]:
+        if self._compressing:
+            ctype = headers.get("Content-Type", "").split(";")[0]
+            self._compressing = (
+                self._compressible_type(ctype)
+                and (not finishing or len(chunk) >= self.MIN_LENGTH)
+                and "Content-Encoding" not in headers
+            )
+        if self._compressing:
+            headers["Content-Encoding"] = "br"
+            self._compressor = brotli.Compressor(quality=self.QUALITY)
+            chunk = self.transform_chunk(chunk, finishing)
+            if "Content-Length" in headers:
+                if finishing:
+                    headers["Content-Length"] = str(len(chunk))
+                else:
+                    del headers["Content-Length"]
+        return status_code, headers, chunk
+
+    def transform_chunk(self, chunk: bytes, finishing: bool) -> bytes:
+        if self._compressing:
+            chunk = self._compressor.process(chunk)
+            chunk += self._compressor.finish() if finishing else self._compressor.flush()
+        return chunk
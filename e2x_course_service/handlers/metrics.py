@@ -0,0 +1,14 @@
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+from tornado import web
+
+from .base import BaseHandler
+
+
+class MetricsHandler(BaseHandler):
+    """Serve the Prometheus metrics of the service."""
+
+    async def get(self):
+        if self.settings.get("authenticate_prometheus", True) and not self.get_current_user():
+            raise web.HTTPError(403)
+        self.set_header("content-type", CONTENT_TYPE_LATEST)
+        self.write(generate_latest(REGISTRY))
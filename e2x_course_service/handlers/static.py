@@ -0,0 +1,18 @@
+from tornado import web
+
+
+class StaticHandler(web.StaticFileHandler):
+    """Static files with caching headers.
+
+    Versioned urls (``static_url`` adds a hash of the file as ``v``) are cached for a year,
+    other urls are revalidated by the browser with their ETag on every use.
+    """
+
+    def get_cache_time(self, path, modified, mime_type):
+        return self.CACHE_MAX_AGE if "v" in self.request.arguments else 0
+
+    def set_extra_headers(self, path):
+        if "v" in self.request.arguments:
+            self.set_header("Cache-Control", f"public, max-age={self.CACHE_MAX_AGE}, immutable")
+        else:
+            self.set_header("Cache-Control", "no-cache")
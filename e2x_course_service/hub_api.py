@@ -1,14 +1,45 @@
+import asyncio
 import json
+import time
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Set
+from urllib.parse import quote
 
 from jupyterhub.services.auth import HubOAuth
 from jupyterhub.utils import url_path_join as ujoin
-from tornado.httpclient import AsyncHTTPClient, HTTPRequest, HTTPResponse
+from tornado.httpclient import AsyncHTTPClient, HTTPClientError, HTTPRequest, HTTPResponse
+from tornado.httputil import url_concat
+
+from .metrics import HubRequestTimer, hub_endpoint
+
+# Media type that makes JupyterHub >= 2.0 return paginated user lists
+PAGINATION_MEDIA_TYPE = "application/jupyterhub-pagination+json"
+
+# Rate limited, server errors and tornado's timeout / connection errors
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504, 599}
 
 
 class HubAPI:
-    def __init__(self, hub: HubOAuth):
+    def __init__(
+        self,
+        hub: HubOAuth,
+        client: Optional[AsyncHTTPClient] = None,
+        user_cache_ttl: float = 300,
+        max_concurrency: int = 10,
+        page_size: int = 200,
+        create_chunk_size: int = 100,
+        max_retries: int = 3,
+        retry_delay: float = 0.5,
+    ):
         self.hub = hub
-        self.client = AsyncHTTPClient()
+        self.client = client or AsyncHTTPClient()
+        self.user_cache_ttl = user_cache_ttl
+        self.max_concurrency = max_concurrency
+        self.page_size = page_size
+        self.create_chunk_size = create_chunk_size
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        # username -> time.monotonic() when the user was last seen on the Hub
+        self._existing_users: Dict[str, float] = {}
 
     @property
     def auth_header(self):
@@ -18,18 +49,122 @@ class HubAPI:
     def hub_api_url(self):
         return self.hub.api_url
 
-    async def request(self, url, method="GET", body=None) -> HTTPResponse:
-        req = HTTPRequest(url, method=method, headers=self.auth_header, body=body)
-        return await self.client.fetch(req)
+    def _backoff(self, error: HTTPClientError, attempt: int) -> float:
+        delay = self.retry_delay * 2**attempt
+        retry_after = error.response.headers.get("Retry-After") if error.response else None
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, float(retry_after))
+        return delay
+
+    async def request(self, url, method="GET", body=None, headers=None) -> HTTPResponse:
+        """Send a request to the Hub, retrying with exponential backoff on 429 and 5xx."""
+        for attempt in range(self.max_retries + 1):
+            req = HTTPRequest(
+                url,
+                method=method,
+                headers={**self.auth_header, **(headers or {})},
+                body=body,
+                # The Hub expects a body on DELETE /groups/{name}/users
+                allow_nonstandard_methods=method == "DELETE",
+            )
+            try:
+                with HubRequestTimer(method, hub_endpoint(url, self.hub_api_url)):
+                    return await self.client.fetch(req)
+            except HTTPClientError as e:
+                if e.code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(self._backoff(e, attempt))
 
     async def list_users(self):
         url = ujoin(self.hub_api_url, "users")
         resp: HTTPResponse = await self.request(url, method="GET")
         return resp.body
 
+    async def iter_users(
+        self, usernames: Optional[Iterable[str]] = None, page_size: Optional[int] = None
+    ) -> AsyncIterator[dict]:
+        """Yield Hub user models page by page.
+
+        If ``usernames`` is given, only those users are yielded and paging stops as soon as
+        all of them were found. Hubs without pagination support return everything at once.
+        """
+        wanted = None if usernames is None else set(usernames)
+        if wanted is not None and not wanted:
+            return
+        offset = 0
+        limit = page_size or self.page_size
+        while True:
+            url = url_concat(ujoin(self.hub_api_url, "users"), {"offset": offset, "limit": limit})
+            resp = await self.request(url, headers={"Accept": PAGINATION_MEDIA_TYPE})
+            data = json.loads(resp.body)
+            if isinstance(data, list):
+                users, next_page = data, None
+            else:
+                users, next_page = data["items"], data["_pagination"].get("next")
+            self._remember_users(user["name"] for user in users)
+            for user in users:
+                if wanted is None:
+                    yield user
+                elif user["name"] in wanted:
+                    wanted.discard(user["name"])
+                    yield user
+                    if not wanted:
+                        return
+            if not next_page:
+                return
+            offset, limit = next_page["offset"], next_page["limit"]
+
+    async def user_exists(self, username: str) -> bool:
+        url = ujoin(self.hub_api_url, "users", quote(username, safe=""))
+        try:
+            await self.request(url, method="GET")
+        except HTTPClientError as e:
+            if e.code == 404:
+                return False
+            raise
+        return True
+
+    def _remember_users(self, usernames: Iterable[str]):
+        now = time.monotonic()
+        for username in usernames:
+            self._existing_users[username] = now
+
+    async def find_existing_users(self, usernames: Iterable[str]) -> Set[str]:
+        """Return the subset of usernames that exist on the Hub.
+
+        Users seen within ``user_cache_ttl`` seconds are answered from the cache, the others
+        are looked up individually with bounded concurrency instead of listing all users.
+        Users that do not exist yet would never end a walk of the user list early, so the
+        number of requests only depends on the number of unknown users, not on the Hub's.
+        """
+        now = time.monotonic()
+        existing = set()
+        unknown = []
+        for username in set(usernames):
+            seen_at = self._existing_users.get(username)
+            if seen_at is not None and now - seen_at < self.user_cache_ttl:
+                existing.add(username)
+            else:
+                unknown.append(username)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def check(username):
+            async with semaphore:
+                return username, await self.user_exists(username)
+
+        results = await asyncio.gather(*[check(u) for u in unknown])
+        found = [username for username, exists in results if exists]
+        for username, exists in results:
+            if not exists:
+                self._existing_users.pop(username, None)
+        self._remember_users(found)
+        existing.update(found)
+        return existing
+
     async def create_user(self, username: str):
-        url = ujoin(self.hub_api_url, "users", username)
+        url = ujoin(self.hub_api_url, "users", quote(username, safe=""))
         resp: HTTPResponse = await self.request(url, method="POST", body="{}")
+        self._remember_users([username])
         return resp.body
 
     async def create_users(self, usernames: list):
@@ -39,9 +174,88 @@ class HubAPI:
             "admin": False,
         }
         resp: HTTPResponse = await self.request(url, method="POST", body=json.dumps(body))
+        self._remember_users(usernames)
         return resp.body
 
+    async def create_missing_users(self, usernames: List[str]) -> Dict[str, object]:
+        """Create users in chunks with bounded concurrency and report the result per user.
+
+        Returns ``{"created": [...], "existing": [...], "failed": {username: reason}}``.
+        A chunk that the Hub rejects with a 4xx status is retried user by user, so one
+        invalid or already existing username does not fail the others. If the Hub is
+        unavailable even after retrying, the whole chunk fails.
+        """
+        report = {"created": [], "existing": [], "failed": {}}
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        chunks = [
+            usernames[i : i + self.create_chunk_size]
+            for i in range(0, len(usernames), self.create_chunk_size)
+        ]
+
+        def record_error(username, error):
+            if getattr(error, "code", None) == 409:
+                self._remember_users([username])
+                report["existing"].append(username)
+            else:
+                report["failed"][username] = str(error)
+
+        async def create_chunk(chunk):
+            async with semaphore:
+                try:
+                    await self.create_users(chunk)
+                except (HTTPClientError, OSError) as e:
+                    rejected = isinstance(e, HTTPClientError) and e.code not in RETRY_STATUS_CODES
+                    if len(chunk) > 1 and rejected:
+                        for username in chunk:
+                            await create_single(username)
+                    else:
+                        for username in chunk:
+                            record_error(username, e)
+                else:
+                    report["created"].extend(chunk)
+
+        async def create_single(username):
+            try:
+                await self.create_user(username)
+            except (HTTPClientError, OSError) as e:
+                record_error(username, e)
+            else:
+                report["created"].append(username)
+
+        await asyncio.gather(*[create_chunk(chunk) for chunk in chunks])
+        return report
+
     async def get_group(self, groupname: str):
         url = ujoin(self.hub_api_url, "groups", groupname)
         resp: HTTPResponse = await self.request(url, method="GET")
         return resp.body
+
+    async def create_group(self, groupname: str):
+        url = ujoin(self.hub_api_url, "groups", quote(groupname, safe=""))
+        try:
+            await self.request(url, method="POST", body="{}")
+        except HTTPClientError as e:
+            # Created by someone else in the meantime
+            if e.code != 409:
+                raise
+
+    async def add_group_users(self, groupname: str, usernames: List[str]):
+        """Add users to a group, creating the group if it does not exist."""
+        url = ujoin(self.hub_api_url, "groups", quote(groupname, safe=""), "users")
+        body = json.dumps({"users": usernames})
+        try:
+            await self.request(url, method="POST", body=body)
+        except HTTPClientError as e:
+            if e.code != 404:
+                raise
+            await self.create_group(groupname)
+            await self.request(url, method="POST", body=body)
+
+    async def remove_group_users(self, groupname: str, usernames: List[str]):
+        """Remove users from a group, a missing group has no users to remove."""
+        url = ujoin(self.hub_api_url, "groups", quote(groupname, safe=""), "users")
+        try:
+            await self.request(url, method="DELETE", body=json.dumps({"users": usernames}))
+        except HTTPClientError as e:
+            if e.code != 404:
+                raise
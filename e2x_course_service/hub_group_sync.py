@@ -0,0 +1,196 @@
+"""Replay the roster change log to JupyterHub group memberships."""
+
+import asyncio
+import os
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from tornado.httpclient import HTTPClientError
+from tornado.ioloop import IOLoop
+
+from . import roster_io
+from .change_log import ChangeLog
+from .hub_api import RETRY_STATUS_CODES, HubAPI
+
+
+class HubGroupSync:
+    """Send new change log entries to the Hub's group API in batches.
+
+    ``group_names`` maps a role to a format string for the group name, e.g.
+    ``{"student": "nbgrader-{course_id}-{semester}"}``; roles without a group are skipped.
+    The offset of the first entry that was not sent yet is kept in ``cursor_path``, so
+    the cost of a sync depends on the number of changes since the last one. Entries of
+    a batch are sent again if the Hub is unavailable, which is harmless as group changes
+    are idempotent. Changes to a group that the Hub rejects are logged and skipped.
+
+    Users that do not exist on the Hub are skipped as well, unless ``create_users`` is set,
+    which creates their accounts.
+    """
+
+    def __init__(
+        self,
+        change_log: ChangeLog,
+        hub_api: HubAPI,
+        group_names: Dict[str, str],
+        logger,
+        cursor_path: Optional[str] = None,
+        batch_size: int = 1000,
+        interval: float = 10,
+        create_users: bool = False,
+    ):
+        self.change_log = change_log
+        self.hub_api = hub_api
+        self.group_names = group_names
+        self.logger = logger
+        for role, name_format in group_names.items():
+            if not name_format:
+                continue
+            try:
+                name_format.format(course_id="course", semester="semester", role=role)
+            except (AttributeError, KeyError, IndexError, ValueError) as e:
+                raise ValueError(f"Invalid Hub group name {name_format!r} for {role}: {e!r}")
+        self.cursor_path = cursor_path or change_log.path + ".hub_cursor"
+        self.batch_size = batch_size
+        self.interval = interval
+        self.create_users = create_users
+        self._task = None
+
+    def load_cursor(self) -> int:
+        try:
+            with open(self.cursor_path, encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+        except ValueError:
+            self.logger.warning(f"Invalid hub group sync cursor in {self.cursor_path}, restarting")
+            return 0
+
+    def save_cursor(self, offset: int):
+        with roster_io.atomic_write(self.cursor_path) as f:
+            f.write(str(offset))
+
+    def _group_changes(self, entries: List[Dict]):
+        """Group users to add and remove per Hub group, the last change of a user wins.
+
+        Malformed entries are skipped, so they cannot stop the sync.
+        """
+        last_action = {}
+        skipped = 0
+        for entry in entries:
+            if not isinstance(entry, dict) or not self._is_valid_entry(entry):
+                skipped += 1
+                continue
+            name_format = self.group_names.get(entry["role"])
+            if not name_format:
+                continue
+            group = name_format.format(
+                course_id=entry["course_id"], semester=entry["semester"], role=entry["role"]
+            )
+            last_action[(group, entry["user"])] = entry["action"]
+        if skipped:
+            self.logger.warning(f"Skipped {skipped} malformed entries of {self.change_log.path}")
+        add = defaultdict(list)
+        remove = defaultdict(list)
+        for (group, username), action in last_action.items():
+            (add if action == "add" else remove)[group].append(username)
+        return add, remove
+
+    @staticmethod
+    def _is_valid_entry(entry: Dict) -> bool:
+        fields = ("user", "course_id", "semester", "role")
+        return entry.get("action") in ("add", "remove") and all(
+            isinstance(entry.get(field), str) and entry[field] for field in fields
+        )
+
+    async def _check_users(self, add: Dict[str, List[str]], remove: Dict[str, List[str]]):
+        """Skip the users that do not exist on the Hub, or create them with create_users.
+
+        The Hub rejects adding users that do not exist to a group, and removing them.
+        """
+        usernames = {u for users in (*add.values(), *remove.values()) for u in users}
+        existing = await self.hub_api.find_existing_users(usernames)
+        missing = sorted({u for users in add.values() for u in users} - existing)
+        if missing and self.create_users:
+            report = await self.hub_api.create_missing_users(missing)
+            existing.update(report["created"], report["existing"])
+            for username, reason in report["failed"].items():
+                self.logger.error(f"Could not create Hub user {username} for groups: {reason}")
+        elif missing:
+            self.logger.warning(
+                f"Not adding {len(missing)} users that do not exist on the Hub to groups, "
+                f"e.g. {missing[0]}"
+            )
+        for changes in (add, remove):
+            for group in list(changes):
+                changes[group] = [u for u in changes[group] if u in existing]
+                if not changes[group]:
+                    del changes[group]
+
+    async def _apply_changes(self, add: Dict[str, List[str]], remove: Dict[str, List[str]]):
+        """Send the changes of every group, skipping groups that the Hub rejects.
+
+        Raises if the Hub is unavailable, so the whole batch is sent again.
+        """
+        semaphore = asyncio.Semaphore(self.hub_api.max_concurrency)
+
+        async def apply(action, group, usernames):
+            async with semaphore:
+                await getattr(self.hub_api, f"{action}_group_users")(group, usernames)
+
+        changes = [("remove", g, u) for g, u in remove.items()]
+        changes += [("add", g, u) for g, u in add.items()]
+        results = await asyncio.gather(
+            *[apply(*change) for change in changes], return_exceptions=True
+        )
+        for (action, group, usernames), result in zip(changes, results):
+            if not isinstance(result, BaseException):
+                continue
+            if not isinstance(result, HTTPClientError) or result.code in RETRY_STATUS_CODES:
+                raise result
+            self.logger.error(
+                f"Hub rejected the request to {action} {len(usernames)} users "
+                f"in group {group}, skipping it: {result}"
+            )
+
+    async def sync_once(self) -> int:
+        """Send all entries that were not sent yet. Returns the number of entries."""
+        loop = IOLoop.current()
+        offset = self.load_cursor()
+        if os.path.exists(self.change_log.path) and offset > os.path.getsize(self.change_log.path):
+            self.logger.warning(f"{self.change_log.path} was truncated, replaying it")
+            offset = 0
+        total = 0
+        while True:
+            entries, next_offset = await loop.run_in_executor(
+                None, self.change_log.read, offset, self.batch_size
+            )
+            if next_offset == offset:
+                return total
+            add, remove = self._group_changes(entries)
+            await self._check_users(add, remove)
+            await self._apply_changes(add, remove)
+            await loop.run_in_executor(None, self.save_cursor, next_offset)
+            self.logger.info(
+                f"Synced {len(entries)} roster changes to {len(add) + len(remove)} Hub groups"
+            )
+            offset = next_offset
+            total += len(entries)
+
+    async def run(self):
+        while True:
+            try:
+                await self.sync_once()
+            except (HTTPClientError, OSError) as e:
+                self.logger.error(f"Syncing roster changes to Hub groups failed, retrying: {e}")
+            except Exception:
+                # Keep syncing, e.g. after an unexpected answer from the Hub
+                self.logger.exception("Syncing roster changes to Hub groups failed, retrying")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._task = asyncio.ensure_future(self.run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
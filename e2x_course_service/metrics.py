@@ -0,0 +1,164 @@
+"""Prometheus metrics of the course service.
+
+Durations spent in the course manager and in Hub API calls are also summed up per
+request, so handlers can report them in a ``Server-Timing`` header.
+"""
+
+import time
+from contextvars import ContextVar
+from typing import Dict, Iterable, Optional, Tuple
+from urllib.parse import urlsplit
+
+from prometheus_client import Counter, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import REGISTRY
+from tornado.log import access_log
+
+REQUEST_DURATION = Histogram(
+    "course_service_request_duration_seconds",
+    "Duration of HTTP requests to the course service",
+    ["handler", "method", "code"],
+)
+
+COURSE_MANAGER_DURATION = Histogram(
+    "course_service_course_manager_duration_seconds",
+    "Duration of CourseManager calls, including the wait for a worker thread",
+    ["method"],
+)
+
+ROSTER_READ_DURATION = Histogram(
+    "course_service_roster_read_duration_seconds",
+    "Duration of reading and parsing one roster from its store",
+    ["store"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+
+ROSTER_READ_BYTES = Counter(
+    "course_service_roster_read_bytes",
+    "Bytes of roster CSV files read",
+)
+
+HUB_REQUEST_DURATION = Histogram(
+    "course_service_hub_request_duration_seconds",
+    "Duration of requests to the JupyterHub API, per attempt",
+    ["method", "endpoint"],
+)
+
+HUB_REQUEST_ERRORS = Counter(
+    "course_service_hub_request_errors",
+    "Failed requests to the JupyterHub API, per attempt",
+    ["method", "endpoint", "code"],
+)
+
+# Durations of the current request by category, see record_timing
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar(
+    "request_timings", default=None
+)
+
+
+def start_request_timings() -> Dict[str, float]:
+    """Collect the timings recorded by the current request (asyncio task) in a new dict."""
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def record_timing(name: str, seconds: float):
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0) + seconds
+
+
+def server_timing_header(total: float, timings: Dict[str, float]) -> str:
+    entries = [f"total;dur={total * 1000:.1f}"]
+    entries.extend(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
+    return ", ".join(entries)
+
+
+def hub_endpoint(url: str, api_url: str) -> str:
+    """Endpoint of a Hub API url without names, to keep the number of label values small.
+
+    E.g. ``/users/{name}`` for ``http://hub/hub/api/users/alice?x=1``.
+    """
+    path = urlsplit(url).path[len(urlsplit(api_url).path) :]
+    segments = [s for s in path.split("/") if s]
+    return "/" + "/".join("{name}" if i % 2 else s for i, s in enumerate(segments))
+
+
+class HubRequestTimer:
+    """Time one attempt of a Hub API request."""
+
+    def __init__(self, method: str, endpoint: str):
+        self.method = method
+        self.endpoint = endpoint
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        HUB_REQUEST_DURATION.labels(self.method, self.endpoint).observe(elapsed)
+        record_timing("hub", elapsed)
+        if exc is not None:
+            code = getattr(exc, "code", None) or type(exc).__name__
+            HUB_REQUEST_ERRORS.labels(self.method, self.endpoint, str(code)).inc()
+
+
+def log_request(handler):
+    """Tornado ``log_function`` that observes the request duration and logs like Tornado."""
+    status = handler.get_status()
+    request_time = handler.request.request_time()
+    REQUEST_DURATION.labels(type(handler).__name__, handler.request.method, str(status)).observe(
+        request_time
+    )
+    if status < 400:
+        log_method = access_log.info
+    elif status < 500:
+        log_method = access_log.warning
+    else:
+        log_method = access_log.error
+    log_method("%d %s %.2fms", status, handler._request_summary(), 1000.0 * request_time)
+
+
+class CacheCollector:
+    """Export the hit and miss counters and sizes of the service's caches.
+
+    ``caches`` are ``(name, cache)`` pairs of objects with a ``stats()`` method that
+    returns ``hits``, ``misses`` and ``size``.
+    """
+
+    def __init__(self, caches: Iterable[Tuple[str, object]]):
+        self.caches = list(caches)
+
+    def collect(self):
+        hits = CounterMetricFamily(
+            "course_service_cache_hits", "Lookups answered from a cache", labels=["cache"]
+        )
+        misses = CounterMetricFamily(
+            "course_service_cache_misses", "Lookups not answered from a cache", labels=["cache"]
+        )
+        size = GaugeMetricFamily(
+            "course_service_cache_entries", "Entries in a cache", labels=["cache"]
+        )
+        for name, cache in self.caches:
+            stats = cache.stats()
+            hits.add_metric([name], stats["hits"])
+            misses.add_metric([name], stats["misses"])
+            size.add_metric([name], stats["size"])
+        yield hits
+        yield misses
+        yield size
+
+
+_cache_collector: Optional[CacheCollector] = None
+
+
+def register_caches(caches: Iterable[Tuple[str, object]]):
+    """Export the stats of ``caches``, replacing the caches registered before."""
+    global _cache_collector
+    if _cache_collector is None:
+        _cache_collector = CacheCollector(caches)
+        REGISTRY.register(_cache_collector)
+    else:
+        _cache_collector.caches = list(caches)
@@ -0,0 +1,193 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional, Sequence, Tuple
+
+# (mtime_ns, size) of a roster file as reported by os.stat
+Signature = Tuple[int, int]
+
+
+def stat_signature(path: str) -> Optional[Signature]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+# Revision of an entry whose roster changed while it was being read
+STALE = object()
+
+
+class RosterCacheEntry:
+    __slots__ = ("revision", "usernames", "checked_at")
+
+    def __init__(self, revision: Hashable, usernames: Tuple[str, ...], checked_at: float):
+        self.revision = revision
+        self.usernames = usernames
+        self.checked_at = checked_at
+
+
+class RosterCache:
+    """LRU cache of parsed rosters.
+
+    Entries are trusted for ``ttl`` seconds. After that the roster is revalidated by
+    comparing its ``revision`` (e.g. the file signature from ``os.stat``) and only
+    read again with ``loader`` if the revision changed. A ``ttl`` of ``None`` trusts
+    entries until they are invalidated explicitly (e.g. by a ``RosterWatcher``).
+    ``revision`` returns None for rosters that do not exist.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[Hashable], Sequence[str]],
+        revision: Callable[[Hashable], Optional[Hashable]],
+        ttl: Optional[float] = 2.0,
+        max_entries: int = 512,
+    ):
+        self.loader = loader
+        self.revision = revision
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, RosterCacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _is_fresh(self, entry: RosterCacheEntry, now: float) -> bool:
+        return self.ttl is None or now - entry.checked_at < self.ttl
+
+    def get(self, key: Hashable, revalidate: bool = False) -> Optional[RosterCacheEntry]:
+        """Return the cache entry for a roster, or None if the roster does not exist.
+
+        ``revalidate`` skips the TTL and always checks the revision.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not revalidate and self._is_fresh(entry, now):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+        revision = self.revision(key)
+        if revision is None:
+            self.invalidate(key)
+            return None
+        if entry is not None and entry.revision == revision:
+            entry.checked_at = now
+            with self._lock:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                self.hits += 1
+            return entry
+        with self._lock:
+            self.misses += 1
+        try:
+            usernames = tuple(self.loader(key))
+        except FileNotFoundError:
+            self.invalidate(key)
+            return None
+        # Check again so a write racing with the read is picked up on the next lookup
+        if self.revision(key) != revision:
+            revision = STALE
+        return self._store(key, RosterCacheEntry(revision, usernames, now))
+
+    def put(self, key: Hashable, usernames: Sequence[str]) -> Optional[RosterCacheEntry]:
+        """Store the contents of a roster we just wrote ourselves."""
+        revision = self.revision(key)
+        if revision is None:
+            self.invalidate(key)
+            return None
+        return self._store(key, RosterCacheEntry(revision, tuple(usernames), time.monotonic()))
+
+    def _store(self, key: Hashable, entry: RosterCacheEntry) -> RosterCacheEntry:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RosterWatcher:
+    """Watch ``base_path/<course>/<kind>/`` with inotify and report changed rosters.
+
+    Requires the optional ``inotify_simple`` package and Linux.
+    """
+
+    def __init__(self, base_path: str, on_change: Callable[[str], None], logger):
+        import inotify_simple
+
+        self.base_path = base_path
+        self.on_change = on_change
+        self.logger = logger
+        self._flags = inotify_simple.flags
+        self._inotify = inotify_simple.INotify()
+        self._watches = {}
+        self._mask = (
+            self._flags.CREATE
+            | self._flags.DELETE
+            | self._flags.CLOSE_WRITE
+            | self._flags.MOVED_FROM
+            | self._flags.MOVED_TO
+            | self._flags.DELETE_SELF
+        )
+        self._thread = threading.Thread(target=self._run, name="roster-watcher", daemon=True)
+        self._stopped = threading.Event()
+
+    def _add_watch(self, path: str, depth: int):
+        try:
+            wd = self._inotify.add_watch(path, self._mask)
+        except OSError as e:
+            self.logger.error(f"Could not watch {path}: {e}")
+            return
+        self._watches[wd] = (path, depth)
+        if depth < 2:
+            for entry in os.scandir(path):
+                if entry.is_dir():
+                    self._add_watch(entry.path, depth + 1)
+
+    def start(self):
+        self._add_watch(self.base_path, 0)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._inotify.close()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                events = self._inotify.read(timeout=1000)
+            except (OSError, ValueError):
+                return
+            for event in events:
+                if event.wd not in self._watches:
+                    continue
+                parent, depth = self._watches[event.wd]
+                if event.mask & self._flags.DELETE_SELF:
+                    del self._watches[event.wd]
+                    continue
+                path = os.path.join(parent, event.name)
+                if event.mask & self._flags.ISDIR:
+                    if depth < 2 and event.mask & (self._flags.CREATE | self._flags.MOVED_TO):
+                        self._add_watch(path, depth + 1)
+                    # A course or kind directory appeared or disappeared
+                    self.on_change(path)
+                elif depth == 2 and path.endswith(".csv"):
+                    self.on_change(path)
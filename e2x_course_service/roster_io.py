@@ -0,0 +1,215 @@
+"""Read and write roster CSV files with the standard library csv module.
+
+A roster is a CSV file with a header row that contains at least a ``Username`` column.
+Other columns are preserved when members are removed and left empty for new members.
+"""
+
+import codecs
+import contextlib
+import csv
+import os
+import re
+import shutil
+import tempfile
+from typing import Collection, Iterable, Iterator, List, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+USERNAME_COLUMN = "Username"
+
+# No whitespace and no slashes, usernames end up in URLs and file paths
+USERNAME_PATTERN = re.compile(r"[^\s/]{1,255}")
+
+
+def is_valid_username(username: str) -> bool:
+    return USERNAME_PATTERN.fullmatch(username) is not None
+
+
+def _username_index(header: List[str], path: str) -> int:
+    try:
+        return [column.strip() for column in header].index(USERNAME_COLUMN)
+    except ValueError:
+        raise ValueError(f"Roster {path} has no {USERNAME_COLUMN} column") from None
+
+
+def iter_usernames(path: str) -> Iterator[str]:
+    """Stream the usernames of a roster file row by row."""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        idx = _username_index(header, path)
+        for row in reader:
+            if len(row) <= idx:
+                continue
+            username = row[idx].strip()
+            if username:
+                yield username
+
+
+def read_usernames(path: str) -> List[str]:
+    return list(iter_usernames(path))
+
+
+class UsernameStreamParser:
+    """Parse roster CSV data that arrives in chunks, e.g. an upload.
+
+    ``feed`` returns the ``(line number, username)`` pairs of all rows that were
+    completed by the chunk, ``close`` those of a last row without a line break.
+    Values are stripped and empty usernames skipped. A single column without a
+    ``Username`` header is read as a plain list of usernames. Fields must not
+    contain line breaks.
+    """
+
+    def __init__(self, name: str = "upload"):
+        self.name = name
+        self.line = 0
+        self._decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        self._buffer = ""
+        self._idx = None
+
+    def feed(self, data: bytes) -> List[Tuple[int, str]]:
+        lines = (self._buffer + self._decoder.decode(data)).split("\n")
+        self._buffer = lines.pop()
+        return self._parse(lines)
+
+    def close(self) -> List[Tuple[int, str]]:
+        rest = self._buffer + self._decoder.decode(b"", final=True)
+        self._buffer = ""
+        return self._parse([rest] if rest else [])
+
+    def _parse(self, lines: List[str]) -> List[Tuple[int, str]]:
+        usernames = []
+        for row in csv.reader(lines):
+            self.line += 1
+            if self._idx is None:
+                if len(row) == 1 and row[0].strip() != USERNAME_COLUMN:
+                    self._idx = 0
+                else:
+                    self._idx = _username_index(row, self.name)
+                    continue
+            if len(row) <= self._idx:
+                continue
+            username = row[self._idx].strip()
+            if username:
+                usernames.append((self.line, username))
+        return usernames
+
+
+def _ends_with_newline(f) -> bool:
+    f.seek(0, os.SEEK_END)
+    if f.tell() == 0:
+        return True
+    f.seek(-1, os.SEEK_END)
+    return f.read(1) in (b"\n", b"\r")
+
+
+def append_usernames(path: str, usernames: Iterable[str]):
+    """Atomically append new members to a roster without parsing the existing rows.
+
+    The existing rows are copied unchanged into a temporary file that replaces the
+    roster, so readers never see a partly written row.
+    """
+    with open(path, "rb") as f:
+        needs_newline = not _ends_with_newline(f)
+    with open(path, newline="", encoding="utf-8") as src, atomic_write(path) as dst:
+        header_line = src.readline()
+        header = next(csv.reader([header_line.lstrip("\ufeff")]), None)
+        dst.write(header_line)
+        shutil.copyfileobj(src, dst)
+        writer = csv.writer(dst, lineterminator="\n")
+        if not header:
+            header = [USERNAME_COLUMN]
+            writer.writerow(header)
+        elif needs_newline:
+            dst.write("\n")
+        _write_rows(writer, header, _username_index(header, path), usernames)
+
+
+def _write_rows(writer, header: List[str], idx: int, usernames: Iterable[str]):
+    for username in usernames:
+        row = [""] * len(header)
+        row[idx] = username
+        writer.writerow(row)
+
+
+@contextlib.contextmanager
+def roster_lock(path: str):
+    """Hold an exclusive lock on a roster across processes.
+
+    The lock is taken on a hidden sidecar file, because atomic rewrites replace the
+    roster file itself.
+    """
+    if fcntl is None:
+        yield
+        return
+    directory, name = os.path.split(path)
+    with open(os.path.join(directory, f".{name}.lock"), "a") as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+@contextlib.contextmanager
+def atomic_write(path: str):
+    """Write to a temporary file next to ``path`` and move it into place on success."""
+    directory, name = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", newline="", encoding="utf-8") as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o777)
+        except FileNotFoundError:
+            pass
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(tmp_path)
+        raise
+
+
+def rewrite_roster(path: str, remove: Collection[str], add: Iterable[str] = ()) -> List[str]:
+    """Atomically rewrite a roster without ``remove`` and with ``add`` appended.
+
+    Returns the usernames that were removed.
+    """
+    removed = []
+    with open(path, newline="", encoding="utf-8") as src, atomic_write(path) as dst:
+        reader = csv.reader(src)
+        writer = csv.writer(dst, lineterminator="\n")
+        header = next(reader, None) or [USERNAME_COLUMN]
+        # Keep the byte order mark of rosters saved by e.g. Excel, like append_usernames
+        if header[0].startswith("\ufeff"):
+            header[0] = header[0][1:]
+            dst.write("\ufeff")
+        idx = _username_index(header, path)
+        writer.writerow(header)
+        for row in reader:
+            if len(row) > idx and row[idx].strip() in remove:
+                removed.append(row[idx].strip())
+                continue
+            writer.writerow(row)
+        _write_rows(writer, header, idx, add)
+    return removed
+
+
+def write_usernames(path: str, usernames: Iterable[str]):
+    """Atomically create or overwrite a roster that only has a ``Username`` column."""
+    with atomic_write(path) as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow([USERNAME_COLUMN])
+        _write_rows(writer, [USERNAME_COLUMN], 0, usernames)
+
+
+def remove_usernames(path: str, usernames: Collection[str]) -> List[str]:
+    """Rewrite a roster without the given members. Returns the removed usernames."""
+    return rewrite_roster(path, usernames)
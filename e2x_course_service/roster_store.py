@@ -0,0 +1,375 @@
+"""Storage backends for course rosters.
+
+A roster is the list of usernames of one role (``student`` or ``grader``) in one
+course and semester, identified by a ``RosterKey``. Every backend exposes a cheap
+revision per roster that changes whenever the roster changes, so callers can cache
+parsed rosters and only read them again when their revision changed.
+"""
+
+import contextlib
+import glob
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, ContextManager, Dict, Hashable, List, Optional, Sequence, Set, Tuple
+
+from . import roster_io
+from .metrics import ROSTER_READ_BYTES, ROSTER_READ_DURATION
+from .roster_cache import RosterWatcher, stat_signature
+
+KINDS = ("student", "grader")
+
+# (course_id, semester, kind)
+RosterKey = Tuple[str, str, str]
+
+
+class RosterStore:
+    """Interface of a roster storage backend."""
+
+    def describe(self, key: RosterKey) -> str:
+        """Human readable location of a roster for log messages."""
+        raise NotImplementedError
+
+    def revisions(self) -> Dict[RosterKey, Hashable]:
+        """Revisions of all rosters in the store."""
+        raise NotImplementedError
+
+    def revision(self, key: RosterKey) -> Optional[Hashable]:
+        """Revision of one roster, or None if it does not exist."""
+        raise NotImplementedError
+
+    def read(self, key: RosterKey) -> List[str]:
+        """Usernames of a roster in stored order. Raises FileNotFoundError if it is missing."""
+        raise NotImplementedError
+
+    def modified(self, revision: Hashable) -> Optional[float]:
+        """Modification time of a roster revision as a timestamp, if the store knows it."""
+        return None
+
+    def generation(self) -> Optional[Hashable]:
+        """Token that changes whenever a roster is written through this store, in any process.
+
+        Lets processes sharing the rosters notice each other's writes without checking
+        every roster. None if the store does not keep one.
+        """
+        return None
+
+    def lock(self, key: RosterKey) -> ContextManager:
+        """Exclusive lock on a roster that is held while it is read and written."""
+        raise NotImplementedError
+
+    def write(self, key: RosterKey, add: Sequence[str], remove: Set[str]):
+        """Append ``add`` to and drop ``remove`` from an existing roster, with the lock held."""
+        raise NotImplementedError
+
+    def replace(self, key: RosterKey, usernames: Sequence[str]):
+        """Create a roster or overwrite all of its members."""
+        raise NotImplementedError
+
+    def delete(self, key: RosterKey):
+        raise NotImplementedError
+
+    def watch(self, on_change: Callable[[Optional[RosterKey]], None], logger) -> bool:
+        """Push change notifications to ``on_change``. Returns False if not supported.
+
+        ``on_change`` receives the key of the changed roster or None if it is unknown.
+        """
+        logger.warning(f"{type(self).__name__} does not report changes, using polling")
+        return False
+
+    def close(self):
+        pass
+
+
+class CSVRosterStore(RosterStore):
+    """One CSV file per roster at ``base_path/<course_id>/<kind>/<course_id>-<semester>.csv``.
+
+    The revision of a roster is the mtime and size of its file. Every write also replaces
+    ``base_path/.roster_generation`` with a new random token.
+    """
+
+    def __init__(self, base_path: str):
+        self.base_path = base_path
+        self.generation_path = os.path.join(base_path, ".roster_generation")
+        self._watcher = None
+
+    def path(self, key: RosterKey) -> str:
+        course_id, semester, kind = key
+        return os.path.join(self.base_path, course_id, kind, f"{course_id}-{semester}.csv")
+
+    def parse_path(self, path: str) -> Optional[RosterKey]:
+        kind = os.path.basename(os.path.dirname(path))
+        if kind not in KINDS:
+            return None
+        course_name = os.path.basename(path).replace(".csv", "")
+        if "-" not in course_name:
+            return None
+        course_id, semester = course_name.split("-", 1)
+        return course_id, semester, kind
+
+    def describe(self, key: RosterKey) -> str:
+        return self.path(key)
+
+    def revisions(self) -> Dict[RosterKey, Hashable]:
+        revisions = {}
+        for p in glob.glob(os.path.join(self.base_path, "*/*/*.csv")):
+            key = self.parse_path(p)
+            if key is None:
+                continue
+            revision = stat_signature(p)
+            if revision is not None:
+                revisions[key] = revision
+        return revisions
+
+    def revision(self, key: RosterKey) -> Optional[Hashable]:
+        return stat_signature(self.path(key))
+
+    def modified(self, revision: Hashable) -> Optional[float]:
+        return revision[0] / 1e9 if isinstance(revision, tuple) else None
+
+    def generation(self) -> Optional[Hashable]:
+        try:
+            with open(self.generation_path, encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _bump_generation(self):
+        # A token rather than the file's mtime, which may not change between two quick writes
+        with roster_io.atomic_write(self.generation_path) as f:
+            f.write(uuid.uuid4().hex)
+
+    def read(self, key: RosterKey) -> List[str]:
+        path = self.path(key)
+        start = time.perf_counter()
+        size = os.path.getsize(path)
+        usernames = roster_io.read_usernames(path)
+        ROSTER_READ_DURATION.labels("csv").observe(time.perf_counter() - start)
+        ROSTER_READ_BYTES.inc(size)
+        return usernames
+
+    def lock(self, key: RosterKey) -> ContextManager:
+        return roster_io.roster_lock(self.path(key))
+
+    def write(self, key: RosterKey, add: Sequence[str], remove: Set[str]):
+        if remove:
+            roster_io.rewrite_roster(self.path(key), remove, add)
+        elif add:
+            roster_io.append_usernames(self.path(key), add)
+        else:
+            return
+        self._bump_generation()
+
+    def replace(self, key: RosterKey, usernames: Sequence[str]):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        roster_io.write_usernames(path, usernames)
+        self._bump_generation()
+
+    def delete(self, key: RosterKey):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.path(key))
+        self._bump_generation()
+
+    def watch(self, on_change: Callable[[Optional[RosterKey]], None], logger) -> bool:
+        try:
+            self._watcher = RosterWatcher(
+                self.base_path, lambda path: on_change(self.parse_path(path)), logger
+            )
+            self._watcher.start()
+        except (ImportError, OSError) as e:
+            self._watcher = None
+            logger.warning(f"inotify roster watcher not available, using stat polling: {e}")
+            return False
+        return True
+
+    def close(self):
+        if self._watcher is not None:
+            self._watcher.stop()
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rosters (
+    course_id TEXT NOT NULL,
+    semester TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    revision INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (course_id, semester, kind)
+);
+CREATE TABLE IF NOT EXISTS members (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    course_id TEXT NOT NULL,
+    semester TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    username TEXT NOT NULL,
+    FOREIGN KEY (course_id, semester, kind)
+        REFERENCES rosters (course_id, semester, kind) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS members_roster ON members (course_id, semester, kind);
+CREATE INDEX IF NOT EXISTS members_username ON members (username);
+CREATE TABLE IF NOT EXISTS generation (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO generation (id, value) VALUES (0, 0);
+"""
+
+
+class SQLiteRosterStore(RosterStore):
+    """All rosters in one SQLite database in WAL mode.
+
+    The revision of a roster is a counter that is incremented by every write, the
+    generation a counter that is incremented by writes to any roster.
+    """
+
+    def __init__(self, db_path: str, timeout: float = 30):
+        self.db_path = db_path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._conn.executescript(SQLITE_SCHEMA)
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # check_same_thread is off only so close() can close the connections of all threads
+            conn = sqlite3.connect(
+                self.db_path, timeout=self.timeout, isolation_level=None, check_same_thread=False
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+            self._local.depth = 0
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """Write transaction on this thread's connection. Nested calls join the outer one."""
+        conn = self._conn
+        if self._local.depth == 0:
+            conn.execute("BEGIN IMMEDIATE")
+        self._local.depth += 1
+        try:
+            yield conn
+        except BaseException:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                conn.execute("ROLLBACK")
+            raise
+        else:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                conn.execute("COMMIT")
+
+    def describe(self, key: RosterKey) -> str:
+        course_id, semester, kind = key
+        return f"{self.db_path}:{course_id}-{semester}/{kind}"
+
+    def revisions(self) -> Dict[RosterKey, Hashable]:
+        rows = self._conn.execute("SELECT course_id, semester, kind, revision FROM rosters")
+        return {(c, s, k): revision for c, s, k, revision in rows}
+
+    def revision(self, key: RosterKey) -> Optional[Hashable]:
+        row = self._conn.execute(
+            "SELECT revision FROM rosters WHERE course_id = ? AND semester = ? AND kind = ?", key
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def generation(self) -> Optional[Hashable]:
+        return self._conn.execute("SELECT value FROM generation").fetchone()[0]
+
+    def read(self, key: RosterKey) -> List[str]:
+        start = time.perf_counter()
+        if self.revision(key) is None:
+            raise FileNotFoundError(self.describe(key))
+        rows = self._conn.execute(
+            "SELECT username FROM members WHERE course_id = ? AND semester = ? AND kind = ? "
+            "ORDER BY id",
+            key,
+        )
+        usernames = [username for (username,) in rows]
+        ROSTER_READ_DURATION.labels("sqlite").observe(time.perf_counter() - start)
+        return usernames
+
+    def lock(self, key: RosterKey) -> ContextManager:
+        # SQLite allows one writer at a time, across threads and processes
+        return self._transaction()
+
+    def _bump(self, conn: sqlite3.Connection, key: RosterKey):
+        conn.execute(
+            "UPDATE rosters SET revision = revision + 1 "
+            "WHERE course_id = ? AND semester = ? AND kind = ?",
+            key,
+        )
+        conn.execute("UPDATE generation SET value = value + 1")
+
+    def write(self, key: RosterKey, add: Sequence[str], remove: Set[str]):
+        with self._transaction() as conn:
+            if remove:
+                conn.executemany(
+                    "DELETE FROM members "
+                    "WHERE course_id = ? AND semester = ? AND kind = ? AND username = ?",
+                    [(*key, username) for username in remove],
+                )
+            conn.executemany(
+                "INSERT INTO members (course_id, semester, kind, username) VALUES (?, ?, ?, ?)",
+                [(*key, username) for username in add],
+            )
+            self._bump(conn, key)
+
+    def replace(self, key: RosterKey, usernames: Sequence[str]):
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO rosters (course_id, semester, kind) VALUES (?, ?, ?)", key
+            )
+            conn.execute(
+                "DELETE FROM members WHERE course_id = ? AND semester = ? AND kind = ?", key
+            )
+            conn.executemany(
+                "INSERT INTO members (course_id, semester, kind, username) VALUES (?, ?, ?, ?)",
+                [(*key, username) for username in usernames],
+            )
+            self._bump(conn, key)
+
+    def delete(self, key: RosterKey):
+        with self._transaction() as conn:
+            conn.execute(
+                "DELETE FROM rosters WHERE course_id = ? AND semester = ? AND kind = ?", key
+            )
+            conn.execute("UPDATE generation SET value = value + 1")
+
+    def close(self):
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+
+def sync_stores(source: RosterStore, target: RosterStore, prune: bool = False) -> Dict[str, int]:
+    """Copy every roster of ``source`` into ``target``.
+
+    Rosters whose members are already identical are left untouched. With ``prune``,
+    rosters that only exist in ``target`` are deleted.
+    """
+    stats = {"copied": 0, "unchanged": 0, "deleted": 0}
+    target_revisions = target.revisions()
+    for key in sorted(source.revisions()):
+        usernames = source.read(key)
+        if key in target_revisions and target.read(key) == usernames:
+            stats["unchanged"] += 1
+            continue
+        target.replace(key, usernames)
+        stats["copied"] += 1
+    if prune:
+        for key in set(target_revisions) - set(source.revisions()):
+            target.delete(key)
+            stats["deleted"] += 1
+    return stats
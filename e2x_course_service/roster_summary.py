@@ -0,0 +1,103 @@
+"""Per-roster summaries persisted in a sidecar file.
+
+A summary records the member count and a checksum of a roster together with the store
+revision it was computed from. It stays valid as long as the roster's revision is
+unchanged, so rosters do not have to be read to count their members.
+"""
+
+import hashlib
+import json
+from typing import Dict, Hashable, Sequence
+
+from . import roster_io
+from .roster_store import RosterKey
+
+
+def roster_checksum(usernames: Sequence[str]) -> str:
+    return hashlib.sha256("\n".join(usernames).encode("utf-8")).hexdigest()
+
+
+class RosterSummary:
+    __slots__ = ("revision", "count", "checksum", "modified")
+
+    def __init__(self, revision: Hashable, count: int, checksum: str, modified: float):
+        self.revision = revision
+        self.count = count
+        self.checksum = checksum
+        self.modified = modified
+
+    def to_dict(self) -> dict:
+        return {"count": self.count, "checksum": self.checksum, "modified": self.modified}
+
+
+def _encode_revision(revision: Hashable):
+    if isinstance(revision, tuple):
+        return list(revision)
+    if isinstance(revision, (int, str)):
+        return revision
+    # e.g. the revision of a cache entry that changed while it was read
+    return None
+
+
+def _decode_revision(revision) -> Hashable:
+    return tuple(revision) if isinstance(revision, list) else revision
+
+
+class SummaryFile:
+    """Load and save roster summaries as JSON, e.g. ``course_base_path/.roster_summaries.json``.
+
+    The file is only a cache: a missing, unreadable or outdated file costs reading the
+    rosters again but never leads to wrong counts.
+    """
+
+    version = 1
+
+    def __init__(self, path: str, logger):
+        self.path = path
+        self.logger = logger
+
+    def load(self) -> Dict[RosterKey, RosterSummary]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Ignoring roster summaries in {self.path}: {e}")
+            return {}
+        if not isinstance(data, dict) or data.get("version") != self.version:
+            return {}
+        summaries = {}
+        for item in data.get("rosters", []):
+            try:
+                key = (item["course_id"], item["semester"], item["kind"])
+                summaries[key] = RosterSummary(
+                    _decode_revision(item["revision"]),
+                    int(item["count"]),
+                    item["checksum"],
+                    float(item["modified"]),
+                )
+            except (KeyError, TypeError, ValueError):
+                continue
+        return summaries
+
+    def save(self, summaries: Dict[RosterKey, RosterSummary]):
+        rosters = []
+        for (course_id, semester, kind), summary in sorted(summaries.items()):
+            revision = _encode_revision(summary.revision)
+            if revision is None:
+                continue
+            rosters.append(
+                {
+                    "course_id": course_id,
+                    "semester": semester,
+                    "kind": kind,
+                    "revision": revision,
+                    **summary.to_dict(),
+                }
+            )
+        try:
+            with roster_io.atomic_write(self.path) as f:
+                json.dump({"version": self.version, "rosters": rosters}, f)
+        except OSError as e:
+            self.logger.warning(f"Could not save roster summaries to {self.path}: {e}")
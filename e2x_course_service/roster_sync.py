@@ -0,0 +1,72 @@
+import os
+
+from traitlets import Bool, CaselessStrEnum, Unicode
+from traitlets.config import Application
+
+from .roster_store import CSVRosterStore, SQLiteRosterStore, sync_stores
+
+
+class RosterSyncApp(Application):
+    """Copy rosters between the CSV files and the SQLite roster database.
+
+    ``import`` copies the CSV files into the database, ``export`` writes the database
+    back to CSV files.
+    """
+
+    name = "e2x-roster-sync"
+    description = "Copy rosters between CSV files and the SQLite roster database"
+
+    course_base_path = Unicode(help="The base path where the roster CSV files are stored").tag(
+        config=True
+    )
+
+    roster_db_path = Unicode(
+        "",
+        help="Path of the SQLite roster database. Defaults to course_base_path/rosters.sqlite",
+    ).tag(config=True)
+
+    direction = CaselessStrEnum(
+        ["import", "export"],
+        default_value="import",
+        help="'import' copies CSV files into the database, 'export' the database into CSV files",
+    ).tag(config=True)
+
+    prune = Bool(False, help="Delete rosters from the target that do not exist in the source").tag(
+        config=True
+    )
+
+    aliases = {
+        "course-base-path": "RosterSyncApp.course_base_path",
+        "db": "RosterSyncApp.roster_db_path",
+        "direction": "RosterSyncApp.direction",
+        "log-level": "Application.log_level",
+    }
+
+    flags = {
+        "prune": ({"RosterSyncApp": {"prune": True}}, prune.help),
+    }
+
+    def start(self):
+        if not self.course_base_path:
+            self.log.error("course_base_path is required")
+            self.exit(1)
+        base_path = os.path.abspath(self.course_base_path)
+        csv_store = CSVRosterStore(base_path)
+        db_store = SQLiteRosterStore(
+            self.roster_db_path or os.path.join(base_path, "rosters.sqlite")
+        )
+        try:
+            if self.direction == "import":
+                stats = sync_stores(csv_store, db_store, prune=self.prune)
+            else:
+                stats = sync_stores(db_store, csv_store, prune=self.prune)
+        finally:
+            db_store.close()
+        self.log.warning(
+            f"Roster {self.direction}: {stats['copied']} copied, "
+            f"{stats['unchanged']} unchanged, {stats['deleted']} deleted"
+        )
+
+
+if __name__ == "__main__":
+    RosterSyncApp.launch_instance()
@@ -0,0 +1,104 @@
+import threading
+from collections import defaultdict
+from concurrent.futures import Future
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from .roster_store import RosterKey, RosterStore
+
+
+class RosterChange:
+    """A queued membership change for one roster."""
+
+    __slots__ = ("add", "remove", "future")
+
+    def __init__(self, add: Iterable[str], remove: Iterable[str]):
+        self.add = list(add)
+        self.remove = list(remove)
+        self.future: Future = Future()
+
+
+class RosterWriter:
+    """Serialize and coalesce writes to rosters.
+
+    Writers for the same roster are serialized with a per-roster thread lock and the
+    store's lock for other processes. Changes that queue up while a roster is being
+    written are applied together in the next write, so a burst of enrollments
+    rewrites a roster once instead of once per request.
+
+    ``load`` returns the current usernames of a roster and is called while the lock
+    is held. ``on_written`` receives the new usernames and the usernames that were added
+    and removed after every write, also while the lock is held, so caches and the change
+    log are updated in the same order the writes happened.
+    """
+
+    def __init__(
+        self,
+        store: RosterStore,
+        load: Callable[[RosterKey], Sequence[str]],
+        on_written: Callable[[RosterKey, Sequence[str], List[str], List[str]], None],
+    ):
+        self.store = store
+        self.load = load
+        self.on_written = on_written
+        self._pending: Dict[RosterKey, List[RosterChange]] = defaultdict(list)
+        self._locks: Dict[RosterKey, threading.Lock] = defaultdict(threading.Lock)
+        self._guard = threading.Lock()
+
+    def submit(
+        self, key: RosterKey, add: Iterable[str] = (), remove: Iterable[str] = ()
+    ) -> Tuple[List[str], List[str]]:
+        """Apply a change to a roster.
+
+        Returns the usernames that were actually added and removed by this change.
+        """
+        change = RosterChange(add, remove)
+        with self._guard:
+            self._pending[key].append(change)
+            lock = self._locks[key]
+        with lock:
+            # Another thread may have applied our change as part of its batch
+            if not change.future.done():
+                with self._guard:
+                    batch = self._pending.pop(key, [])
+                self._apply(key, batch)
+        return change.future.result()
+
+    def _apply(self, key: RosterKey, batch: List[RosterChange]):
+        try:
+            with self.store.lock(key):
+                current = list(self.load(key))
+                initial = set(current)
+                members = set(initial)
+                # Replay the changes in order to report what each of them did
+                results = []
+                added_order = []
+                for change in batch:
+                    added, removed = [], []
+                    for username in change.remove:
+                        if username in members:
+                            members.discard(username)
+                            removed.append(username)
+                    for username in change.add:
+                        if username not in members:
+                            members.add(username)
+                            added.append(username)
+                            added_order.append(username)
+                    results.append((added, removed))
+                to_remove = initial - members
+                to_add = [
+                    u for u in dict.fromkeys(added_order) if u in members and u not in initial
+                ]
+                if to_remove or to_add:
+                    self.store.write(key, to_add, to_remove)
+                    self.on_written(
+                        key,
+                        [u for u in current if u not in to_remove] + to_add,
+                        to_add,
+                        [u for u in current if u in to_remove],
+                    )
+        except BaseException as e:
+            for change in batch:
+                change.future.set_exception(e)
+        else:
+            for change, result in zip(batch, results):
+                change.future.set_result(result)
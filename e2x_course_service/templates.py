@@ -0,0 +1,38 @@
+"""Jinja2 templates of the page handlers.
+
+jinja2 is only imported when the first page is rendered or the templates are warmed up
+after the service started listening. Compiled templates are kept in a bytecode cache,
+so a restarted service does not compile them again.
+"""
+
+import threading
+
+
+class Templates:
+    def __init__(self, template_path: str, cache_path: str = ""):
+        self.template_path = template_path
+        self.cache_path = cache_path
+        self._env = None
+        self._lock = threading.Lock()
+
+    @property
+    def env(self):
+        with self._lock:
+            if self._env is None:
+                from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+                # Without a directory jinja2 uses a private directory in the temp directory
+                self._env = Environment(
+                    loader=FileSystemLoader(self.template_path),
+                    bytecode_cache=FileSystemBytecodeCache(self.cache_path or None),
+                )
+            return self._env
+
+    def get_template(self, name: str):
+        return self.env.get_template(name)
+
+    def warm_up(self):
+        """Load, and if not cached yet compile, all templates."""
+        env = self.env
+        for name in env.list_templates():
+            env.get_template(name)
@@ -0,0 +1,59 @@
+"""Starting and stopping CourseServiceApp."""
+
+import asyncio
+import json
+import logging
+import os
+import signal
+import socket
+import tempfile
+import unittest
+
+from e2x_course_service import roster_io
+from e2x_course_service.app import CourseServiceApp
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class StopTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        for kind in ("grader", "student"):
+            path = os.path.join(self.tmp.name, "c1", kind, "c1-ws24.csv")
+            os.makedirs(os.path.dirname(path))
+            roster_io.write_usernames(path, ["g1"] if kind == "grader" else [])
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            self.addCleanup(signal.signal, signum, signal.getsignal(signum))
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self.addCleanup(asyncio.set_event_loop, None)
+        self.addCleanup(loop.close)
+
+    def test_sigterm_saves_summaries_and_closes_the_store(self):
+        port = free_port()
+        app = CourseServiceApp(
+            course_base_path=self.tmp.name,
+            api_token="service",
+            service_prefix="/services/course/",
+            port=port,
+            log_level=logging.ERROR,
+        )
+        app.initialize([])
+        manager = app.tornado_settings["course_manager"].manager
+        closed = []
+        manager.store.close = lambda: closed.append(True)
+        # Not saved until the next refresh of the index
+        manager.add_members_to_course(["s1", "s2"], "c1", "ws24", "student")
+        asyncio.get_event_loop().call_later(0.1, os.kill, os.getpid(), signal.SIGTERM)
+        app.start()
+        with open(os.path.join(self.tmp.name, ".roster_summaries.json"), encoding="utf-8") as f:
+            counts = {r["kind"]: r["count"] for r in json.load(f)["rosters"]}
+        self.assertEqual(counts, {"grader": 1, "student": 2})
+        self.assertEqual(closed, [True])
+        with self.assertRaises(ConnectionRefusedError):
+            socket.create_connection(("127.0.0.1", port)).close()
@@ -0,0 +1,97 @@
+"""The shared authentication cache of BaseHandler with HubOAuth and a stubbed Hub."""
+
+from jupyterhub.services.auth import HubOAuth
+from tornado import web
+from tornado.testing import AsyncHTTPTestCase
+
+from e2x_course_service.handlers.base import BaseHandler
+from e2x_course_service.ttl_cache import TTLCache
+
+COOKIE_SECRET = b"test-secret"
+USERS = {"api-token": "carol", "cookie-token": "alice"}
+
+
+class StubHubOAuth(HubOAuth):
+    """Identifies the tokens in USERS without asking a Hub and counts the lookups."""
+
+    lookups = 0
+
+    def user_for_token(self, token, use_cache=True, session_id="", *, sync=True):
+        StubHubOAuth.lookups += 1
+        name = USERS.get(token)
+        model = {"name": name, "kind": "user", "scopes": []} if name else None
+
+        async def result():
+            return model
+
+        return model if sync else result()
+
+
+class WhoAmIHandler(BaseHandler):
+    hub_auth_class = StubHubOAuth
+    allow_all = True
+
+    @web.authenticated
+    def get(self):
+        self.write(self.get_current_user()["name"])
+
+    @web.authenticated
+    def put(self):
+        self.write(self.get_current_user()["name"])
+
+
+class AuthCacheTest(AsyncHTTPTestCase):
+    def get_app(self):
+        StubHubOAuth.lookups = 0
+        # Other test modules use their own HubOAuth stub as the singleton
+        HubOAuth.clear_instance()
+        self.hub_auth = StubHubOAuth.instance(
+            api_token="service",
+            api_url="http://127.0.0.1:1/hub/api",
+            oauth_client_id="service-course",
+        )
+        self.auth_cache = TTLCache(ttl=60, max_entries=16)
+        return web.Application(
+            [(r"/whoami", WhoAmIHandler)],
+            auth_cache=self.auth_cache,
+            cookie_secret=COOKIE_SECRET,
+        )
+
+    def cookie_headers(self, **headers):
+        name = self.hub_auth.cookie_name
+        value = web.create_signed_value(COOKIE_SECRET, name, "cookie-token")
+        return {"Cookie": f"{name}={value.decode()}", **headers}
+
+    def test_api_tokens_are_cached(self):
+        headers = {"Authorization": "token api-token"}
+        for _ in range(3):
+            response = self.fetch("/whoami", headers=headers)
+            self.assertEqual(response.body, b"carol")
+        self.assertEqual(StubHubOAuth.lookups, 1)
+        self.assertEqual(self.auth_cache.hits, 2)
+
+    def test_invalid_api_token_is_not_cached(self):
+        response = self.fetch(
+            "/whoami", headers={"Authorization": "token wrong"}, follow_redirects=False
+        )
+        self.assertNotEqual(response.code, 200)
+        self.assertEqual(len(self.auth_cache), 0)
+
+    def test_cookies_are_not_cached(self):
+        response = self.fetch("/whoami", headers=self.cookie_headers())
+        self.assertEqual(response.body, b"alice")
+        self.assertEqual(len(self.auth_cache), 0)
+
+    def test_cross_site_put_with_cookie_is_rejected_after_get(self):
+        response = self.fetch("/whoami", headers=self.cookie_headers())
+        self.assertEqual(response.code, 200)
+        response = self.fetch(
+            "/whoami",
+            method="PUT",
+            body="{}",
+            headers=self.cookie_headers(
+                **{"Sec-Fetch-Mode": "cors", "Sec-Fetch-Site": "cross-site"}
+            ),
+            follow_redirects=False,
+        )
+        self.assertEqual(response.code, 403)
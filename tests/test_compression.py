@@ -0,0 +1,71 @@
+"""Content encoding negotiation and JSON encoding of API responses."""
+
+import gzip
+import json
+import unittest
+from unittest import mock
+
+from tornado import web
+from tornado.testing import AsyncHTTPTestCase
+
+from e2x_course_service.handlers import base, compression
+from e2x_course_service.handlers.compression import BrotliContentEncoding, accepts_encoding
+
+MEMBERS = {f"user{i}-ü": ["student"] for i in range(200)}
+
+
+class AcceptsEncodingTest(unittest.TestCase):
+    def test_q_values(self):
+        self.assertTrue(accepts_encoding("gzip, deflate, br", "br"))
+        self.assertTrue(accepts_encoding("BR;q=0.5", "br"))
+        self.assertFalse(accepts_encoding("br;q=0, gzip", "br"))
+        self.assertFalse(accepts_encoding("br;q=0.000", "br"))
+        self.assertFalse(accepts_encoding("gzip", "br"))
+        self.assertFalse(accepts_encoding("", "br"))
+
+
+class MembersHandler(base.BaseAPIHandler):
+    def get(self):
+        self.finish_json({"members": MEMBERS})
+
+
+class CompressionTest(AsyncHTTPTestCase):
+    def get_app(self):
+        app = web.Application([(r"/members", MembersHandler)], compress_response=True)
+        app.transforms.insert(0, BrotliContentEncoding)
+        return app
+
+    def fetch_members(self, accept_encoding):
+        response = self.fetch(
+            "/members",
+            headers={"Accept-Encoding": accept_encoding},
+            decompress_response=False,
+        )
+        self.assertEqual(response.code, 200)
+        return response
+
+    @unittest.skipIf(compression.brotli is None, "brotli is not installed")
+    def test_brotli(self):
+        response = self.fetch_members("gzip, br")
+        self.assertEqual(response.headers["Content-Encoding"], "br")
+        self.assertEqual(
+            json.loads(compression.brotli.decompress(response.body)), {"members": MEMBERS}
+        )
+
+    def test_refused_brotli_falls_back_to_gzip(self):
+        response = self.fetch_members("br;q=0, gzip")
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(json.loads(gzip.decompress(response.body)), {"members": MEMBERS})
+
+    def test_identity(self):
+        response = self.fetch_members("identity")
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertEqual(response.headers["Vary"], "Accept-Encoding")
+
+    def test_json_fallback_matches_orjson(self):
+        if base.orjson is None:
+            self.skipTest("orjson is not installed")
+        with_orjson = self.fetch_members("identity").body
+        with mock.patch.object(base, "orjson", None):
+            without_orjson = self.fetch_members("identity").body
+        self.assertEqual(with_orjson, without_orjson)
@@ -0,0 +1,127 @@
+"""CourseManager on a small course tree of CSV rosters."""
+
+import logging
+import os
+import tempfile
+import time
+import unittest
+
+from e2x_course_service.course_manager import CourseManager
+
+
+def write_roster(root, course_id, semester, kind, usernames):
+    path = os.path.join(root, course_id, kind, f"{course_id}-{semester}.csv")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("Username\n" + "".join(f"{u}\n" for u in usernames))
+
+
+class CourseManagerTestCase(unittest.TestCase):
+    cache_ttl = 0.05
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.root = self.tmp.name
+        write_roster(self.root, "c1", "ws24", "grader", ["g1", "g2"])
+        write_roster(self.root, "c1", "ws24", "student", ["s1", "s2"])
+        write_roster(self.root, "c2", "ws24", "grader", ["g1"])
+        write_roster(self.root, "c2", "ws24", "student", [])
+
+    def make_manager(self, **kwargs):
+        kwargs.setdefault("cache_ttl", self.cache_ttl)
+        return CourseManager(self.root, logging.getLogger("test_course_manager"), **kwargs)
+
+
+class GraderCheckTest(CourseManagerTestCase):
+    def test_grader_check(self):
+        manager = self.make_manager()
+        self.assertTrue(manager.is_grader_for_course("g1", "c1", "ws24"))
+        self.assertFalse(manager.is_grader_for_course("s1", "c1", "ws24"))
+        self.assertFalse(manager.is_grader_for_course("g1", "c3", "ws24"))
+
+    def test_grader_removed_through_the_service(self):
+        manager = self.make_manager(cache_ttl=60)
+        self.assertTrue(manager.is_grader_for_course("g2", "c1", "ws24"))
+        manager.remove_members_from_course(["g2"], "c1", "ws24", "grader")
+        self.assertFalse(manager.is_grader_for_course("g2", "c1", "ws24"))
+
+    def test_grader_removed_outside_the_service(self):
+        manager = self.make_manager()
+        self.assertTrue(manager.is_grader_for_course("g1", "c2", "ws24"))
+        self.assertEqual(len(manager.list_grader_courses_for_user("g1")), 2)
+        write_roster(self.root, "c2", "ws24", "grader", ["g3", "g4"])
+        time.sleep(self.cache_ttl * 2)
+        self.assertFalse(manager.is_grader_for_course("g1", "c2", "ws24"))
+        self.assertTrue(manager.is_grader_for_course("g3", "c2", "ws24"))
+        self.assertEqual(
+            [c["course_id"] for c in manager.list_grader_courses_for_user("g1")], ["c1"]
+        )
+
+
+class QueryCourseMembersTest(CourseManagerTestCase):
+    def setUp(self):
+        super().setUp()
+        write_roster(self.root, "c3", "ws24", "grader", ["Bob", "carol"])
+        write_roster(self.root, "c3", "ws24", "student", ["alice", "Anna", "bob", "carol", "dave"])
+        self.manager = self.make_manager()
+
+    def query(self, **kwargs):
+        return self.manager.query_course_members("c3", "ws24", **kwargs)
+
+    def test_members_sorted_case_insensitively(self):
+        page = self.query()
+        self.assertEqual(page["total"], 6)
+        self.assertEqual(page["filtered"], 6)
+        self.assertEqual(
+            list(page["members"].items()),
+            [
+                ("alice", ["student"]),
+                ("Anna", ["student"]),
+                ("Bob", ["grader"]),
+                ("bob", ["student"]),
+                ("carol", ["grader", "student"]),
+                ("dave", ["student"]),
+            ],
+        )
+
+    def test_paging(self):
+        self.assertEqual(list(self.query(offset=1, limit=2)["members"]), ["Anna", "Bob"])
+        self.assertEqual(list(self.query(offset=4, limit=10)["members"]), ["carol", "dave"])
+        self.assertEqual(list(self.query(limit=0)["members"]), [])
+        page = self.query(offset=10, limit=2)
+        self.assertEqual(page["members"], {})
+        self.assertEqual((page["total"], page["filtered"]), (6, 6))
+
+    def test_search_with_mixed_case(self):
+        page = self.query(search=" A ")
+        self.assertEqual(list(page["members"]), ["alice", "Anna"])
+        self.assertEqual(page["filtered"], 2)
+        self.assertEqual(list(self.query(search="bO")["members"]), ["Bob", "bob"])
+        self.assertEqual(list(self.query(search="an", offset=1)["members"]), [])
+        page = self.query(search="zz")
+        self.assertEqual((page["members"], page["filtered"], page["total"]), ({}, 0, 6))
+
+    def test_role_filter(self):
+        page = self.query(role="grader")
+        self.assertEqual(page["members"], {"Bob": ["grader"], "carol": ["grader", "student"]})
+        self.assertEqual((page["total"], page["filtered"]), (6, 2))
+        page = self.query(role="student", search="b")
+        self.assertEqual(page["members"], {"bob": ["student"]})
+
+    def test_compact(self):
+        page = self.query(offset=2, limit=3, compact=True)
+        self.assertEqual(page["members"], {"student": ["bob", "carol"], "grader": ["Bob", "carol"]})
+
+    def test_listing_follows_roster_changes(self):
+        self.assertEqual(self.query(search="e")["filtered"], 0)
+        self.manager.add_members_to_course(["erin"], "c3", "ws24", "student")
+        self.assertEqual(self.query(search="e")["members"], {"erin": ["student"]})
+        write_roster(self.root, "c3", "ws24", "student", ["Eve"])
+        time.sleep(self.cache_ttl * 2)
+        self.assertEqual(self.query(search="E")["members"], {"Eve": ["student"]})
+        self.assertEqual(self.query()["total"], 3)
+
+    def test_missing_course(self):
+        page = self.manager.query_course_members("c9", "ws24", offset=5)
+        self.assertEqual(page, {"total": 0, "filtered": 0, "members": {}})
@@ -0,0 +1,166 @@
+"""HubAPI against a local fake of the JupyterHub REST API."""
+
+import json
+import time
+from types import SimpleNamespace
+
+from tornado import web
+from tornado.testing import AsyncHTTPTestCase, gen_test
+
+from e2x_course_service.hub_api import HubAPI
+
+
+class FakeHub:
+    """Users of the fake Hub and the requests it answered.
+
+    ``failures`` is a list of ``(status, headers)`` pairs that the next requests are
+    answered with, or ``always_fail`` a status that every request is answered with.
+    """
+
+    def __init__(self, users=()):
+        self.users = set(users)
+        self.requests = []
+        self.failures = []
+        self.always_fail = None
+
+
+class FakeHubHandler(web.RequestHandler):
+    def initialize(self, hub: FakeHub):
+        self.hub = hub
+
+    def check_xsrf_cookie(self):
+        pass
+
+    def prepare(self):
+        self.hub.requests.append((self.request.method, self.request.path, time.monotonic()))
+        if self.hub.always_fail is not None:
+            raise web.HTTPError(self.hub.always_fail)
+        if self.hub.failures:
+            status, self.error_headers = self.hub.failures.pop(0)
+            raise web.HTTPError(status)
+
+    def write_error(self, status_code, **kwargs):
+        # Headers set before the error are cleared by send_error
+        for name, value in getattr(self, "error_headers", {}).items():
+            self.set_header(name, value)
+        super().write_error(status_code, **kwargs)
+
+    def _check_valid(self, usernames):
+        if any(not name.isalnum() for name in usernames):
+            raise web.HTTPError(400)
+        if any(name in self.hub.users for name in usernames):
+            raise web.HTTPError(409)
+        self.hub.users.update(usernames)
+        self.set_status(201)
+
+
+class FakeUsersHandler(FakeHubHandler):
+    def post(self):
+        usernames = json.loads(self.request.body)["usernames"]
+        self._check_valid(usernames)
+        self.write(json.dumps([{"name": name} for name in usernames]))
+
+
+class FakeUserHandler(FakeHubHandler):
+    def get(self, name):
+        if name not in self.hub.users:
+            raise web.HTTPError(404)
+        self.write(json.dumps({"name": name}))
+
+    def post(self, name):
+        self._check_valid([name])
+        self.write(json.dumps({"name": name}))
+
+
+class HubAPITest(AsyncHTTPTestCase):
+    def get_app(self):
+        self.hub = FakeHub(users=["existing1", "existing2"])
+        kwargs = {"hub": self.hub}
+        return web.Application(
+            [
+                (r"/hub/api/users", FakeUsersHandler, kwargs),
+                (r"/hub/api/users/([^/]+)", FakeUserHandler, kwargs),
+            ]
+        )
+
+    def make_api(self, **kwargs):
+        hub_auth = SimpleNamespace(api_token="test", api_url=self.get_url("/hub/api"))
+        kwargs.setdefault("retry_delay", 0.01)
+        return HubAPI(hub_auth, client=self.http_client, **kwargs)
+
+    def user_creations(self):
+        return [path for method, path, _ in self.hub.requests if method == "POST"]
+
+    @gen_test
+    async def test_creates_users_in_chunks(self):
+        api = self.make_api(create_chunk_size=100)
+        usernames = [f"user{i}" for i in range(250)]
+        report = await api.create_missing_users(usernames)
+        self.assertEqual(sorted(report["created"]), sorted(usernames))
+        self.assertEqual(report["existing"], [])
+        self.assertEqual(report["failed"], {})
+        self.assertEqual(self.user_creations(), ["/hub/api/users"] * 3)
+        self.assertTrue(self.hub.users.issuperset(usernames))
+
+    @gen_test
+    async def test_retries_with_backoff(self):
+        api = self.make_api(retry_delay=0.05, max_retries=3)
+        self.hub.failures = [(503, {}), (502, {})]
+        report = await api.create_missing_users(["new1", "new2"])
+        self.assertEqual(sorted(report["created"]), ["new1", "new2"])
+        times = [t for _, _, t in self.hub.requests]
+        self.assertEqual(len(times), 3)
+        self.assertGreaterEqual(times[1] - times[0], 0.05)
+        self.assertGreaterEqual(times[2] - times[1], 0.1)
+
+    @gen_test
+    async def test_retry_after_is_respected(self):
+        api = self.make_api(retry_delay=0.01)
+        self.hub.failures = [(429, {"Retry-After": "1"})]
+        report = await api.create_missing_users(["new1"])
+        self.assertEqual(report["created"], ["new1"])
+        times = [t for _, _, t in self.hub.requests]
+        self.assertGreaterEqual(times[1] - times[0], 1)
+
+    @gen_test
+    async def test_existing_users_in_a_chunk(self):
+        api = self.make_api(create_chunk_size=10)
+        report = await api.create_missing_users(["new1", "existing1", "new2"])
+        self.assertEqual(sorted(report["created"]), ["new1", "new2"])
+        self.assertEqual(report["existing"], ["existing1"])
+        self.assertEqual(report["failed"], {})
+        # The rejected chunk is retried user by user
+        self.assertEqual(len(self.user_creations()), 4)
+        self.assertEqual(await api.find_existing_users(["existing1"]), {"existing1"})
+
+    @gen_test
+    async def test_invalid_username_in_a_chunk(self):
+        api = self.make_api(create_chunk_size=10)
+        report = await api.create_missing_users(["new1", "not-valid", "new2"])
+        self.assertEqual(sorted(report["created"]), ["new1", "new2"])
+        self.assertEqual(list(report["failed"]), ["not-valid"])
+
+    @gen_test
+    async def test_unavailable_hub_fails_every_user(self):
+        api = self.make_api(create_chunk_size=10, max_retries=2)
+        self.hub.always_fail = 503
+        usernames = [f"user{i}" for i in range(25)]
+        report = await api.create_missing_users(usernames)
+        self.assertEqual(report["created"], [])
+        self.assertEqual(report["existing"], [])
+        self.assertEqual(sorted(report["failed"]), sorted(usernames))
+        self.assertTrue(all("503" in reason for reason in report["failed"].values()))
+        # One request per chunk and retry, no fallback to single users
+        self.assertEqual(len(self.user_creations()), 3 * 3)
+
+    @gen_test
+    async def test_finds_users_without_listing_all_users(self):
+        api = self.make_api(page_size=2, max_concurrency=3)
+        usernames = ["existing1", "existing2", "new1", "new2", "new3"]
+        self.assertEqual(await api.find_existing_users(usernames), {"existing1", "existing2"})
+        lookups = sorted(path for method, path, _ in self.hub.requests if method == "GET")
+        self.assertEqual(lookups, sorted(f"/hub/api/users/{name}" for name in usernames))
+        # Users that were found are answered from the cache
+        self.hub.requests.clear()
+        self.assertEqual(await api.find_existing_users(["existing1"]), {"existing1"})
+        self.assertEqual(self.hub.requests, [])
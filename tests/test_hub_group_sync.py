@@ -0,0 +1,145 @@
+"""HubGroupSync replaying a change log to an in-memory stand-in for HubAPI."""
+
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import unittest
+
+from tornado.httpclient import HTTPClientError
+
+from e2x_course_service.change_log import ChangeLog
+from e2x_course_service.hub_group_sync import HubGroupSync
+
+GROUP_NAMES = {"student": "nbgrader-{course_id}-{semester}"}
+
+
+class FakeHubAPI:
+    max_concurrency = 4
+
+    def __init__(self, users=("alice", "bob"), fail_times=0, group_errors=None):
+        self.users = set(users)
+        self.groups = {}
+        self.fail_times = fail_times
+        # Group name -> status code of the Hub's answer to every change of the group
+        self.group_errors = group_errors or {}
+
+    async def find_existing_users(self, usernames):
+        if self.fail_times:
+            self.fail_times -= 1
+            raise RuntimeError("unexpected answer from the Hub")
+        return set(usernames) & self.users
+
+    async def create_missing_users(self, usernames):
+        self.users.update(usernames)
+        return {"created": list(usernames), "existing": [], "failed": {}}
+
+    def _check_group(self, group, usernames):
+        if group in self.group_errors:
+            raise HTTPClientError(self.group_errors[group])
+        assert self.users.issuperset(usernames)
+
+    async def add_group_users(self, group, usernames):
+        self._check_group(group, usernames)
+        self.groups.setdefault(group, set()).update(usernames)
+
+    async def remove_group_users(self, group, usernames):
+        self._check_group(group, usernames)
+        self.groups.setdefault(group, set()).difference_update(usernames)
+
+
+class HubGroupSyncTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.change_log = ChangeLog(os.path.join(self.tmp.name, "changes.jsonl"))
+        self.logger = logging.getLogger("test_hub_group_sync")
+
+    def write_lines(self, *lines):
+        with open(self.change_log.path, "a", encoding="utf-8") as f:
+            for line in lines:
+                f.write((line if isinstance(line, str) else json.dumps(line)) + "\n")
+
+    def make_sync(self, hub_api, group_names=GROUP_NAMES, **kwargs):
+        return HubGroupSync(
+            self.change_log, hub_api, group_names, self.logger, interval=0.01, **kwargs
+        )
+
+    def test_malformed_entries_are_skipped(self):
+        self.change_log.append(("c1", "ws24", "student"), ["alice"], [])
+        self.write_lines(
+            {"action": "add", "course_id": "c1", "semester": "ws24", "role": "student"},
+            {"action": "rename", "user": "x", "course_id": "c1", "semester": "ws24"},
+            "[1, 2]",
+            "not json",
+        )
+        self.change_log.append(("c1", "ws24", "student"), ["bob"], [])
+        hub_api = FakeHubAPI()
+        sync = self.make_sync(hub_api)
+        self.assertEqual(asyncio.run(sync.sync_once()), 5)
+        self.assertEqual(hub_api.groups, {"nbgrader-c1-ws24": {"alice", "bob"}})
+        self.assertEqual(sync.load_cursor(), os.path.getsize(self.change_log.path))
+
+    def test_invalid_group_names_are_rejected(self):
+        with self.assertRaises(ValueError):
+            self.make_sync(FakeHubAPI(), {"student": "nbgrader-{course}-{semester}"})
+        # A role without a group is not synced
+        self.make_sync(FakeHubAPI(), {"student": "nbgrader-{course_id}", "grader": ""})
+
+    def test_run_continues_after_unexpected_errors(self):
+        self.change_log.append(("c1", "ws24", "student"), ["alice"], [])
+        hub_api = FakeHubAPI(fail_times=2)
+        sync = self.make_sync(hub_api)
+
+        async def run():
+            sync.start()
+            for _ in range(100):
+                if hub_api.groups:
+                    break
+                await asyncio.sleep(0.01)
+            sync.stop()
+
+        with self.assertLogs(self.logger, "ERROR"):
+            asyncio.run(run())
+        self.assertEqual(hub_api.groups, {"nbgrader-c1-ws24": {"alice"}})
+
+    def test_missing_users_are_skipped(self):
+        self.change_log.append(("c1", "ws24", "student"), ["alice", "carol"], ["dave"])
+        hub_api = FakeHubAPI()
+        sync = self.make_sync(hub_api)
+        with self.assertLogs(self.logger, "WARNING"):
+            asyncio.run(sync.sync_once())
+        self.assertEqual(hub_api.groups, {"nbgrader-c1-ws24": {"alice"}})
+        self.assertEqual(hub_api.users, {"alice", "bob"})
+
+    def test_missing_users_are_created_if_enabled(self):
+        self.change_log.append(("c1", "ws24", "student"), ["alice", "carol"], [])
+        hub_api = FakeHubAPI()
+        sync = self.make_sync(hub_api, create_users=True)
+        asyncio.run(sync.sync_once())
+        self.assertEqual(hub_api.groups, {"nbgrader-c1-ws24": {"alice", "carol"}})
+
+    def test_rejected_groups_are_skipped(self):
+        self.change_log.append(("c1", "ws24", "student"), ["alice"], [])
+        self.change_log.append(("c2", "ws24", "student"), ["bob"], [])
+        hub_api = FakeHubAPI(group_errors={"nbgrader-c1-ws24": 400})
+        sync = self.make_sync(hub_api)
+        with self.assertLogs(self.logger, "ERROR"):
+            self.assertEqual(asyncio.run(sync.sync_once()), 2)
+        self.assertEqual(hub_api.groups, {"nbgrader-c2-ws24": {"bob"}})
+        self.assertEqual(sync.load_cursor(), os.path.getsize(self.change_log.path))
+
+    def test_unavailable_hub_retries_the_batch(self):
+        self.change_log.append(("c1", "ws24", "student"), ["alice"], [])
+        self.change_log.append(("c2", "ws24", "student"), ["bob"], [])
+        hub_api = FakeHubAPI(group_errors={"nbgrader-c1-ws24": 503})
+        sync = self.make_sync(hub_api)
+        with self.assertRaises(HTTPClientError):
+            asyncio.run(sync.sync_once())
+        self.assertEqual(sync.load_cursor(), 0)
+        hub_api.group_errors.clear()
+        self.assertEqual(asyncio.run(sync.sync_once()), 2)
+        self.assertEqual(
+            hub_api.groups, {"nbgrader-c1-ws24": {"alice"}, "nbgrader-c2-ws24": {"bob"}}
+        )
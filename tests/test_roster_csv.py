@@ -0,0 +1,150 @@
+"""Streaming roster CSV uploads and downloads."""
+
+import json
+import logging
+import os
+import tempfile
+import unittest
+
+from jupyterhub.services.auth import HubOAuth
+from tornado import web
+from tornado.testing import AsyncHTTPTestCase
+
+from e2x_course_service import roster_io
+from e2x_course_service.course_manager import AsyncCourseManager, CourseManager
+from e2x_course_service.handlers.apihandlers import RosterCSVHandler
+from e2x_course_service.roster_io import UsernameStreamParser
+
+TOKENS = {"grader-token": "g1", "student-token": "s1"}
+
+
+class StubHubOAuth(HubOAuth):
+    """Identifies the tokens in TOKENS without asking a Hub."""
+
+    def user_for_token(self, token, use_cache=True, session_id="", *, sync=True):
+        name = TOKENS.get(token)
+        model = {"name": name, "kind": "user", "scopes": []} if name else None
+
+        async def result():
+            return model
+
+        return model if sync else result()
+
+
+class UsernameStreamParserTest(unittest.TestCase):
+    def parse(self, *chunks):
+        parser = UsernameStreamParser()
+        rows = []
+        for chunk in chunks:
+            rows.extend(parser.feed(chunk))
+        return rows + parser.close()
+
+    def test_chunks_split_rows_and_characters(self):
+        data = "Name,Username\nJürgen,jürgen\n,\nBob, bob \nÉmile,émile".encode()
+        expected = [(2, "jürgen"), (4, "bob"), (5, "émile")]
+        self.assertEqual(self.parse(data), expected)
+        # Every split, including those inside a row and inside a multi-byte character
+        for i in range(1, len(data)):
+            self.assertEqual(self.parse(data[:i], data[i:]), expected, i)
+        self.assertEqual(self.parse(*[data[i : i + 1] for i in range(len(data))]), expected)
+
+    def test_crlf_and_bom(self):
+        data = "\ufeffUsername,Email\r\nalice,a@x\r\nbob,b@x\r\n".encode()
+        self.assertEqual(self.parse(data[:20], data[20:]), [(2, "alice"), (3, "bob")])
+
+    def test_single_column_without_header(self):
+        self.assertEqual(self.parse(b"alice\r\n\r\nbob"), [(1, "alice"), (3, "bob")])
+        self.assertEqual(self.parse(b"Username\nalice\n"), [(2, "alice")])
+
+    def test_missing_username_column(self):
+        with self.assertRaisesRegex(ValueError, "no Username column"):
+            self.parse(b"Name,Email\nAlice,a@x\n")
+        with self.assertRaisesRegex(ValueError, "no Username column"):
+            self.parse(b"Name,Email")
+
+
+class RosterCSVTestHandler(RosterCSVHandler):
+    hub_auth_class = StubHubOAuth
+    allow_all = True
+    received = 0
+
+    def data_received(self, chunk):
+        RosterCSVTestHandler.received += len(chunk)
+        return super().data_received(chunk)
+
+
+class RosterCSVHandlerTest(AsyncHTTPTestCase):
+    def get_app(self):
+        # Other test modules use their own HubOAuth stub as the singleton
+        HubOAuth.clear_instance()
+        StubHubOAuth.instance(
+            api_token="service",
+            api_url="http://127.0.0.1:1/hub/api",
+            oauth_client_id="service-course",
+        )
+        RosterCSVTestHandler.received = 0
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, "c1", "student", "c1-ws24.csv")
+        for kind, usernames in (("grader", ["g1"]), ("student", ["s1"])):
+            path = os.path.join(self.tmp.name, "c1", kind, "c1-ws24.csv")
+            os.makedirs(os.path.dirname(path))
+            roster_io.write_usernames(path, usernames)
+        logger = logging.getLogger("test_roster_csv")
+        manager = CourseManager(self.tmp.name, logger, summary_path="")
+        return web.Application(
+            [(r"/csv", RosterCSVTestHandler)],
+            course_manager=AsyncCourseManager(manager, max_workers=0),
+            logger=logger,
+            roster_upload_max_size=1024 * 1024,
+        )
+
+    def upload(self, body, token="grader-token", kind="student"):
+        return self.fetch(
+            f"/csv?course_id=c1&semester=ws24&kind={kind}",
+            method="PUT",
+            body=body,
+            headers={"Authorization": f"token {token}"},
+        )
+
+    def test_upload(self):
+        body = "Name,Username\r\nAlice,alice\r\nBob,bob\r\nAgain,alice\r\nBad,a b\r\nS,s1\r\n"
+        response = self.upload(body.encode())
+        self.assertEqual(response.code, 200)
+        self.assertEqual(
+            json.loads(response.body),
+            {
+                "status": "partial",
+                "rows": 5,
+                "unique": 3,
+                "added": ["alice", "bob"],
+                "invalid": [{"line": 5, "username": "a b"}],
+                "num_invalid": 1,
+            },
+        )
+        self.assertEqual(roster_io.read_usernames(self.path), ["s1", "alice", "bob"])
+
+    def test_upload_without_username_column(self):
+        response = self.upload(b"Name,Email\nAlice,a@x\n")
+        self.assertEqual(response.code, 400)
+        self.assertIn("no Username column", json.loads(response.body)["message"])
+        self.assertEqual(roster_io.read_usernames(self.path), ["s1"])
+
+    def test_upload_by_non_grader_is_rejected_before_the_body_is_read(self):
+        response = self.upload(b"Username\n" + b"x" * 64 * 1024 + b"\n", token="student-token")
+        self.assertEqual(response.code, 403)
+        self.assertEqual(RosterCSVTestHandler.received, 0)
+        self.assertEqual(roster_io.read_usernames(self.path), ["s1"])
+
+    def test_upload_with_invalid_kind(self):
+        self.assertEqual(self.upload(b"alice\n", kind="admin").code, 400)
+
+    def test_download(self):
+        self.upload(b"alice\nbob\n")
+        response = self.fetch(
+            "/csv?course_id=c1&semester=ws24&kind=student",
+            headers={"Authorization": "token grader-token"},
+        )
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.body, b"Username\ns1\nalice\nbob\n")
+        self.assertIn('filename="c1-ws24-student.csv"', response.headers["Content-Disposition"])
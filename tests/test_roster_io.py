@@ -0,0 +1,88 @@
+"""Reading and the atomic write paths of roster CSV files."""
+
+import os
+import tempfile
+import unittest
+
+from e2x_course_service import roster_io
+
+
+class RosterIOTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, "c1-ws24.csv")
+
+    def write(self, content: str):
+        with open(self.path, "w", newline="", encoding="utf-8") as f:
+            f.write(content)
+
+    def read(self) -> str:
+        with open(self.path, newline="", encoding="utf-8") as f:
+            return f.read()
+
+    def assertNoTemporaryFiles(self):
+        self.assertEqual(os.listdir(self.tmp.name), ["c1-ws24.csv"])
+
+    def test_read_usernames(self):
+        self.write("\ufeffName, Username ,Email\r\nAlice,alice,a@x\r\nNo user,,\r\nBob, bob \r\n")
+        self.assertEqual(roster_io.read_usernames(self.path), ["alice", "bob"])
+
+    def test_read_without_username_column(self):
+        self.write("Name,Email\nAlice,a@x\n")
+        with self.assertRaisesRegex(ValueError, "no Username column"):
+            roster_io.read_usernames(self.path)
+
+    def test_read_empty_file(self):
+        self.write("")
+        self.assertEqual(roster_io.read_usernames(self.path), [])
+
+    def test_append_keeps_columns_and_bom(self):
+        self.write("\ufeffName,Username\nAlice,alice\n")
+        roster_io.append_usernames(self.path, ["bob", "carol"])
+        self.assertEqual(self.read(), "\ufeffName,Username\nAlice,alice\n,bob\n,carol\n")
+        self.assertNoTemporaryFiles()
+
+    def test_append_without_trailing_newline(self):
+        self.write("Username,Name\r\nalice,Alice")
+        roster_io.append_usernames(self.path, ["bob"])
+        self.assertEqual(self.read(), "Username,Name\r\nalice,Alice\nbob,\n")
+        self.assertEqual(roster_io.read_usernames(self.path), ["alice", "bob"])
+
+    def test_append_to_empty_file(self):
+        self.write("")
+        roster_io.append_usernames(self.path, ["alice"])
+        self.assertEqual(self.read(), "Username\nalice\n")
+
+    def test_append_keeps_file_mode(self):
+        self.write("Username\nalice\n")
+        os.chmod(self.path, 0o640)
+        roster_io.append_usernames(self.path, ["bob"])
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o640)
+
+    def test_rewrite_keeps_columns_and_bom(self):
+        self.write('\ufeffName,Username\n"Doe, Alice",alice\nBob,bob\nCarol,carol')
+        removed = roster_io.rewrite_roster(self.path, {"bob", "dave"}, ["erin"])
+        self.assertEqual(removed, ["bob"])
+        self.assertEqual(
+            self.read(), '\ufeffName,Username\n"Doe, Alice",alice\nCarol,carol\n,erin\n'
+        )
+        self.assertNoTemporaryFiles()
+
+    def test_remove_usernames(self):
+        self.write("Username\nalice\n bob \ncarol\n")
+        self.assertEqual(roster_io.remove_usernames(self.path, {"bob"}), ["bob"])
+        self.assertEqual(roster_io.read_usernames(self.path), ["alice", "carol"])
+
+    def test_failed_write_leaves_roster_unchanged(self):
+        self.write("Name\nAlice\n")
+        with self.assertRaises(ValueError):
+            roster_io.rewrite_roster(self.path, {"alice"}, ["bob"])
+        with self.assertRaises(ValueError):
+            roster_io.append_usernames(self.path, ["bob"])
+        self.assertEqual(self.read(), "Name\nAlice\n")
+        self.assertNoTemporaryFiles()
+
+    def test_write_usernames(self):
+        roster_io.write_usernames(self.path, ["alice", "bob"])
+        self.assertEqual(self.read(), "Username\nalice\nbob\n")
@@ -0,0 +1,177 @@
+"""The SQLite roster store and copying rosters between stores."""
+
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from e2x_course_service import roster_io
+from e2x_course_service.course_manager import CourseManager
+from e2x_course_service.roster_store import CSVRosterStore, SQLiteRosterStore, sync_stores
+from e2x_course_service.roster_sync import RosterSyncApp
+
+STUDENTS = ("c1", "ws24", "student")
+GRADERS = ("c1", "ws24", "grader")
+
+
+class StoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.root = self.tmp.name
+        self.db_path = os.path.join(self.root, "rosters.sqlite")
+        self.db = SQLiteRosterStore(self.db_path)
+        self.addCleanup(self.db.close)
+        self.csv = CSVRosterStore(self.root)
+
+
+class SQLiteRosterStoreTest(StoreTestCase):
+    def test_read_and_write(self):
+        self.db.replace(STUDENTS, ["alice", "bob"])
+        with self.db.lock(STUDENTS):
+            self.db.write(STUDENTS, ["carol", "dave"], {"alice"})
+        self.assertEqual(self.db.read(STUDENTS), ["bob", "carol", "dave"])
+        self.assertIsNone(self.db.revision(GRADERS))
+        with self.assertRaises(FileNotFoundError):
+            self.db.read(GRADERS)
+
+    def test_writes_bump_revision_and_generation(self):
+        generation = self.db.generation()
+        self.db.replace(STUDENTS, ["alice"])
+        self.db.replace(GRADERS, ["g1"])
+        revision = self.db.revision(STUDENTS)
+        self.db.write(STUDENTS, ["bob"], set())
+        self.assertNotEqual(self.db.revision(STUDENTS), revision)
+        self.assertEqual(self.db.revisions()[GRADERS], self.db.revision(GRADERS))
+        self.assertEqual(self.db.generation(), generation + 3)
+        self.db.delete(STUDENTS)
+        self.assertEqual(self.db.generation(), generation + 4)
+        self.assertEqual(set(self.db.revisions()), {GRADERS})
+
+    def test_generation_is_shared_between_connections(self):
+        other = SQLiteRosterStore(self.db_path)
+        self.addCleanup(other.close)
+        generation = other.generation()
+        self.db.replace(STUDENTS, ["alice"])
+        self.assertNotEqual(other.generation(), generation)
+        self.assertEqual(other.read(STUDENTS), ["alice"])
+
+    def test_nested_transactions_commit_once(self):
+        with self.db._transaction():
+            self.db.replace(STUDENTS, ["alice"])
+            self.db.write(STUDENTS, ["bob"], set())
+            # Not visible to other connections before the outer transaction commits
+            other = sqlite3.connect(self.db_path)
+            self.addCleanup(other.close)
+            self.assertEqual(other.execute("SELECT COUNT(*) FROM members").fetchone()[0], 0)
+        self.assertEqual(other.execute("SELECT COUNT(*) FROM members").fetchone()[0], 2)
+
+    def test_failed_transaction_is_rolled_back(self):
+        self.db.replace(STUDENTS, ["alice"])
+        revision = self.db.revision(STUDENTS)
+        with self.assertRaises(RuntimeError):
+            with self.db.lock(STUDENTS):
+                self.db.write(STUDENTS, ["bob"], {"alice"})
+                raise RuntimeError("failed while holding the lock")
+        self.assertEqual(self.db.read(STUDENTS), ["alice"])
+        self.assertEqual(self.db.revision(STUDENTS), revision)
+        # The connection can start a new transaction afterwards
+        self.db.write(STUDENTS, ["carol"], set())
+        self.assertEqual(self.db.read(STUDENTS), ["alice", "carol"])
+
+    def test_connections_per_thread(self):
+        self.db.replace(STUDENTS, ["alice"])
+        results = []
+        thread = threading.Thread(target=lambda: results.append(self.db.read(STUDENTS)))
+        thread.start()
+        thread.join()
+        self.assertEqual(results, [["alice"]])
+        self.assertEqual(len(self.db._connections), 2)
+        self.db.close()
+        self.assertEqual(self.db._connections, [])
+
+
+class SyncStoresTest(StoreTestCase):
+    def write_csv(self, key, usernames):
+        os.makedirs(os.path.dirname(self.csv.path(key)), exist_ok=True)
+        roster_io.write_usernames(self.csv.path(key), usernames)
+
+    def test_import_and_export(self):
+        self.write_csv(STUDENTS, ["alice", "bob"])
+        self.write_csv(GRADERS, ["g1"])
+        self.assertEqual(
+            sync_stores(self.csv, self.db), {"copied": 2, "unchanged": 0, "deleted": 0}
+        )
+        self.assertEqual(self.db.read(STUDENTS), ["alice", "bob"])
+        revision = self.db.revision(STUDENTS)
+        self.assertEqual(
+            sync_stores(self.csv, self.db), {"copied": 0, "unchanged": 2, "deleted": 0}
+        )
+        self.assertEqual(self.db.revision(STUDENTS), revision)
+
+        self.db.replace(STUDENTS, ["carol"])
+        self.db.replace(("c2", "ss25", "student"), ["dave"])
+        self.assertEqual(
+            sync_stores(self.db, self.csv), {"copied": 2, "unchanged": 1, "deleted": 0}
+        )
+        self.assertEqual(self.csv.read(STUDENTS), ["carol"])
+        self.assertEqual(self.csv.read(("c2", "ss25", "student")), ["dave"])
+
+    def test_prune(self):
+        self.write_csv(STUDENTS, ["alice"])
+        self.db.replace(STUDENTS, ["alice"])
+        self.db.replace(GRADERS, ["g1"])
+        self.assertEqual(sync_stores(self.csv, self.db)["deleted"], 0)
+        self.assertIn(GRADERS, self.db.revisions())
+        self.assertEqual(
+            sync_stores(self.csv, self.db, prune=True), {"copied": 0, "unchanged": 1, "deleted": 1}
+        )
+        self.assertEqual(set(self.db.revisions()), {STUDENTS})
+
+        self.write_csv(GRADERS, ["g1"])
+        self.assertEqual(sync_stores(self.db, self.csv, prune=True)["deleted"], 1)
+        self.assertFalse(os.path.exists(self.csv.path(GRADERS)))
+
+    def test_roster_sync_app(self):
+        self.write_csv(STUDENTS, ["alice"])
+        app = RosterSyncApp(course_base_path=self.root, direction="import")
+        app.start()
+        store = SQLiteRosterStore(self.db_path)
+        self.addCleanup(store.close)
+        self.assertEqual(store.read(STUDENTS), ["alice"])
+
+
+class CourseManagerOnSQLiteTest(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.db.replace(GRADERS, ["g1"])
+        self.db.replace(STUDENTS, ["alice", "bob"])
+        self.manager = CourseManager(
+            self.root, logging.getLogger("test_roster_store"), store=self.db, shared=True
+        )
+
+    def test_queries(self):
+        self.assertTrue(self.manager.is_grader_for_course("g1", "c1", "ws24"))
+        self.assertEqual(
+            self.manager.list_grader_courses_for_user("g1"),
+            [{"course_id": "c1", "semester": "ws24", "num_graders": 1, "num_students": 2}],
+        )
+        self.assertEqual(self.manager.get_courses_for_user("bob")["student"], {"c1": ["ws24"]})
+
+    def test_updates(self):
+        result = self.manager.update_course_members(
+            "c1", "ws24", {"alice": ["grader"], "carol": ["student"]}
+        )
+        self.assertEqual(result["student_changes"], {"add": ["carol"], "remove": ["alice"]})
+        self.assertEqual(result["grader_changes"], {"add": ["alice"], "remove": []})
+        self.assertEqual(self.db.read(STUDENTS), ["bob", "carol"])
+        self.assertTrue(self.manager.is_grader_for_course("alice", "c1", "ws24"))
+
+    def test_writes_of_other_processes_are_seen(self):
+        other = SQLiteRosterStore(self.db_path)
+        self.addCleanup(other.close)
+        other.write(GRADERS, [], {"g1"})
+        self.assertFalse(self.manager.is_grader_for_course("g1", "c1", "ws24"))
+        self.assertEqual(self.manager.list_grader_courses_for_user("g1"), [])
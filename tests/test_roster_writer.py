@@ -0,0 +1,105 @@
+"""RosterWriter serializing and coalescing concurrent changes to one roster."""
+
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from e2x_course_service.roster_store import RosterStore
+from e2x_course_service.roster_writer import RosterWriter
+
+KEY = ("c1", "ws24", "student")
+
+
+class MemoryStore(RosterStore):
+    """Keeps rosters in a dict and lets a test hold a write until ``release`` is set."""
+
+    def __init__(self, usernames):
+        self.rosters = {KEY: list(usernames)}
+        self.writes = []
+        self.writing = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+        self.error = None
+        self._lock = threading.Lock()
+
+    def lock(self, key):
+        return self._lock
+
+    def write(self, key, add, remove):
+        self.writes.append((list(add), set(remove)))
+        self.writing.set()
+        self.release.wait()
+        if self.error is not None:
+            raise self.error
+        self.rosters[key] = [u for u in self.rosters[key] if u not in remove] + list(add)
+
+
+class RosterWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.store = MemoryStore(["alice", "bob"])
+        self.written = []
+        self.writer = RosterWriter(
+            self.store,
+            lambda key: self.store.rosters[key],
+            lambda key, usernames, added, removed: self.written.append(
+                (list(usernames), added, removed)
+            ),
+        )
+        self.pool = ThreadPoolExecutor(max_workers=4)
+        self.addCleanup(self.pool.shutdown)
+
+    def wait_for_pending(self, count):
+        for _ in range(500):
+            if len(self.writer._pending.get(KEY, ())) == count:
+                return
+            time.sleep(0.01)
+        self.fail(f"{count} changes were not queued")
+
+    def test_single_change(self):
+        result = self.writer.submit(KEY, add=["carol", "alice"], remove=["bob"])
+        self.assertEqual(result, (["carol"], ["bob"]))
+        self.assertEqual(self.store.rosters[KEY], ["alice", "carol"])
+        self.assertEqual(self.written, [(["alice", "carol"], ["carol"], ["bob"])])
+
+    def test_change_without_effect_is_not_written(self):
+        self.assertEqual(self.writer.submit(KEY, add=["alice"], remove=["dave"]), ([], []))
+        self.assertEqual(self.store.writes, [])
+        self.assertEqual(self.written, [])
+
+    def test_queued_changes_are_written_together(self):
+        self.store.release.clear()
+        first = self.pool.submit(self.writer.submit, KEY, add=["a1"])
+        self.assertTrue(self.store.writing.wait(5))
+        queued = [
+            self.pool.submit(self.writer.submit, KEY, add=["b1", "b2"]),
+            self.pool.submit(self.writer.submit, KEY, remove=["b1", "alice"]),
+            self.pool.submit(self.writer.submit, KEY, add=["b2", "d1"]),
+        ]
+        self.wait_for_pending(3)
+        self.store.release.set()
+        self.assertEqual(first.result(5), (["a1"], []))
+        results = [future.result(5) for future in queued]
+        # The queued changes are applied in order, but reported one by one
+        self.assertEqual(
+            sorted(results),
+            sorted([(["b1", "b2"], []), ([], ["b1", "alice"]), (["d1"], [])]),
+        )
+        self.assertEqual(len(self.store.writes), 2)
+        self.assertEqual(self.store.writes[1], (["b2", "d1"], {"alice"}))
+        self.assertEqual(self.store.rosters[KEY], ["bob", "a1", "b2", "d1"])
+        self.assertEqual(self.written[-1], (["bob", "a1", "b2", "d1"], ["b2", "d1"], ["alice"]))
+
+    def test_failed_write_fails_every_queued_change(self):
+        self.store.error = OSError("disk full")
+        self.store.release.clear()
+        first = self.pool.submit(self.writer.submit, KEY, add=["a1"])
+        self.assertTrue(self.store.writing.wait(5))
+        queued = [self.pool.submit(self.writer.submit, KEY, add=[f"u{i}"]) for i in range(2)]
+        self.wait_for_pending(2)
+        self.store.release.set()
+        for future in [first, *queued]:
+            with self.assertRaises(OSError):
+                future.result(5)
+        self.assertEqual(self.store.rosters[KEY], ["alice", "bob"])
+        self.assertEqual(self.written, [])
@@ -63,10 +63,11 @@ const courseAPI = {
     return requests.get(urlJoin(window.APP_CONFIG.api_url, "courses"));
   },
   members: {
-    list: async (course_id, semester) => {
+    list: async (course_id, semester, query = {}) => {
       return requests.get(
         urlJoin(window.APP_CONFIG.api_url, "course_members"),
         {
+          ...query,
           course_id: course_id,
           semester: semester,
         },
@@ -93,6 +94,34 @@ const courseAPI = {
         },
       );
     },
+    upload: async (course_id, semester, kind, file, add_to_hub = false) => {
+      const params = new URLSearchParams({
+        course_id: course_id,
+        semester: semester,
+        kind: kind,
+        add_to_hub: add_to_hub,
+      });
+      const settings = {
+        ...baseSettings,
+        method: "PUT",
+        body: file,
+      };
+      const url = urlJoin(window.APP_CONFIG.api_url, "course_members", "csv");
+      const response = await fetch(url + "?" + params.toString(), settings);
+      return handleResponse(response);
+    },
+    downloadUrl: (course_id, semester, kind) => {
+      const params = new URLSearchParams({
+        course_id: course_id,
+        semester: semester,
+        kind: kind,
+      });
+      return (
+        urlJoin(window.APP_CONFIG.api_url, "course_members", "csv") +
+        "?" +
+        params.toString()
+      );
+    },
   },
 };
 
@@ -5,9 +5,22 @@ import {
   requestConfirmation,
   requestTextConfirmation,
   showEditUserModal,
+  showRosterCSVModal,
   showSuccessModal,
 } from "./modals.js";
 
+async function showAddResult(result, successMessage) {
+  const failed = Object.keys(result.hub_users?.failed || {});
+  if (failed.length === 0) {
+    await showSuccessModal(successMessage);
+    return;
+  }
+  await showErrorModal(
+    `${successMessage}<br>Could not create these users in JupyterHub: ${failed.join(", ")}`,
+    "Partially successful",
+  );
+}
+
 export async function handleAddStudents(courseId, semester, grid) {
   const usernames = await showAddUsersModal(
     "Add Students",
@@ -21,7 +34,7 @@ export async function handleAddStudents(courseId, semester, grid) {
   }
 
   try {
-    await API.courses.members.update(
+    const result = await API.courses.members.update(
       courseId,
       semester,
       Object.fromEntries(usernames.map((u) => [u, ["student"]])),
@@ -29,7 +42,8 @@ export async function handleAddStudents(courseId, semester, grid) {
     );
     console.log("Refreshing table", grid);
     grid.forceRender();
-    await showSuccessModal(
+    await showAddResult(
+      result,
       `Successfully added ${usernames.length} students to the course.`,
     );
   } catch (error) {
@@ -51,14 +65,15 @@ export async function handleAddGraders(courseId, semester, grid) {
   }
 
   try {
-    await API.courses.members.update(
+    const result = await API.courses.members.update(
       courseId,
       semester,
       Object.fromEntries(usernames.map((u) => [u, ["grader"]])),
       true,
     );
     grid.forceRender();
-    await showSuccessModal(
+    await showAddResult(
+      result,
       `Successfully added ${usernames.length} graders to the course.`,
     );
   } catch (error) {
@@ -67,6 +82,42 @@ export async function handleAddGraders(courseId, semester, grid) {
   }
 }
 
+export async function handleUploadRoster(courseId, semester, grid) {
+  const choice = await showRosterCSVModal("Upload CSV", "Upload", true);
+  if (!choice) return;
+
+  try {
+    const result = await API.courses.members.upload(
+      courseId,
+      semester,
+      choice.kind,
+      choice.file,
+      true,
+    );
+    grid.forceRender();
+    let message = `Added ${result.added.length} of ${result.unique} usernames in ${choice.file.name}.`;
+    if (result.num_invalid > 0) {
+      const lines = result.invalid.map((row) => row.line).join(", ");
+      message += `<br>Skipped ${result.num_invalid} invalid rows (lines ${lines}).`;
+    }
+    await showAddResult(result, message);
+  } catch (error) {
+    console.error("Error uploading roster:", error);
+    await showErrorModal("Error uploading roster: " + error.message);
+  }
+}
+
+export async function handleDownloadRoster(courseId, semester) {
+  const choice = await showRosterCSVModal("Download CSV", "Download");
+  if (!choice) return;
+  // Served as an attachment, so the page stays open
+  window.location.href = API.courses.members.downloadUrl(
+    courseId,
+    semester,
+    choice.kind,
+  );
+}
+
 export async function handleDeleteUser(username, courseId, semester, grid) {
   try {
     let confirmed = false;
@@ -125,18 +176,25 @@ export async function handleEditUser(
   }
 }
 
-export async function handleLoadCourseMembers(courseId, semester) {
+export async function handleLoadCourseMembers(
+  courseId,
+  semester,
+  query = {},
+) {
   try {
-    const data = await API.courses.members.list(courseId, semester);
-    return Object.entries(data.members).map(([username, roles]) => ({
-      username: username,
-      student: roles && roles.includes("student"),
-      grader: roles && roles.includes("grader"),
-      edit: null, // Placeholder for edit column
-    }));
+    const data = await API.courses.members.list(courseId, semester, query);
+    return {
+      data: Object.entries(data.members).map(([username, roles]) => ({
+        username: username,
+        student: roles && roles.includes("student"),
+        grader: roles && roles.includes("grader"),
+        edit: null, // Placeholder for edit column
+      })),
+      total: data.filtered,
+    };
   } catch (error) {
     await showErrorModal("Error fetching course members: " + error);
-    return [];
+    return { data: [], total: 0 };
   }
 }
 
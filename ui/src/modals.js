@@ -134,3 +134,39 @@ export function showEditUserModal(username, isStudent, isGrader) {
     },
   }).then((result) => (result.isConfirmed ? result.value : null));
 }
+
+/** =============================
+ * Roster CSV Modal
+ * Asks for a role and, with withFile, a CSV file to upload
+ * Returns { kind, file } or null if cancelled
+ * ============================== */
+export function showRosterCSVModal(title, confirmText, withFile = false) {
+  const fileHtml = withFile
+    ? `<input type="file" id="swal-roster-file" class="swal2-file" accept=".csv,.txt,text/csv,text/plain">`
+    : "";
+  return Swal.fire({
+    title,
+    html: `
+      <label><input type="radio" name="swal-roster-kind" value="student" checked> Students</label>
+      <label style="margin-left: 10px"><input type="radio" name="swal-roster-kind" value="grader"> Graders</label>
+      ${fileHtml}
+    `,
+    showCancelButton: true,
+    confirmButtonText: confirmText,
+    cancelButtonText: "Cancel",
+    animation: false,
+    preConfirm: () => {
+      const popup = Swal.getPopup();
+      const kind = popup.querySelector(
+        "input[name='swal-roster-kind']:checked",
+      ).value;
+      if (!withFile) return { kind: kind, file: null };
+      const file = popup.querySelector("#swal-roster-file").files[0];
+      if (!file) {
+        Swal.showValidationMessage("Please choose a CSV file.");
+        return false;
+      }
+      return { kind: kind, file: file };
+    },
+  }).then((result) => (result.isConfirmed ? result.value : null));
+}
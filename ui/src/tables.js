@@ -5,9 +5,11 @@ import {
   handleAddGraders,
   handleAddStudents,
   handleDeleteUser,
+  handleDownloadRoster,
   handleEditUser,
   handleLoadCourseMembers,
   handleLoadCourses,
+  handleUploadRoster,
 } from "./handlers.js";
 import { templates } from "./templates.js";
 
@@ -38,6 +40,13 @@ function createAddButtons(course_id, semester, grid) {
   container.append(
     createButton("Add Students", "btn add-student-btn", handleAddStudents),
     createButton("Add Graders", "btn add-grader-btn", handleAddGraders, true),
+    createButton("Upload CSV", "btn upload-csv-btn", handleUploadRoster, true),
+    createButton(
+      "Download CSV",
+      "btn download-csv-btn",
+      handleDownloadRoster,
+      true,
+    ),
   );
 
   return container;
@@ -110,8 +119,28 @@ function initCourseMemberTable(elementId, course_id, semester) {
         },
       },
     ],
-    ...baseTableConfig,
-    data: () => handleLoadCourseMembers(course_id, semester),
+    // Paging and search run on the server, the query is built up in the url
+    pagination: {
+      ...baseTableConfig.pagination,
+      server: {
+        url: (prev, page, limit) =>
+          `${prev}&offset=${page * limit}&limit=${limit}`,
+      },
+    },
+    search: {
+      server: {
+        url: (prev, keyword) => `${prev}&search=${encodeURIComponent(keyword)}`,
+      },
+    },
+    server: {
+      url: "?",
+      data: (opts) =>
+        handleLoadCourseMembers(
+          course_id,
+          semester,
+          Object.fromEntries(new URLSearchParams(opts.url.split("?")[1])),
+        ),
+    },
   });
 
   // Add buttons container above the table